@@ -0,0 +1,176 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+from bson import Binary
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+# Load the environment variables
+load_dotenv()
+
+# Embeddings kept in memory when no collection is set, the least recently used are evicted
+EMBEDDING_STORE_MEMORY_SIZE = int(os.getenv("EMBEDDING_STORE_MEMORY_SIZE", "10000"))
+
+
+class EmbeddingStore:
+    """
+    Persistent cache of embeddings keyed by content hash, model name and backend.
+
+    Texts are keyed by their normalized content and images by their bytes, so the
+    same image found under several URLs, or the same review seen by the seed
+    ingester and the watcher, is only encoded once. The image URLs are kept with
+    the embedding, so known URLs do not need to be downloaded again.
+
+    The backend is part of the key, as the quantized backend gives slightly
+    different embeddings than the full precision one. Without a collection, the
+    last `memory_size` embeddings are only cached for the current process.
+    """
+
+    def __init__(
+        self,
+        collection,
+        model_name: str,
+        backend: str,
+        memory_size: int = EMBEDDING_STORE_MEMORY_SIZE,
+    ):
+        self.collection = collection
+        self.model_name = model_name
+        self.backend = backend
+        self.model = f"{model_name}:{backend}"
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.url_hits = 0
+
+    def text_key(self, text: str):
+        # The CLIP tokenizer lowercases and collapses whitespace
+        text = " ".join(text.lower().split())
+        return self._key("text", text.encode())
+
+    def image_key(self, content: bytes):
+        return self._key("image", content)
+
+    def _key(self, kind: str, content: bytes):
+        digest = hashlib.sha256(content).hexdigest()
+        return f"{self.model}:{kind}:{digest}"
+
+    def get_many(self, keys) -> dict:
+        """
+        Get the stored embeddings of the keys.
+        """
+        keys = list(keys)
+        if self.collection is None:
+            found = {}
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key].tolist()
+            return found
+
+        docs = self.collection.find({"_id": {"$in": keys}}, {"embedding": 1})
+        return {doc["_id"]: self._decode(doc["embedding"]) for doc in docs}
+
+    def get_by_urls(self, urls) -> dict:
+        """
+        Get the stored image embeddings of the URLs, by URL.
+        """
+        urls = set(urls)
+        if self.collection is None or not urls:
+            return {}
+
+        found = {}
+        docs = self.collection.find(
+            {"urls": {"$in": list(urls)}, "model": self.model},
+            {"embedding": 1, "urls": 1},
+        )
+        for doc in docs:
+            for url in urls.intersection(doc["urls"]):
+                found[url] = self._decode(doc["embedding"])
+        self.url_hits += len(found)
+        return found
+
+    def put_many(self, embeddings: dict, urls: dict | None = None):
+        """
+        Store the embeddings by key, and the image URLs each key was found at.
+        """
+        urls = urls or {}
+        if self.collection is None:
+            # Kept as float32 arrays, a fraction of the size of lists of floats
+            for key, embedding in embeddings.items():
+                self.memory[key] = np.asarray(embedding, dtype=np.float32)
+                self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+            return
+
+        operations = []
+        for key in embeddings.keys() | urls.keys():
+            update = {"$addToSet": {"urls": {"$each": urls.get(key, [])}}}
+            if key in embeddings:
+                update["$set"] = {
+                    "model": self.model,
+                    "embedding": self._encode(embeddings[key]),
+                }
+            operations.append(UpdateOne({"_id": key}, update, upsert=True))
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def encode(self, keys: list, items: list, encode_batch, urls: list | None = None):
+        """
+        Get the embeddings of the items, encoding only the contents not stored yet.
+
+        `encode_batch` encodes a list of distinct items into a list of embeddings, with
+        None for an item that cannot be encoded. Those are not stored and their
+        embedding is returned as None.
+        """
+        found = self.get_many(set(keys))
+
+        # Encode every missing content once
+        missing = {}
+        for key, item in zip(keys, items):
+            if key not in found:
+                missing.setdefault(key, item)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        encoded = {}
+        if missing:
+            embeddings = encode_batch(list(missing.values()))
+            encoded = {
+                key: embedding
+                for key, embedding in zip(missing, embeddings)
+                if embedding is not None
+            }
+        found.update(encoded)
+
+        # Store the new embeddings, and the new URLs of the stored images
+        key_urls = {}
+        for key, url in zip(keys, urls or []):
+            key_urls.setdefault(key, []).append(url)
+        self.put_many(encoded, key_urls)
+
+        return [found.get(key) for key in keys]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "url_hits": self.url_hits}
+
+    @staticmethod
+    def _encode(embedding):
+        return Binary(np.asarray(embedding, dtype=np.float32).tobytes())
+
+    @staticmethod
+    def _decode(data):
+        return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+def create_embedding_store(db, model_name: str, backend: str):
+    """
+    Create the embedding store, persisted if `MONGO_EMBEDDING_CACHE_COLLECTION` is set.
+    """
+    collection_name = os.getenv("MONGO_EMBEDDING_CACHE_COLLECTION")
+    collection = db[collection_name] if collection_name else None
+    return EmbeddingStore(collection, model_name, backend)
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from app.metrics.metrics import CallbackMetric
+
+# All caches by name, so their counters can be reported in one place
+cache_registry = {}
+
+
+class MongoCacheStore:
+    """
+    Persistent second level for a TTLCache, backed by a MongoDB collection.
+
+    Documents are stored as `{_id: key, value: ..., expires_at: ...}`. The TTL
+    index on `expires_at`, created on first use, lets MongoDB remove the expired
+    entries.
+    """
+
+    def __init__(self, collection, serialize=None, deserialize=None):
+        self.collection = collection
+        self.serialize = serialize or (lambda value: value)
+        self.deserialize = deserialize or (lambda value: value)
+        self._index_created = False
+
+    async def ensure_ttl_index(self):
+        """
+        Create the TTL index once, creating an existing index does nothing.
+        """
+        if self._index_created:
+            return
+        self._index_created = True
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logging.warning(f"Failed to create the TTL index of the cache store: {e}")
+
+    async def load(self, key):
+        await self.ensure_ttl_index()
+        doc = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+        )
+        return None if doc is None else self.deserialize(doc["value"])
+
+    async def save(self, key, value, ttl_seconds: float):
+        await self.ensure_ttl_index()
+        await self.collection.replace_one(
+            {"_id": key},
+            {
+                "value": self.serialize(value),
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds),
+            },
+            upsert=True,
+        )
+
+
+class TTLCache:
+    """
+    In-process LRU cache with a time-to-live per entry and request coalescing.
+
+    Concurrent `get_or_load` calls for the same missing key share a single load,
+    and an optional persistent store is consulted before the loader runs. For
+    `stale_seconds` after an entry expires, `get_or_load` returns it right away
+    and reloads it in the background (stale-while-revalidate).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int,
+        ttl_seconds: float,
+        store=None,
+        stale_seconds: float = 0,
+    ):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.store = store
+        self._entries = OrderedDict()
+        self._in_flight = {}
+
+        # Entries stored before this time are expired
+        self._expired_before = float("-inf")
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.store_hits = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+        cache_registry[name] = self
+
+    def get(self, key):
+        """
+        Get a value from the cache, or None if it is missing or expired.
+        """
+        state = self.state(key)
+        if state != "hit":
+            # Keep the stale entries, `get_or_load` can still serve them
+            if state == "expired":
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key][1]
+
+    def state(self, key):
+        """
+        Get the state of a key, "hit", "stale", "expired" or "miss", without counting it.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return "miss"
+
+        expires_at, _, stored_at = entry
+        now = time.monotonic()
+        if stored_at > self._expired_before:
+            if expires_at >= now:
+                return "hit"
+        else:
+            expires_at = min(expires_at, self._expired_before)
+        return "stale" if expires_at + self.stale_seconds >= now else "expired"
+
+    def set(self, key, value, ttl_seconds: float | None = None):
+        """
+        Put a value in the cache, evicting the least recently used entries if full.
+        """
+        now = time.monotonic()
+        self._entries[key] = (now + (ttl_seconds or self.ttl_seconds), value, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def expire_all(self):
+        """
+        Expire all entries, they are still served while stale.
+        """
+        self._expired_before = time.monotonic()
+
+    async def get_or_load(self, key, loader):
+        """
+        Get a value from the cache, or load it once for all concurrent callers.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish_load(key, t))
+        else:
+            self.coalesced += 1
+
+        # Serve the stale entry while it is reloaded in the background
+        if self.state(key) == "stale":
+            self.stale_hits += 1
+            return self._entries[key][1]
+
+        # Shield the load, so a cancelled caller does not cancel it for the others
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        value = None
+        if self.store is not None:
+            try:
+                value = await self.store.load(key)
+            except Exception as e:
+                logging.warning(f"Failed to read {self.name} cache store: {e}")
+            if value is not None:
+                self.store_hits += 1
+
+        if value is None:
+            value = await loader()
+            if self.store is not None:
+                try:
+                    await self.store.save(key, value, self.ttl_seconds)
+                except Exception as e:
+                    logging.warning(f"Failed to write {self.name} cache store: {e}")
+
+        self.set(key, value)
+        return value
+
+    def _finish_load(self, key, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+
+        # Retrieve the exception, so a load nobody awaits anymore is not reported
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        """
+        Get the counters of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "store_hits": self.store_hits,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+        }
+
+
+def get_cache_stats():
+    """
+    Get the counters of all caches.
+    """
+    return {name: cache.stats() for name, cache in cache_registry.items()}
+
+
+# Expose the counters of all caches as metrics, labelled by cache
+for counter, description in {
+    "hits": "Lookups served from the cache.",
+    "misses": "Lookups missing from the cache.",
+    "coalesced": "Lookups that shared the load of a concurrent one.",
+    "store_hits": "Loads served by the persistent store.",
+    "stale_hits": "Stale entries served while they are reloaded.",
+    "evictions": "Entries evicted to fit the maximum size.",
+}.items():
+    CallbackMetric(
+        f"localize_cache_{counter}_total",
+        description,
+        "counter",
+        lambda counter=counter: [
+            ({"cache": name}, getattr(cache, counter)) for name, cache in cache_registry.items()
+        ],
+    )
+CallbackMetric(
+    "localize_cache_size",
+    "Entries in the cache.",
+    "gauge",
+    lambda: [({"cache": name}, len(cache._entries)) for name, cache in cache_registry.items()],
+)
@@ -1,25 +1,83 @@
 import logging
-from app.dto.search_dto import SearchParam
-from app.usecase.add_place_thumbail_usecase import add_places_thumbnail
-from app.usecase.get_places_by_ids_usecase import get_places_by_ids
-from app.usecase.get_places_by_image_usecase import image_vector_search
+from app.chain.search_text_chain import page_scores
+from app.dto.search_dto import ImageSearchParam, SearchParam
+from app.helper.continuation_token import (
+    next_continuation_token,
+    search_depth,
+    select_page,
+)
+from app.usecase.get_places_by_ids_usecase import get_places_in_batches
+from app.usecase.get_places_by_image_usecase import (
+    image_content_vector_search,
+    image_vector_search,
+)
 
 
 class SearchImageChain:
-    def search(self, dto: SearchParam):
+    async def search(self, dto: SearchParam, cursor: dict | None = None):
         """
         Search for places based on an image URL.
+
+        With the state of a continuation token, the next page is searched with the
+        cached embedding of the image.
+        """
+        result = {"places": []}
+        async for stage, data in self.search_stages(dto, cursor):
+            if stage == "places":
+                result["places"].extend(data["places"])
+            elif stage != "results":
+                result.update(data)
+        logging.info(f"Retrieved detailed information for {len(result['places'])} places")
+        return result
+
+    async def search_stages(
+        self, dto: SearchParam, cursor: dict | None = None, place_batch_size: int | None = None
+    ):
+        """
+        Search like `search`, yielding the result of each stage as soon as it is done.
+
+        Yields the scores of the places of the page, the places in batches of
+        `place_batch_size`, and the next continuation token.
         """
-        # Search for places based on the image URL
-        embeddings = image_vector_search(dto.image_url)
+        seen = cursor["seen"] if cursor is not None else []
+        image_url = cursor["image_url"] if cursor is not None else dto.image_url
+
+        # Search for places based on the image URL, there can be several images per place
+        embeddings = await image_vector_search(
+            image_url, limit=search_depth(seen, dto.limit) * 2
+        )
         logging.info(f"Found {len(embeddings)} embeddings")
 
+        # Keep the places that were not returned by the previous pages
+        embeddings, page_ids = select_page(embeddings, seen, dto.limit)
+        yield "results", {"results": page_scores(embeddings)}
+
         # Get detailed information for each place
-        places = get_places_by_ids(embeddings)
-        logging.info(f"Retrieved detailed information for {len(places)} places")
+        async for places in get_places_in_batches(embeddings, dto.profile, place_batch_size):
+            yield "places", {"places": places}
 
-        # Add thumbnail URLs to the places if available from embeddings
-        places = add_places_thumbnail(embeddings, places)
+        yield "cursor", {
+            "next_cursor": next_continuation_token(
+                {"image_url": image_url}, seen, page_ids, dto.limit
+            )
+        }
+
+    async def search_content(self, dto: ImageSearchParam, image):
+        """
+        Search for places based on an uploaded image, decoded already.
+        """
+        # There can be several images per place, like in the image URL search
+        embeddings = await image_content_vector_search(image, limit=dto.limit * 2)
+        logging.info(f"Found {len(embeddings)} embeddings")
+
+        # Keep the embeddings of the first `limit` places
+        embeddings, _ = select_page(embeddings, [], dto.limit)
+
+        # Get detailed information for each place
+        places = []
+        async for batch in get_places_in_batches(embeddings, dto.profile):
+            places.extend(batch)
+        logging.info(f"Retrieved detailed information for {len(places)} places")
 
         return {
             "places": places,
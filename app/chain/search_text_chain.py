@@ -1,49 +1,177 @@
+import asyncio
 import logging
+import os
+from difflib import SequenceMatcher
+
+from dotenv import load_dotenv
 
 from app.dto.search_dto import SearchParam
-from app.usecase.add_place_thumbail_usecase import add_places_thumbnail
-from app.usecase.get_places_by_ids_usecase import get_places_by_ids
+from app.helper.continuation_token import (
+    next_continuation_token,
+    search_depth,
+    select_page,
+)
+from app.usecase.get_places_by_ids_usecase import get_places_in_batches
 from app.usecase.get_embedding_places_usecase import (
     combined_search_places,
+    encode_search_phrase,
+    merge_search_results,
     search_text_places,
 )
-from app.usecase.keyword_generator_usecase import generate_keyword
+from app.usecase.keyword_generator_usecase import (
+    KeywordGeneratorResponse,
+    generate_keyword,
+)
+
+# Load the environment variables
+load_dotenv()
+
+# Search the raw query while the LLM generates the keyword
+SPECULATIVE_SEARCH_ENABLED = os.getenv("SPECULATIVE_SEARCH_ENABLED", "false").lower() == "true"
+
+# Seconds to wait for the LLM before the speculative results are returned
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "2.5"))
+
+# Minimum similarity between the raw query and the keyword to reuse the speculative results
+KEYWORD_REUSE_THRESHOLD = float(os.getenv("KEYWORD_REUSE_THRESHOLD", "0.8"))
+
+
+def page_scores(embeddings: list):
+    """
+    Get the best score of each place of the page, in order.
+    """
+    scores = {}
+    for embedding in embeddings:
+        place_id = embedding["place_id"]
+        scores[place_id] = max(scores.get(place_id, embedding["score"]), embedding["score"])
+    return [{"place_id": place_id, "score": score} for place_id, score in scores.items()]
 
 
 class SearchTextChain:
 
     # Search for places based on a search query and optional category
-    def search(self, dto: SearchParam):
+    async def search(self, dto: SearchParam, cursor: dict | None = None):
         """
         Search for places based on a search query and optional category.
+
+        With the state of a continuation token, the next page is searched with the
+        keyword of the first page, skipping the keyword generation.
         """
-        # Generate a keyword string based on the search query and category
-        generator = generate_keyword(dto.q, dto.category)
-        logging.info(f"Generated keyword: {generator}")
+        result = {"places": []}
+        async for stage, data in self.search_stages(dto, cursor):
+            if stage == "places":
+                result["places"].extend(data["places"])
+            elif stage != "results":
+                result.update(data)
+        logging.info(f"Retrieved detailed information for {len(result['places'])} places")
+        return result
 
-        # Search for places based on the generated keyword
-        embeddings = (
-            combined_search_places(
-                generator.keyword,
-                limit=dto.limit,
-            )
-            if generator.is_image_search
-            else search_text_places(
-                generator.keyword,
-                limit=dto.limit,
+    async def search_stages(
+        self, dto: SearchParam, cursor: dict | None = None, place_batch_size: int | None = None
+    ):
+        """
+        Search like `search`, yielding the result of each stage as soon as it is done.
+
+        Yields the generated keyword, the scores of the places of the page, the
+        places in batches of `place_batch_size`, and the next continuation token.
+        """
+        seen = cursor["seen"] if cursor is not None else []
+        embeddings = None
+        if cursor is not None:
+            generator = KeywordGeneratorResponse(
+                keyword=cursor["keyword"], is_image_search=cursor["is_image_search"]
             )
-        )
+        elif SPECULATIVE_SEARCH_ENABLED:
+            # The raw query is searched while the keyword is generated
+            generator, embeddings = await self.speculative_search(dto)
+        else:
+            # Generate a keyword string based on the search query and category
+            generator = await generate_keyword(dto.q, dto.category)
+            logging.info(f"Generated keyword: {generator}")
+
+        # Send the keyword before the vector search, it does not depend on it
+        yield "keyword", {
+            "keyword": generator.keyword,
+            "is_image_search": generator.is_image_search,
+        }
+
+        if embeddings is None:
+            # Search for places based on the generated keyword
+            embeddings = await self.search_embeddings(generator, search_depth(seen, dto.limit))
         logging.info(f"Found {len(embeddings)} embeddings")
 
+        # Keep the places that were not returned by the previous pages
+        embeddings, page_ids = select_page(embeddings, seen, dto.limit)
+        yield "results", {"results": page_scores(embeddings)}
+
         # Get detailed information for each place
-        places = get_places_by_ids(embeddings)
-        logging.info(f"Retrieved detailed information for {len(places)} places")
+        async for places in get_places_in_batches(embeddings, dto.profile, place_batch_size):
+            yield "places", {"places": places}
 
-        # Add thumbnail URLs to the places if available from embeddings
-        places = add_places_thumbnail(embeddings, places)
+        yield "cursor", {
+            "next_cursor": next_continuation_token(
+                {"keyword": generator.keyword, "is_image_search": generator.is_image_search},
+                seen,
+                page_ids,
+                dto.limit,
+            )
+        }
 
-        return {
-            "places": places,
-            "keyword": generator.keyword,
-            "is_image_search": generator.is_image_search,
+    async def search_embeddings(
+        self, generator: KeywordGeneratorResponse, limit: int, query_vector=None
+    ):
+        """
+        Search for place embeddings based on the generated keyword.
+        """
+        search = (
+            combined_search_places if generator.is_image_search else search_text_places
+        )
+        return await search(generator.keyword, limit=limit, query_vector=query_vector)
+
+    async def speculative_search(self, dto: SearchParam):
+        """
+        Generate the keyword and search the raw query at the same time.
+
+        When the LLM misses its deadline or fails, the raw query results are returned.
+        When the generated keyword is close to the raw query, its results are reused,
+        otherwise they are merged into the results for the generated keyword.
+        """
+        keyword_task = asyncio.create_task(generate_keyword(dto.q, dto.category))
+        query_vector_task = asyncio.create_task(encode_search_phrase(dto.q))
+
+        async def search_raw_query(search):
+            query_vector = await query_vector_task
+            return await search(dto.q, limit=dto.limit, query_vector=query_vector)
+
+        speculative_tasks = {
+            False: asyncio.create_task(search_raw_query(search_text_places)),
+            True: asyncio.create_task(search_raw_query(combined_search_places)),
         }
+
+        try:
+            try:
+                generator = await asyncio.wait_for(keyword_task, LLM_DEADLINE_SECONDS)
+            except Exception as e:
+                # Serve the combined results for the raw query, which cover both paths
+                logging.warning(f"Keyword generation failed or missed the deadline: {e!r}")
+                generator = KeywordGeneratorResponse(keyword=dto.q, is_image_search=True)
+                return generator, await speculative_tasks[True]
+
+            logging.info(f"Generated keyword: {generator}")
+            speculative_results = await speculative_tasks[generator.is_image_search]
+
+            similarity = SequenceMatcher(
+                None, dto.q.lower().strip(), generator.keyword.lower().strip()
+            ).ratio()
+            if similarity >= KEYWORD_REUSE_THRESHOLD:
+                logging.info(f"Reusing speculative results (similarity {similarity:.2f})")
+                return generator, speculative_results
+
+            embeddings = await self.search_embeddings(generator, dto.limit)
+            return generator, merge_search_results(
+                embeddings, speculative_results, limit=dto.limit
+            )
+        finally:
+            # Drop the speculative work that is no longer needed
+            for task in [query_vector_task, *speculative_tasks.values()]:
+                task.cancel()
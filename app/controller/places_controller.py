@@ -1,9 +1,133 @@
+import hashlib
 import logging
+import os
 import time
 
+import httpx
+import orjson
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app.cache.ttl_cache import TTLCache
 from app.chain.search_image_chain import SearchImageChain
-from app.dto.search_dto import SearchParam
+from app.dto.search_dto import ImageSearchParam, SearchParam
+from app.helper.continuation_token import (
+    InvalidContinuationToken,
+    decode_continuation_token,
+)
+from app.helper.image_fetcher import ImageTooLargeError
 from app.chain.search_text_chain import SearchTextChain
+from app.metrics.metrics import Histogram, start_request_timings
+from app.vectorstore.vector_store import embedding_collection
+from app.watchers.collection_watcher import watch_collection
+
+# Load the environment variables
+load_dotenv()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+RESPONSE_CACHE_STALE_SECONDS = float(os.getenv("RESPONSE_CACHE_STALE_SECONDS", "600"))
+
+# Number of places per event of the streamed searches
+STREAM_PLACE_BATCH_SIZE = int(os.getenv("STREAM_PLACE_BATCH_SIZE", "5"))
+
+# Latency of the whole searches, by type
+search_duration = Histogram(
+    "localize_search_duration_seconds",
+    "Duration of the searches.",
+    labelnames=("search_type",),
+)
+
+# Cache of the serialized search responses, with their ETag
+response_cache = TTLCache(
+    "response",
+    max_size=int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "1000")),
+    ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+    stale_seconds=RESPONSE_CACHE_STALE_SECONDS,
+)
+
+
+# Meta fields that differ between two computations of the same results
+VOLATILE_META_FIELDS = ("execution_time", "timings")
+
+
+def response_etag(response: dict):
+    """
+    Build the ETag of a search response from its results, without the timing fields.
+
+    A background refresh with the same results keeps the same ETag, so clients
+    still revalidate with a 304.
+    """
+    meta = {
+        field: value
+        for field, value in response["meta"].items()
+        if field not in VOLATILE_META_FIELDS
+    }
+    payload = orjson.dumps(
+        {"data": response["data"], "meta": meta}, default=str, option=orjson.OPT_SORT_KEYS
+    )
+    return f'"{hashlib.sha1(payload).hexdigest()}"'
+
+
+def response_cache_key(params: SearchParam):
+    """
+    Build the response cache key, ignoring the case and extra whitespace of the query.
+    """
+    return (
+        " ".join((params.q or "").lower().split()),
+        params.category.value if params.category else None,
+        params.image_url,
+        params.limit,
+        params.profile.value,
+        params.cursor,
+    )
+
+
+def add_timings(meta: dict, timings: dict | None):
+    """
+    Add the stage timings to the meta, when the request asked for them.
+    """
+    if timings is not None:
+        meta["timings"] = {stage: round(ms, 2) for stage, ms in timings.items()}
+    return meta
+
+
+async def expire_responses(change: dict | None = None):
+    # New embeddings can change any search result, the responses are
+    # still served while they are refreshed
+    response_cache.expire_all()
+
+
+async def watch_embedding_changes():
+    """
+    Expire the cached responses when the watcher or the seed writes embeddings.
+    """
+    await watch_collection(
+        embedding_collection,
+        expire_responses,
+        pipeline=[{"$project": {"operationType": 1}}],
+        on_history_lost=expire_responses,
+    )
+
+
+def image_url_http_error(error: Exception):
+    """
+    Map an error of the image URL download to the HTTP error of the search, or None.
+    """
+    if isinstance(error, ImageTooLargeError):
+        return HTTPException(413, str(error))
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return HTTPException(
+            502 if status_code >= 500 else 400, f"The image URL returned HTTP {status_code}"
+        )
+    if isinstance(error, (httpx.InvalidURL, httpx.UnsupportedProtocol)):
+        return HTTPException(400, f"The image URL cannot be fetched: {error}")
+    if isinstance(error, httpx.TimeoutException):
+        return HTTPException(504, "The image URL timed out")
+    if isinstance(error, httpx.TransportError):
+        return HTTPException(502, f"The image URL cannot be reached: {error}")
+    return None
 
 
 class PlacesController:
@@ -11,49 +135,168 @@ class PlacesController:
         self.search_text_chain = SearchTextChain()
         self.search_image_chain = SearchImageChain()
 
-    def get_places(self, params: SearchParam):
+    async def get_places(self, params: SearchParam):
         """
         Get places based on the search query or image URL.
         """
 
         # Start timer
         start_time = time.time()
+        timings = start_request_timings() if params.timings else None
 
-        if params.q:
+        search_type, cursor = self.resolve_search(params)
+        if search_type == "text":
             # Search for places based on the search query
-            result = self.search_text_chain.search(params)
+            result = await self.search_text_chain.search(params, cursor)
             places = result.get("places")
             keyword = result.get("keyword")
 
             # End the timer
             execution_time = time.time() - start_time
+            search_duration.observe(execution_time, search_type="text")
             logging.info(f"The search took {execution_time:.2f} seconds")
 
             return {
                 "data": places,
-                "meta": {
-                    "execution_time": execution_time,
-                    "total_results": len(places),
-                    "keyword": keyword,
-                    "is_image_search": result.get("is_image_search"),
-                },
+                "meta": add_timings(
+                    {
+                        "execution_time": execution_time,
+                        "total_results": len(places),
+                        "keyword": keyword,
+                        "is_image_search": result.get("is_image_search"),
+                        "next_cursor": result.get("next_cursor"),
+                    },
+                    timings,
+                ),
             }
-        elif params.image_url:
+        elif search_type == "image":
             # Search for places based on the image URL
-            result = self.search_image_chain.search(params)
+            try:
+                result = await self.search_image_chain.search(params, cursor)
+            except Exception as e:
+                http_error = image_url_http_error(e)
+                if http_error is None:
+                    raise
+                raise http_error from e
             places = result.get("places")
 
             # End the timer
             execution_time = time.time() - start_time
+            search_duration.observe(execution_time, search_type="image")
             logging.info(f"The search took {execution_time:.2f} seconds")
 
             return {
                 "data": places,
-                "meta": {
+                "meta": add_timings(
+                    {
+                        "execution_time": execution_time,
+                        "total_results": len(places),
+                        "image_url": cursor["image_url"] if cursor else params.image_url,
+                        "next_cursor": result.get("next_cursor"),
+                    },
+                    timings,
+                ),
+            }
+
+    def resolve_search(self, params: SearchParam):
+        """
+        Get the type of the search, "text" or "image", and the state of its cursor.
+        """
+        search_type = "text" if params.q else "image" if params.image_url else None
+
+        # The next page of a previous search, of the same type
+        cursor = None
+        if params.cursor:
+            try:
+                cursor = decode_continuation_token(params.cursor)
+            except InvalidContinuationToken as e:
+                raise HTTPException(400, str(e))
+            search_type = "text" if "keyword" in cursor else "image"
+
+        if search_type is None:
+            raise ValueError("Either 'q' or 'image_url' must be provided")
+        return search_type, cursor
+
+    def stream_places(self, params: SearchParam):
+        """
+        Get places like `get_places`, as events sent as soon as each stage is done.
+
+        The search is validated right away, the returned generator yields
+        `(event, data)` pairs and ends with a "meta" event, or an "error" event.
+        """
+        search_type, cursor = self.resolve_search(params)
+        chain = self.search_text_chain if search_type == "text" else self.search_image_chain
+        return self._stream_stages(
+            chain.search_stages(params, cursor, place_batch_size=STREAM_PLACE_BATCH_SIZE),
+            search_type,
+            params.timings,
+        )
+
+    async def _stream_stages(self, stages, search_type: str, with_timings: bool):
+        start_time = time.time()
+        timings = start_request_timings() if with_timings else None
+        meta = {"total_results": 0}
+        try:
+            async for stage, data in stages:
+                if stage == "places":
+                    meta["total_results"] += len(data["places"])
+                if stage in ("keyword", "cursor"):
+                    meta.update(data)
+
+                # The next cursor is sent with the meta, once all places are sent
+                if stage != "cursor":
+                    yield stage, data
+        except Exception as e:
+            # The response has started already, so the error is sent as an event
+            logging.exception("The streamed search failed")
+            yield "error", {"detail": str(e)}
+            return
+
+        meta["execution_time"] = time.time() - start_time
+        search_duration.observe(meta["execution_time"], search_type=search_type)
+        logging.info(f"The streamed search took {meta['execution_time']:.2f} seconds")
+        yield "meta", add_timings(meta, timings)
+
+    async def get_places_by_image(self, params: ImageSearchParam, image, image_bytes: int):
+        """
+        Get places based on an uploaded image, decoded already.
+        """
+        start_time = time.time()
+        timings = start_request_timings() if params.timings else None
+        result = await self.search_image_chain.search_content(params, image)
+        places = result.get("places")
+
+        execution_time = time.time() - start_time
+        search_duration.observe(execution_time, search_type="image_upload")
+        logging.info(f"The image upload search took {execution_time:.2f} seconds")
+
+        return {
+            "data": places,
+            "meta": add_timings(
+                {
                     "execution_time": execution_time,
                     "total_results": len(places),
-                    "image_url": params.image_url,
+                    "image_bytes": image_bytes,
                 },
-            }
-        else:
-            raise ValueError("Either 'q' or 'image_url' must be provided")
+                timings,
+            ),
+        }
+
+    async def get_cached_places(self, params: SearchParam):
+        """
+        Get the serialized search response, from the response cache when possible.
+
+        Returns the response body, its ETag and the cache state of the response.
+        """
+        async def load():
+            response = await self.get_places(params)
+            return orjson.dumps(response, default=str), response_etag(response)
+
+        # The timings of a cached response would be the ones of its first request
+        if not RESPONSE_CACHE_ENABLED or params.timings:
+            return *(await load()), "bypass"
+
+        key = response_cache_key(params)
+        state = response_cache.state(key)
+        body, etag = await response_cache.get_or_load(key, load)
+        return body, etag, state if state in ("hit", "stale") else "miss"
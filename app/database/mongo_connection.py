@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient, MongoClient, ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
+
+from app.metrics.metrics import CallbackMetric
+
+# Load the environment variables
+load_dotenv()
+
+# Read preferences by name, for the MONGO_*_READ_PREFERENCE variables
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Counts the connections of the pools of a client, for the pool usage metrics.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.created = 0
+        self.closed = 0
+        self.check_outs = 0
+        self.check_out_failures = 0
+        self.check_out_seconds = 0.0
+        self.pool_clears = 0
+
+    def connection_created(self, event):
+        self.open += 1
+        self.created += 1
+
+    def connection_closed(self, event):
+        self.open -= 1
+        self.closed += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+        self.max_checked_out = max(self.max_checked_out, self.checked_out)
+        self.check_outs += 1
+        self.check_out_seconds += getattr(event, "duration", 0) or 0
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        self.check_out_failures += 1
+
+    def pool_cleared(self, event):
+        self.pool_clears += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        return {
+            "open_connections": self.open,
+            "checked_out": self.checked_out,
+            "max_checked_out": self.max_checked_out,
+            "created": self.created,
+            "closed": self.closed,
+            "check_outs": self.check_outs,
+            "check_out_failures": self.check_out_failures,
+            "mean_check_out_ms": (
+                self.check_out_seconds / self.check_outs * 1000 if self.check_outs else 0.0
+            ),
+            "pool_clears": self.pool_clears,
+        }
+
+
+def mongo_client_options(pool_metrics: PoolMetrics | None = None):
+    """
+    Get the client options from the `MONGO_*` variables.
+    """
+    options = {
+        "appname": os.getenv("MONGO_APP_NAME", "localize-ai"),
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "4")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "serverSelectionTimeoutMS": int(
+            os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+        ),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+    }
+
+    # zstd and snappy need the zstandard and python-snappy packages, zlib is built in
+    if os.getenv("MONGO_COMPRESSORS"):
+        options["compressors"] = os.getenv("MONGO_COMPRESSORS")
+    if pool_metrics is not None:
+        options["event_listeners"] = [pool_metrics]
+    return options
+
+
+class MongoConnectionManager:
+    """
+    One pooled MongoDB client shared by the whole API process.
+
+    The client is created without connecting, so modules can take their
+    collections at import time. The lifespan connects it, warms up the pool so
+    the first requests do not pay for the handshakes, and closes it on shutdown.
+    Vector searches read with their own read preference, so they can be served
+    by the secondaries.
+    """
+
+    def __init__(self, uri: str | None, db_name: str | None):
+        self.pool_metrics = PoolMetrics()
+        self.options = mongo_client_options(self.pool_metrics)
+        self.client = AsyncMongoClient(uri, **self.options)
+        self.db = self.client[db_name]
+        self.vector_search_db = self.client.get_database(
+            db_name,
+            read_preference=READ_PREFERENCES[
+                os.getenv("MONGO_VECTOR_SEARCH_READ_PREFERENCE", "secondaryPreferred")
+            ],
+        )
+
+    def collection(self, name: str):
+        return self.db[name]
+
+    def vector_search_collection(self, name: str):
+        return self.vector_search_db[name]
+
+    async def connect(self):
+        """
+        Connect the client and open `minPoolSize` connections ahead of the first request.
+        """
+        start_time = time.time()
+        try:
+            await self.client.aconnect()
+
+            # Concurrent pings check out as many connections as they can
+            await asyncio.gather(
+                *(
+                    self.db.command("ping")
+                    for _ in range(max(1, self.options["minPoolSize"]))
+                )
+            )
+        except Exception as e:
+            # The requests connect on their own once MongoDB is reachable
+            logging.warning(f"Failed to warm up the MongoDB connections: {e}")
+            return
+        logging.info(
+            f"Connected to MongoDB with {self.pool_metrics.open} connections "
+            f"in {time.time() - start_time:.2f} seconds"
+        )
+
+    async def close(self):
+        await self.client.close()
+
+    def stats(self):
+        """
+        Get the pool usage metrics and the pool settings.
+        """
+        return {
+            **self.pool_metrics.stats(),
+            "max_pool_size": self.options["maxPoolSize"],
+            "min_pool_size": self.options["minPoolSize"],
+        }
+
+
+def create_sync_client(pool_metrics: PoolMetrics | None = None):
+    """
+    Create a synchronous client with the same settings, for the watcher and the seed.
+    """
+    return MongoClient(os.getenv("MONGO_URI"), **mongo_client_options(pool_metrics))
+
+
+mongo = MongoConnectionManager(os.getenv("MONGO_URI"), os.getenv("MONGO_DB_NAME"))
+
+# Expose the pool usage of the shared client as metrics
+CallbackMetric(
+    "localize_mongo_open_connections",
+    "Open connections of the shared MongoDB client.",
+    "gauge",
+    lambda: [({}, mongo.pool_metrics.open)],
+)
+CallbackMetric(
+    "localize_mongo_checked_out_connections",
+    "Connections checked out of the shared MongoDB pool.",
+    "gauge",
+    lambda: [({}, mongo.pool_metrics.checked_out)],
+)
+CallbackMetric(
+    "localize_mongo_check_out_failures_total",
+    "Failed connection check outs of the shared MongoDB pool.",
+    "counter",
+    lambda: [({}, mongo.pool_metrics.check_out_failures)],
+)
@@ -1,7 +1,12 @@
+import os
 from enum import Enum
+from dotenv import load_dotenv
 from fastapi import Query
 from pydantic import BaseModel
 
+# Load the environment variables
+load_dotenv()
+
 
 class SearchCategory(str, Enum):
     work_friendly = "work_friendly"
@@ -11,8 +16,26 @@ class SearchCategory(str, Enum):
     cozy_atmosphere = "cozy_atmosphere"
 
 
+class ResponseProfile(str, Enum):
+    # Fields shown on the results page
+    compact = "compact"
+    # The whole place document
+    full = "full"
+
+
 class SearchParam(BaseModel):
     q: str | None = None
     image_url: str | None = None
     category: SearchCategory | None = None
     limit: int = Query(20, ge=1, le=50)
+    profile: ResponseProfile = ResponseProfile(os.getenv("SEARCH_RESPONSE_PROFILE", "full"))
+    # Continuation token of the next page, from the `next_cursor` of the previous one
+    cursor: str | None = None
+    # Add the milliseconds spent in each stage to the meta
+    timings: bool = False
+
+
+class ImageSearchParam(BaseModel):
+    limit: int = Query(20, ge=1, le=50)
+    profile: ResponseProfile = ResponseProfile(os.getenv("SEARCH_RESPONSE_PROFILE", "full"))
+    timings: bool = False
@@ -0,0 +1,78 @@
+import base64
+import binascii
+import os
+import zlib
+
+import orjson
+from dotenv import load_dotenv
+
+# Load the environment variables
+load_dotenv()
+
+# Most places a search can page through
+MAX_SEARCH_RESULTS = int(os.getenv("MAX_SEARCH_RESULTS", "200"))
+
+
+class InvalidContinuationToken(ValueError):
+    pass
+
+
+def encode_continuation_token(state: dict):
+    """
+    Encode the state of a search into an opaque, URL safe token.
+    """
+    data = zlib.compress(orjson.dumps(state, default=str))
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_continuation_token(token: str):
+    """
+    Decode a token made by `encode_continuation_token`.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = orjson.loads(zlib.decompress(data))
+    except (binascii.Error, zlib.error, orjson.JSONDecodeError, ValueError):
+        raise InvalidContinuationToken("Invalid continuation token")
+    if (
+        not isinstance(state, dict)
+        or not isinstance(state.get("seen"), list)
+        or not ("keyword" in state or "image_url" in state)
+    ):
+        raise InvalidContinuationToken("Invalid continuation token")
+    return state
+
+
+def search_depth(seen: list, limit: int):
+    """
+    Number of results to search for the page after the `seen` places.
+    """
+    return min(len(seen) + limit, MAX_SEARCH_RESULTS)
+
+
+def select_page(embeddings: list, seen: list, limit: int):
+    """
+    Select the embeddings of the next `limit` places that were not returned yet.
+
+    Returns the embeddings of the page and the ids of its places, in score order.
+    """
+    seen = set(seen)
+    page_ids = []
+    for embedding in sorted(embeddings, key=lambda x: x["score"], reverse=True):
+        place_id = str(embedding["place_id"])
+        if place_id not in seen and len(page_ids) < limit:
+            seen.add(place_id)
+            page_ids.append(place_id)
+
+    page = set(page_ids)
+    return [e for e in embeddings if str(e["place_id"]) in page], page_ids
+
+
+def next_continuation_token(state: dict, seen: list, page_ids: list, limit: int):
+    """
+    Get the token of the next page, or None if this was the last one.
+    """
+    seen = seen + page_ids
+    if len(page_ids) < limit or len(seen) >= MAX_SEARCH_RESULTS:
+        return None
+    return encode_continuation_token({**state, "seen": seen})
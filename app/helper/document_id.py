@@ -0,0 +1,8 @@
+import hashlib
+
+
+def document_id(*parts):
+    """
+    Build a deterministic document id, so rewriting a document replaces it instead of duplicating it.
+    """
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import os
+import time
+from io import BytesIO
+
+import httpx
+from dotenv import load_dotenv
+from PIL import Image
+
+from app.metrics.metrics import CallbackMetric
+
+# Load the environment variables
+load_dotenv()
+
+# Smallest side of the decoded images, CLIP resizes them to 224 pixels anyway
+IMAGE_DECODE_SIZE = int(os.getenv("IMAGE_DECODE_SIZE", "224"))
+
+
+# Errors of image bytes that cannot be decoded, like truncated or unknown formats
+IMAGE_DECODE_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+
+
+class ImageTooLargeError(ValueError):
+    pass
+
+
+def is_permanent_download_error(error: Exception):
+    """
+    Whether retrying the download cannot help, like a missing or too large image.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code < 500 and error.response.status_code != 429
+    return isinstance(error, (ImageTooLargeError, httpx.InvalidURL, httpx.UnsupportedProtocol))
+
+
+def decode_image(content: bytes, size: int = IMAGE_DECODE_SIZE):
+    """
+    Decode an image at a reduced resolution, keeping its smallest side at least `size`.
+
+    JPEGs are decoded at a reduced scale by the decoder itself (draft mode), other
+    formats are decoded fully and reduced by an integer factor.
+    """
+    image = Image.open(BytesIO(content))
+    image.draft("RGB", (size, size))
+    image = image.convert("RGB")
+
+    factor = min(image.size) // size
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+class ImageFetcher:
+    """
+    Downloads images with pooled connections, timeouts and a maximum size.
+
+    The body is streamed and the download is aborted as soon as it exceeds
+    `max_bytes`. With a `cache_dir`, images are kept on disk by URL and reused
+    for `cache_ttl_seconds`, after which they are revalidated with their ETag.
+    The same fetcher serves threads with `fetch` and the event loop with `afetch`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        connect_timeout: float,
+        read_timeout: float,
+        cache_dir: str | None = None,
+        cache_max_bytes: int = 0,
+        cache_ttl_seconds: float = 0,
+        max_connections: int = 32,
+    ):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._cache_bytes_written = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        client_options = {
+            "timeout": httpx.Timeout(read_timeout, connect=connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_connections
+            ),
+            "follow_redirects": True,
+        }
+        self.client = httpx.Client(**client_options)
+        self.async_client = httpx.AsyncClient(**client_options)
+
+        # Counters
+        self.downloads = 0
+        self.cache_hits = 0
+        self.revalidated = 0
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Get the bytes of an image, from the disk cache or by downloading it.
+        """
+        cached = self._read_cache(url)
+        if cached is not None and cached["fresh"]:
+            self.cache_hits += 1
+            return cached["content"]
+
+        with self.client.stream("GET", url, headers=self._cache_headers(cached)) as response:
+            if response.status_code == 304:
+                return self._revalidated(url, cached)
+            response.raise_for_status()  # Ensure the request was successful
+            self._check_length(response)
+            content = bytearray()
+            for chunk in response.iter_bytes():
+                self._append(content, chunk)
+
+        return self._downloaded(url, response, bytes(content))
+
+    async def afetch(self, url: str) -> bytes:
+        """
+        Get the bytes of an image without blocking the event loop.
+        """
+        cached = None
+        if self.cache_dir:
+            cached = await asyncio.to_thread(self._read_cache, url)
+            if cached is not None and cached["fresh"]:
+                self.cache_hits += 1
+                return cached["content"]
+
+        async with self.async_client.stream(
+            "GET", url, headers=self._cache_headers(cached)
+        ) as response:
+            if response.status_code == 304:
+                return await asyncio.to_thread(self._revalidated, url, cached)
+            response.raise_for_status()  # Ensure the request was successful
+            self._check_length(response)
+            content = bytearray()
+            async for chunk in response.aiter_bytes():
+                self._append(content, chunk)
+
+        if self.cache_dir:
+            return await asyncio.to_thread(self._downloaded, url, response, bytes(content))
+        return self._downloaded(url, response, bytes(content))
+
+    def _check_length(self, response: httpx.Response):
+        content_length = response.headers.get("content-length")
+        if content_length and int(content_length) > self.max_bytes:
+            raise ImageTooLargeError(
+                f"Image of {content_length} bytes is larger than {self.max_bytes} bytes"
+            )
+
+    def _append(self, content: bytearray, chunk: bytes):
+        # The content length can be missing or wrong, so count the bytes too
+        content.extend(chunk)
+        if len(content) > self.max_bytes:
+            raise ImageTooLargeError(f"Image is larger than {self.max_bytes} bytes")
+
+    def _cache_headers(self, cached: dict | None):
+        if cached is not None and cached["etag"]:
+            return {"If-None-Match": cached["etag"]}
+        return {}
+
+    def _cache_path(self, url: str):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def _read_cache(self, url: str):
+        if not self.cache_dir:
+            return None
+        path = self._cache_path(url)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            with open(f"{path}.etag") as f:
+                etag = f.read()
+            age = time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        return {"content": content, "etag": etag, "fresh": age < self.cache_ttl_seconds}
+
+    def _revalidated(self, url: str, cached: dict):
+        # The cached image is still current, keep it for another TTL
+        self.revalidated += 1
+        if self.cache_dir:
+            os.utime(self._cache_path(url))
+        return cached["content"]
+
+    def _downloaded(self, url: str, response: httpx.Response, content: bytes):
+        self.downloads += 1
+        if self.cache_dir:
+            self._write_cache(url, content, response.headers.get("etag", ""))
+        return content
+
+    def _write_cache(self, url: str, content: bytes, etag: str):
+        path = self._cache_path(url)
+
+        # Write to temporary files first, so readers never see a partial image
+        tmp_path = f"{path}.tmp-{os.getpid()}-{id(content)}"
+        with open(f"{tmp_path}.etag", "w") as f:
+            f.write(etag)
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(f"{tmp_path}.etag", f"{path}.etag")
+        os.replace(tmp_path, path)
+
+        # Prune the cache after every tenth of its size written
+        self._cache_bytes_written += len(content)
+        if self._cache_bytes_written > self.cache_max_bytes / 10:
+            self._cache_bytes_written = 0
+            self.prune_cache()
+
+    def prune_cache(self):
+        """
+        Remove the least recently used images until the cache fits its maximum size.
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and len(entry.name) == 64:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.cache_max_bytes:
+                break
+            for file_path in (path, f"{path}.etag"):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+            total_bytes -= size
+
+    def stats(self):
+        return {
+            "downloads": self.downloads,
+            "cache_hits": self.cache_hits,
+            "revalidated": self.revalidated,
+        }
+
+
+def create_image_fetcher():
+    """
+    Create the image fetcher from the `IMAGE_FETCH_*` and `IMAGE_CACHE_*` variables.
+    """
+    return ImageFetcher(
+        max_bytes=int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(20 * 1024 * 1024))),
+        connect_timeout=float(os.getenv("IMAGE_FETCH_CONNECT_TIMEOUT_SECONDS", "5")),
+        read_timeout=float(os.getenv("IMAGE_FETCH_READ_TIMEOUT_SECONDS", "15")),
+        cache_dir=os.getenv("IMAGE_CACHE_DIR") or None,
+        cache_max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024,
+        cache_ttl_seconds=float(os.getenv("IMAGE_CACHE_TTL_SECONDS", "86400")),
+        max_connections=int(os.getenv("IMAGE_FETCH_MAX_CONNECTIONS", "32")),
+    )
+
+
+image_fetcher = create_image_fetcher()
+
+
+# Expose the fetcher counters as metrics
+for counter, description in {
+    "downloads": "Images downloaded.",
+    "cache_hits": "Images served from the disk cache.",
+    "revalidated": "Cached images revalidated with their ETag.",
+}.items():
+    CallbackMetric(
+        f"localize_image_fetch_{counter}_total",
+        description,
+        "counter",
+        lambda counter=counter: [({}, getattr(image_fetcher, counter))],
+    )
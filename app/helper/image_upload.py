@@ -0,0 +1,90 @@
+import base64
+import binascii
+import orjson
+from fastapi import HTTPException, Request
+from python_multipart.multipart import FormParser, parse_options_header
+
+from app.helper.image_fetcher import IMAGE_DECODE_ERRORS, decode_image
+from app.model.clip_model import run_in_clip_executor
+
+
+async def read_body(request: Request, max_bytes: int, on_chunk=None):
+    """
+    Stream the request body, rejecting it as soon as it exceeds `max_bytes`.
+    """
+    size = 0
+    body = bytearray()
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(413, f"The request body is larger than {max_bytes} bytes")
+        if on_chunk is None:
+            body.extend(chunk)
+        else:
+            on_chunk(chunk)
+    return bytes(body)
+
+
+async def read_multipart_image(request: Request, content_type: str, max_bytes: int):
+    """
+    Read the `image` file of a multipart form, keeping it in memory.
+    """
+    _, options = parse_options_header(content_type)
+    files = {}
+    parser = FormParser(
+        "multipart/form-data",
+        on_field=None,
+        on_file=lambda file: files.setdefault(file.field_name, file),
+        boundary=options.get(b"boundary"),
+        config={"MAX_MEMORY_FILE_SIZE": max_bytes, "MAX_BODY_SIZE": max_bytes},
+    )
+    await read_body(request, max_bytes, on_chunk=parser.write)
+    parser.finalize()
+
+    file = files.get(b"image")
+    if file is None:
+        raise HTTPException(400, "The form has no 'image' file")
+    return file.file_object.getvalue()
+
+
+async def read_base64_image(request: Request, max_bytes: int):
+    """
+    Read the base64 `image` field of a JSON body, with or without a data URL prefix.
+    """
+    # Base64 is a third larger than the image
+    body = await read_body(request, max_bytes * 4 // 3 + 1024)
+    try:
+        data = orjson.loads(body)["image"]
+        if data.startswith("data:"):
+            data = data.partition(",")[2]
+        return base64.b64decode(data, validate=True)
+    except (orjson.JSONDecodeError, KeyError, TypeError, AttributeError, binascii.Error):
+        raise HTTPException(400, "The body must be JSON with a base64 'image' field")
+
+
+async def read_image_upload(request: Request, max_bytes: int):
+    """
+    Read an uploaded image from a multipart form or a JSON body with base64.
+
+    Returns the bytes of the image and the decoded image.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        content = await read_multipart_image(request, content_type, max_bytes)
+    elif content_type.startswith("application/json"):
+        content = await read_base64_image(request, max_bytes)
+    else:
+        raise HTTPException(415, "Upload the image as multipart/form-data or base64 JSON")
+
+    if not content:
+        raise HTTPException(400, "The image is empty")
+    if len(content) > max_bytes:
+        raise HTTPException(413, f"The image is larger than {max_bytes} bytes")
+
+    # Decode the whole image before it is encoded, so a truncated or corrupt upload
+    # is rejected here and not in its encoding batch
+    try:
+        image = await run_in_clip_executor(decode_image, content)
+    except IMAGE_DECODE_ERRORS:
+        raise HTTPException(400, "The upload is not a supported image")
+    return content, image
@@ -0,0 +1,84 @@
+import re
+
+# Words describing the kind of place or its vibe, which make a query an image search
+DESCRIPTIVE_WORDS = {
+    # Kinds of places
+    "bakery", "bar", "bistro", "brunch", "building", "cafe", "caffe", "coffee",
+    "coworking", "dessert", "diner", "eatery", "food", "garden", "kafe", "kedai",
+    "kopi", "library", "lounge", "makan", "museum", "park", "place", "places",
+    "pub", "restaurant", "resto", "rooftop", "shop", "spot", "spots", "tea",
+    "tempat", "warung", "workspace",
+    # Vibes
+    "aesthetic", "affordable", "ambience", "atmosphere", "beautiful", "calm",
+    "cheap", "chill", "classic", "colonial", "comfortable", "cozy", "cosy", "cute",
+    "date", "dutch", "family", "friendly", "gem", "green", "hidden", "homey",
+    "instagrammable", "modern", "murah", "nature", "nice", "nongkrong", "nyaman", "old",
+    "outdoor",
+    "pet", "quiet", "relax", "romantic", "spacious", "study", "tenang", "unique",
+    "view", "vibe", "vibes", "vintage", "wifi", "work", "working",
+}
+
+# Words that neither name a place nor describe one
+NEUTRAL_WORDS = {
+    "a", "an", "and", "at", "best", "buat", "dan", "dekat", "di", "for", "good", "in",
+    "near", "of", "on", "or", "the", "to", "untuk", "with", "yang",
+    # Areas, which qualify a search without naming a place
+    "bali", "bandung", "barat", "central", "east", "jakarta", "jogja", "north",
+    "pusat", "selatan", "south", "surabaya", "timur", "utara", "west", "yogyakarta",
+}
+
+# Street, number and postal code patterns of an address
+ADDRESS_PATTERN = re.compile(
+    r"\b(jl|jln|jalan|gg|gang|street|st|road|rd|avenue|ave|blok|block|kav|no|rt|rw"
+    r"|kec|kecamatan|kel|kelurahan)\b\.?\s*\w|\b\d{5}\b",
+    re.IGNORECASE,
+)
+
+
+def keyword_with_category(search_phrase: str, category=None):
+    """
+    Build the keyword like the LLM does, the query with the category as a qualifier.
+    """
+    category = getattr(category, "value", category)
+    if not category:
+        return search_phrase
+    return f"{search_phrase} {category.replace('_', ' ')}"
+
+
+def classify_query(search_phrase: str):
+    """
+    Classify a query with rules, returns `(is_image_search, confidence)`.
+
+    Addresses and title cased names are place names, queries made only of words
+    that describe places are image searches. `is_image_search` is None when the rules
+    cannot tell.
+    """
+    words = re.findall(r"[^\W_]+", search_phrase)
+    if not words:
+        return None, 0.0
+    lower_words = [word.lower() for word in words]
+    descriptive = sum(word in DESCRIPTIVE_WORDS for word in lower_words)
+    known = sum(word in DESCRIPTIVE_WORDS or word in NEUTRAL_WORDS for word in lower_words)
+
+    # An address, unless the query describes what to find around it
+    if ADDRESS_PATTERN.search(search_phrase) and not descriptive:
+        return False, 0.95
+
+    # A name in title case, like "Kopi Kenangan Senopati"
+    names = [
+        word
+        for word, lower_word in zip(words, lower_words)
+        if lower_word not in DESCRIPTIVE_WORDS and lower_word not in NEUTRAL_WORDS
+    ]
+    if names and all(word[0].isupper() or word[0].isdigit() for word in names):
+        # "Cafe near Senopati" is a search around a place, not its name
+        near = any(word in ("in", "near", "di", "dekat") for word in lower_words)
+        return False, 0.85 if len(words) >= 2 and not near else 0.6
+
+    # A description, unless a word is unknown, as it may name the place like
+    # "starbucks coffee", so the title match or the LLM decides
+    if descriptive:
+        if known == len(words):
+            return True, 0.9
+        return True, 0.6 * known / len(words)
+    return None, 0.0
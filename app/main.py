@@ -1,10 +1,48 @@
+import asyncio
 import logging
+import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
-from app.router import places_router
+from app.router import cache_router, metrics_router, mongo_router, places_router
 from fastapi.middleware.cors import CORSMiddleware
+from app.controller.places_controller import watch_embedding_changes
+from app.database.mongo_connection import mongo
+from app.model.model_registry import warm_up_models
+from app.usecase.get_embedding_places_usecase import warm_up_text_embedding_cache
+from app.usecase.get_places_by_ids_usecase import watch_place_changes
+from app.vectorstore.vector_store import vector_store
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the models before the first request
+    if os.getenv("MODEL_WARM_UP", "true").lower() == "true":
+        await asyncio.to_thread(warm_up_models)
+
+    # Warm up the text embedding cache with the top queries
+    if os.getenv("TEXT_EMBEDDING_CACHE_WARMUP_FILE"):
+        await warm_up_text_embedding_cache(os.getenv("TEXT_EMBEDDING_CACHE_WARMUP_FILE"))
+
+    # Open the MongoDB connections before the first request
+    await mongo.connect()
+
+    await vector_store.start()
+
+    # Keep the place cache in sync with the places collection
+    place_cache_task = asyncio.create_task(watch_place_changes())
+
+    # Expire the cached responses when new embeddings are written
+    response_cache_task = asyncio.create_task(watch_embedding_changes())
+
+    yield
+    place_cache_task.cancel()
+    response_cache_task.cancel()
+    await vector_store.close()
+    await mongo.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,5 +53,8 @@ app.add_middleware(
 )
 
 app.include_router(places_router.router, prefix="/v1/places", tags=["places"])
+app.include_router(cache_router.router, prefix="/v1/cache", tags=["cache"])
+app.include_router(mongo_router.router, prefix="/v1/mongo", tags=["mongo"])
+app.include_router(metrics_router.router, prefix="/metrics", tags=["metrics"])
 
 logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,195 @@
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+
+# Load the environment variables
+load_dotenv()
+
+# All metrics by name, rendered in the Prometheus text format by `render_metrics`
+metrics_registry = {}
+
+# Upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Stage timings of the current request, in milliseconds, when it asked for them
+request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+
+# Optionally trace the stages with OpenTelemetry, the exporter is set up by the SDK
+tracer = None
+if os.getenv("OTEL_TRACES_ENABLED", "false").lower() == "true":
+    try:
+        from opentelemetry import trace
+
+        tracer = trace.get_tracer("localize-ai")
+    except ImportError:
+        logging.warning("opentelemetry is not installed, the stages are not traced")
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict):
+    if not labels:
+        return ""
+    pairs = (f'{name}="{escape_label_value(value)}"' for name, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Monotonic counter, with one value per combination of its labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values = {}
+        metrics_registry[name] = self
+
+        # Report the counters without labels from the start
+        if not labelnames:
+            self._values[()] = 0.0
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, with their sum and count.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = (*sorted(buckets), float("inf"))
+        self._values = {}
+        metrics_registry[name] = self
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._values[key] = (counts, total + value)
+
+    def samples(self):
+        for key, (counts, total) in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", {**labels, "le": format_value(bound)}, count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, counts[-1]
+
+
+class CallbackMetric:
+    """
+    Counter or gauge read at scrape time from counters kept elsewhere, like the
+    cache stats. The callback returns `(labels, value)` pairs.
+    """
+
+    def __init__(self, name: str, description: str, type: str, callback):
+        self.name = name
+        self.description = description
+        self.type = type
+        self.callback = callback
+        metrics_registry[name] = self
+
+    def samples(self):
+        for labels, value in self.callback():
+            yield self.name, labels, value
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in metrics_registry.values():
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Latency of each stage of the searches
+stage_duration = Histogram(
+    "localize_stage_duration_seconds",
+    "Duration of the search stages.",
+    labelnames=("stage",),
+)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a stage of the search, into the stage histogram and the request timings.
+
+    Stages that run at the same time, like the speculative search, overlap.
+    """
+    if tracer is not None:
+        with tracer.start_as_current_span(stage):
+            with _timed(stage):
+                yield
+    else:
+        with _timed(stage):
+            yield
+
+
+@contextmanager
+def _timed(stage: str):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start_time
+        stage_duration.observe(duration, stage=stage)
+
+        timings = request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + duration * 1000
+
+
+def start_request_timings():
+    """
+    Collect the stage timings of the current request, returns the dict they go in.
+
+    Tasks started afterwards share the dict, so their stages are collected too.
+    """
+    timings = {}
+    request_timings.set(timings)
+    return timings
@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from app.model.clip_model import run_in_clip_executor
+
+# Load the environment variables
+load_dotenv()
+
+# Largest batch encoded at once, and how long a request waits for others to join it
+CLIP_BATCH_MAX_SIZE = int(os.getenv("CLIP_BATCH_MAX_SIZE", "32"))
+CLIP_BATCH_MAX_WAIT_MS = float(os.getenv("CLIP_BATCH_MAX_WAIT_MS", "5"))
+
+
+class BatchEncoder:
+    """
+    Collects the items encoded by concurrent requests and encodes them in batches.
+
+    The first item of a batch waits at most `max_wait_seconds` for others to join,
+    and a full batch is encoded right away. Each batch runs in the CLIP executor,
+    so batched matrix multiplications replace one model call per request. When a
+    batch fails, its items are encoded one at a time, so an error only fails the
+    request of the item that caused it.
+    """
+
+    def __init__(
+        self,
+        encode_batch,
+        max_batch_size: int = CLIP_BATCH_MAX_SIZE,
+        max_wait_seconds: float = CLIP_BATCH_MAX_WAIT_MS / 1000,
+    ):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+        # Counters
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0
+
+    async def encode(self, item):
+        """
+        Encode one item together with the items of the concurrent requests.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_seconds, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch = self._pending[: self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size :]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_wait_seconds, self._flush
+            )
+
+        # Skip the items whose callers were cancelled while waiting
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if batch:
+            task = asyncio.create_task(self._encode(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _encode(self, batch: list):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            embeddings = await run_in_clip_executor(
+                self.encode_batch, [item for item, _ in batch]
+            )
+        except Exception as e:
+            if len(batch) == 1:
+                self._set_exception(batch[0][1], e)
+                return
+
+            # Find the failing items, so the others still get their embedding
+            self.fallbacks += 1
+            for item, future in batch:
+                if future.done():
+                    continue
+                try:
+                    embedding = (await run_in_clip_executor(self.encode_batch, [item]))[0]
+                except Exception as item_error:
+                    self._set_exception(future, item_error)
+                    continue
+                if not future.done():
+                    future.set_result(embedding)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, error: Exception):
+        if not future.done():
+            future.set_exception(error)
+
+    def stats(self):
+        """
+        Get the counters of the encoder.
+        """
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "pending": len(self._pending),
+            "fallbacks": self.fallbacks,
+        }
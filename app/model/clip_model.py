@@ -1,6 +1,18 @@
-from sentence_transformers import SentenceTransformer
-from transformers import CLIPTokenizer
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-clip_model = SentenceTransformer("clip-ViT-L-14")
+# Bounded executor for the CPU-bound CLIP work, so encoding never blocks the event loop
+clip_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CLIP_EXECUTOR_WORKERS", "2")),
+    thread_name_prefix="clip",
+)
 
-clip_tokenizer = CLIPTokenizer.from_pretrained("openai/clip-vit-large-patch14")
+
+async def run_in_clip_executor(func, *args, **kwargs):
+    """
+    Run a CPU-bound function in the CLIP executor and await its result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(clip_executor, partial(func, *args, **kwargs))
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from app.metrics.metrics import CallbackMetric, Counter
+
+# Load the environment variables
+load_dotenv()
+
+# Deadline of one LLM call
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "5"))
+
+# Calls per keyword generation, across the providers
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+
+# Send a second request to the next provider when the first is slower than usual
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+
+# Latency percentile of a provider after which its request is hedged
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+
+# Hedge delay until a provider has enough latency samples, and its lower bound
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "1.5"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.2"))
+
+# Consecutive failures that open the circuit of a provider, and how long it stays open
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+# Latency samples kept per provider, and how many are needed for the percentile
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+# All providers by name, so their state can be reported in one place
+provider_registry = {}
+
+llm_calls = Counter(
+    "localize_llm_calls_total",
+    "LLM calls by provider and outcome.",
+    labelnames=("provider", "outcome"),
+)
+llm_hedges = Counter("localize_llm_hedges_total", "LLM requests hedged to another provider.")
+
+
+class NoProviderAvailableError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after `failure_threshold` consecutive failures.
+
+    The circuit stays open for `reset_seconds`, then a single trial call is let
+    through (half open). Its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def allow(self):
+        """
+        Whether a call can be made, letting the trial call through once the reset is over.
+        """
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+                logging.warning(f"Opened the LLM circuit after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self):
+        # A cancelled trial call tells nothing, let the next call be the trial
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic() - self.reset_seconds
+
+
+class LLMProvider:
+    """
+    One LLM backend, called with a deadline, with its circuit breaker and latencies.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        chain,
+        timeout_seconds: float = LLM_CALL_TIMEOUT_SECONDS,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.name = name
+        self.chain = chain
+        self.timeout_seconds = timeout_seconds
+        self.breaker = breaker or CircuitBreaker(
+            LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_SECONDS
+        )
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        provider_registry[name] = self
+
+    async def call(self, inputs: dict):
+        start_time = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self.chain.ainvoke(inputs), self.timeout_seconds)
+        except asyncio.CancelledError:
+            llm_calls.inc(provider=self.name, outcome="cancelled")
+            self.breaker.record_cancelled()
+            raise
+        except TimeoutError:
+            llm_calls.inc(provider=self.name, outcome="timeout")
+            self.breaker.record_failure()
+            raise TimeoutError(
+                f"{self.name} did not answer within {self.timeout_seconds} seconds"
+            )
+        except Exception:
+            llm_calls.inc(provider=self.name, outcome="failure")
+            self.breaker.record_failure()
+            raise
+
+        self.latencies.append(time.perf_counter() - start_time)
+        llm_calls.inc(provider=self.name, outcome="success")
+        self.breaker.record_success()
+        return result
+
+    def hedge_delay(self, percentile: float, default_seconds: float, min_seconds: float):
+        """
+        Time after which a call is slower than usual, from the recent latencies.
+        """
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return max(default_seconds, min_seconds)
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return max(ordered[index], min_seconds)
+
+
+class LLMProviderPool:
+    """
+    Calls the first available provider, failing over and hedging to the others.
+
+    Providers are tried in order, skipping the ones with an open circuit. A failed
+    or timed out call moves on to the next provider right away. A call slower than
+    the `hedge_percentile` latency of its provider is hedged: the next provider is
+    called too, and the first answer wins. At most `max_attempts` calls are made,
+    cycling through the providers. The pool can be used like the chain it wraps.
+    """
+
+    def __init__(
+        self,
+        providers: list,
+        max_attempts: int = LLM_MAX_ATTEMPTS,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_delay_seconds: float = LLM_HEDGE_DELAY_SECONDS,
+        hedge_min_delay_seconds: float = LLM_HEDGE_MIN_DELAY_SECONDS,
+    ):
+        self.providers = providers
+        self.max_attempts = max_attempts
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+
+    async def ainvoke(self, inputs: dict):
+        attempts = 0
+        pending = {}
+        last_error = None
+
+        def next_provider():
+            # The next provider in turn that accepts calls, None if there is none
+            for i in range(len(self.providers)):
+                provider = self.providers[(attempts + i) % len(self.providers)]
+                if provider.breaker.allow():
+                    return provider
+            return None
+
+        def start(provider):
+            nonlocal attempts
+            attempts += 1
+            pending[asyncio.create_task(provider.call(inputs))] = provider
+
+        provider = next_provider()
+        if provider is None:
+            raise NoProviderAvailableError("The circuits of all LLM providers are open")
+        start(provider)
+
+        try:
+            while pending:
+                # Hedge to another provider once the calls are slower than usual
+                timeout = None
+                if self.hedge_enabled and attempts < self.max_attempts:
+                    timeout = min(
+                        pending_provider.hedge_delay(
+                            self.hedge_percentile,
+                            self.hedge_delay_seconds,
+                            self.hedge_min_delay_seconds,
+                        )
+                        for pending_provider in pending.values()
+                    )
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    provider = next_provider()
+                    if provider is not None and provider not in pending.values():
+                        llm_hedges.inc()
+                        start(provider)
+                        continue
+
+                    # Nothing else to hedge to, wait for the pending calls
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    failed_provider = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logging.warning(f"LLM call to {failed_provider.name} failed: {last_error!r}")
+
+                # Fail over right away when no call is left
+                if not pending and attempts < self.max_attempts:
+                    provider = next_provider()
+                    if provider is not None:
+                        start(provider)
+        finally:
+            # Drop the calls that lost the race
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    def stats(self):
+        return {
+            provider.name: {
+                "circuit": provider.breaker.state,
+                "circuit_trips": provider.breaker.trips,
+                "samples": len(provider.latencies),
+                "hedge_delay_seconds": provider.hedge_delay(
+                    self.hedge_percentile,
+                    self.hedge_delay_seconds,
+                    self.hedge_min_delay_seconds,
+                ),
+            }
+            for provider in self.providers
+        }
+
+
+# Expose the circuit states, 1 when the circuit of a provider is open
+CallbackMetric(
+    "localize_llm_circuit_open",
+    "Whether the circuit of the LLM provider is open.",
+    "gauge",
+    lambda: [
+        ({"provider": name}, float(provider.breaker.state != "closed"))
+        for name, provider in provider_registry.items()
+    ],
+)
+CallbackMetric(
+    "localize_llm_circuit_trips_total",
+    "Times the circuit of the LLM provider opened.",
+    "counter",
+    lambda: [
+        ({"provider": name}, provider.breaker.trips)
+        for name, provider in provider_registry.items()
+    ],
+)
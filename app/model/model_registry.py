@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from app.model.llm_provider_pool import LLM_CALL_TIMEOUT_SECONDS
+
+# Load the environment variables
+load_dotenv()
+
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "clip-ViT-L-14")
+CLIP_TOKENIZER_NAME = os.getenv("CLIP_TOKENIZER_NAME", "openai/clip-vit-large-patch14")
+
+# Directory of the downloaded models, and whether to only load them from there
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR") or None
+MODEL_OFFLINE = os.getenv("MODEL_OFFLINE", "false").lower() == "true"
+
+# CLIP inference backend, "torch" for full precision or "quantized" for int8 on CPU
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+
+# CLIP device, "auto" uses the GPU when there is one
+CLIP_DEVICE = os.getenv("CLIP_DEVICE", "auto")
+
+# LLM providers in the order they are tried, the first configured one is the primary
+LLM_PROVIDERS = [
+    name.strip() for name in os.getenv("LLM_PROVIDERS", "bedrock,groq").split(",") if name.strip()
+]
+
+# Models loaded so far, by name
+models = {}
+models_lock = threading.RLock()
+
+
+def get_or_load(name: str, loader):
+    """
+    Get a model by name, loading it once on first use.
+    """
+    model = models.get(name)
+    if model is None:
+        with models_lock:
+            model = models.get(name)
+            if model is None:
+                start_time = time.time()
+                model = loader()
+                models[name] = model
+                logging.info(f"Loaded {name} in {time.time() - start_time:.2f} seconds")
+    return model
+
+
+def resolve_device(device: str = CLIP_DEVICE, backend: str = CLIP_BACKEND):
+    """
+    Resolve the device of the CLIP model, the quantized backend only runs on CPU.
+    """
+    if backend == "quantized":
+        if device not in ("auto", "cpu"):
+            logging.warning(f"The quantized CLIP backend runs on cpu, not {device}")
+        return "cpu"
+    if device != "auto":
+        return device
+
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def load_clip_model(backend: str = CLIP_BACKEND, device: str = CLIP_DEVICE):
+    """
+    Load the CLIP model with the given backend.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(
+        CLIP_MODEL_NAME,
+        device=resolve_device(device, backend),
+        cache_folder=MODEL_CACHE_DIR,
+        local_files_only=MODEL_OFFLINE,
+    )
+    model.eval()
+
+    if backend == "quantized":
+        import torch
+
+        # Quantize the weights of the linear layers to int8, activations are
+        # quantized on the fly, so the model needs no calibration data
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    elif backend != "torch":
+        raise ValueError(f"Unknown CLIP backend: {backend}")
+
+    return model
+
+
+def get_clip_model():
+    """
+    Get the CLIP model used for the text and image embeddings.
+    """
+    return get_or_load("clip_model", load_clip_model)
+
+
+def get_clip_tokenizer():
+    """
+    Get the tokenizer used to truncate texts to the CLIP context length.
+    """
+
+    def load():
+        from transformers import CLIPTokenizer
+
+        return CLIPTokenizer.from_pretrained(
+            CLIP_TOKENIZER_NAME,
+            cache_dir=MODEL_CACHE_DIR,
+            local_files_only=MODEL_OFFLINE,
+        )
+
+    return get_or_load("clip_tokenizer", load)
+
+
+def load_bedrock_llm():
+    from botocore.config import Config
+    from langchain_aws import ChatBedrock
+
+    return ChatBedrock(
+        region_name="ap-south-1",
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        model_id="meta.llama3-70b-instruct-v1:0",
+        temperature=0.5,
+        max_tokens=1000,
+        verbose=True,
+        # The provider pool retries on the other provider, within its own deadline
+        config=Config(
+            connect_timeout=LLM_CALL_TIMEOUT_SECONDS,
+            read_timeout=LLM_CALL_TIMEOUT_SECONDS,
+            retries={"total_max_attempts": 1, "mode": "standard"},
+        ),
+    )
+
+
+def load_groq_llm():
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model="llama-3.2-90b-vision-preview",
+        temperature=1.5,
+        max_tokens=None,
+        timeout=LLM_CALL_TIMEOUT_SECONDS,
+        max_retries=0,
+        api_key=os.getenv("GROQ_API_KEY"),
+    )
+
+
+def get_keyword_llms():
+    """
+    Get the LLMs used to generate the search keywords, by provider in `LLM_PROVIDERS` order.
+
+    Bedrock needs the AWS keys and Groq its API key, Groq is used when neither is set.
+    """
+    configured = {
+        "bedrock": (
+            os.getenv("AWS_SECRET_ACCESS_KEY") is not None
+            and os.getenv("AWS_ACCESS_KEY_ID") is not None
+        ),
+        "groq": os.getenv("GROQ_API_KEY") is not None,
+    }
+    loaders = {"bedrock": load_bedrock_llm, "groq": load_groq_llm}
+
+    names = [name for name in LLM_PROVIDERS if configured.get(name)] or ["groq"]
+    return {name: get_or_load(f"keyword_llm_{name}", loaders[name]) for name in names}
+
+
+def warm_up_models(llm: bool = True):
+    """
+    Load the models ahead of the first request.
+    """
+    get_clip_tokenizer()
+    get_clip_model()
+    if llm:
+        get_keyword_llms()
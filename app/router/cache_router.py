@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from app.cache.ttl_cache import get_cache_stats
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def get_stats():
+    return get_cache_stats()
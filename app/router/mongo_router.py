@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from app.database.mongo_connection import mongo
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def get_stats():
+    return mongo.stats()
@@ -1,11 +1,78 @@
-from fastapi import APIRouter, Depends
+import re
 
-from app.dto.search_dto import SearchParam
-from app.controller.places_controller import PlacesController
+import orjson
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.dto.search_dto import ImageSearchParam, SearchParam
+from app.helper.image_fetcher import image_fetcher
+from app.helper.image_upload import read_image_upload
+from app.controller.places_controller import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_STALE_SECONDS,
+    RESPONSE_CACHE_TTL_SECONDS,
+    PlacesController,
+)
 
 router = APIRouter()
 places_controller = PlacesController()
 
+# Lets clients and CDNs reuse the responses for as long as the response cache does
+CACHE_CONTROL = (
+    f"public, max-age={int(RESPONSE_CACHE_TTL_SECONDS)}, "
+    f"stale-while-revalidate={int(RESPONSE_CACHE_STALE_SECONDS)}"
+    if RESPONSE_CACHE_ENABLED
+    else "no-store"
+)
+
+# Entity tags of an If-None-Match header, weak or strong, or "*"
+ENTITY_TAG_PATTERN = re.compile(r'(W/)?("[^"]*")|(\*)')
+
+
+def etag_matches(if_none_match: str, etag: str):
+    """
+    Whether an If-None-Match header matches the ETag, with the weak comparison.
+    """
+    for _, opaque_tag, wildcard in ENTITY_TAG_PATTERN.findall(if_none_match):
+        if wildcard or opaque_tag == etag.removeprefix("W/"):
+            return True
+    return False
+
+
 @router.get("")
-async def get_places(params: SearchParam = Depends()):
-    return places_controller.get_places(params)
\ No newline at end of file
+async def get_places(request: Request, params: SearchParam = Depends()):
+    body, etag, cache_state = await places_controller.get_cached_places(params)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "X-Cache": cache_state}
+
+    # The client already has this response
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/stream")
+async def stream_places(request: Request, params: SearchParam = Depends()):
+    events = places_controller.stream_places(params)
+
+    # Server-sent events for EventSource clients, newline delimited JSON otherwise
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def encode_events():
+        async for event, data in events:
+            if sse:
+                yield f"event: {event}\ndata: ".encode() + orjson.dumps(data, default=str) + b"\n\n"
+            else:
+                yield orjson.dumps({"event": event, "data": data}, default=str) + b"\n"
+
+    return StreamingResponse(
+        encode_events(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/search/image")
+async def search_by_image(request: Request, params: ImageSearchParam = Depends()):
+    # Read the upload in memory, bounded like the downloaded images
+    content, image = await read_image_upload(request, image_fetcher.max_bytes)
+    return await places_controller.get_places_by_image(params, image, len(content))
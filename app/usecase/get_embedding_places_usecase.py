@@ -1,56 +1,107 @@
+import asyncio
+import logging
 import os
 
+import numpy as np
 from dotenv import load_dotenv
-from pymongo import MongoClient
 
-from app.model.clip_model import clip_model, clip_tokenizer
+from app.cache.ttl_cache import TTLCache
+from app.metrics.metrics import span
+from app.model.batch_encoder import BatchEncoder
+from app.model.clip_model import run_in_clip_executor
+from app.model.model_registry import get_clip_model, get_clip_tokenizer
+from app.vectorstore.vector_store import vector_store
 
 # Load the environment variables
 load_dotenv()
 
-# MongoDB client setup
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("MONGO_DB_NAME")]
-embedding_collection = db[os.getenv("MONGO_PLACE_EMBEDDINGS_COLLECTION")]
+# Weight applied to image scores in the combined search
+IMAGE_SCORE_WEIGHT = 1.25
 
+# "single" runs the combined search in one vector search, "split" in one per type
+COMBINED_SEARCH_MODE = os.getenv("COMBINED_SEARCH_MODE", "single")
 
-def search_text_places(search_phrase, limit=20):
+# Cache of the CLIP text embeddings by truncated text, shared by the text searches
+text_embedding_cache = TTLCache(
+    "text_embedding",
+    max_size=int(os.getenv("TEXT_EMBEDDING_CACHE_MAX_SIZE", "5000")),
+    ttl_seconds=float(os.getenv("TEXT_EMBEDDING_CACHE_TTL_SECONDS", "inf")),
+)
+
+# Embeddings are stored as compact arrays, float16 halves the memory of float32
+text_embedding_cache_dtype = np.dtype(os.getenv("TEXT_EMBEDDING_CACHE_DTYPE", "float32"))
+
+
+def truncate_search_phrase(search_phrase):
     """
-    Search for places based on a search phrase.
+    Truncate the search phrase to the CLIP context length.
     """
+    clip_tokenizer = get_clip_tokenizer()
     tokens = clip_tokenizer.encode(
         search_phrase, truncation=True, max_length=77, add_special_tokens=True
     )
-    truncated_text = clip_tokenizer.decode(tokens, skip_special_tokens=True)
+    return clip_tokenizer.decode(tokens, skip_special_tokens=True)
 
-    # Encode the search phrase into a vector
-    emb = clip_model.encode(truncated_text, convert_to_tensor=True)
 
-    # Search for text embeddings
-    results = embedding_collection.aggregate(
-        [
-            {
-                "$vectorSearch": {
-                    "index": "default",
-                    "path": "embedding",
-                    "queryVector": emb.tolist(),
-                    "numCandidates": limit * 5,
-                    "limit": limit * 2,
-                    "filter": {"type": "text"},
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "content": 1,
-                    "type": 1,
-                    "place_id": 1,
-                    "score": {"$meta": "vectorSearchScore"},
-                }
-            },
-        ]
+def _encode_texts(texts):
+    return get_clip_model().encode(texts, convert_to_numpy=True).astype(
+        text_embedding_cache_dtype
     )
 
+
+# Encodes the search phrases of concurrent requests in batches
+text_encoder = BatchEncoder(_encode_texts)
+
+
+async def encode_search_phrase(search_phrase):
+    """
+    Truncate the search phrase to the CLIP context length and encode it into a vector.
+    """
+    with span("text_encoding"):
+        # Tokenize in the CLIP executor, so the event loop is not blocked
+        truncated_text = await run_in_clip_executor(truncate_search_phrase, search_phrase)
+
+        # Encode the search phrase into a vector, unless it is cached already
+        emb = await text_embedding_cache.get_or_load(
+            truncated_text, lambda: text_encoder.encode(truncated_text)
+        )
+    return emb.astype(np.float32)
+
+
+async def warm_up_text_embedding_cache(file_path):
+    """
+    Fill the text embedding cache from a file with one search phrase per line.
+    """
+    with open(file_path) as f:
+        search_phrases = [line.strip() for line in f if line.strip()]
+
+    # Encode all distinct phrases in one batch
+    truncated_texts = await run_in_clip_executor(
+        lambda: list(dict.fromkeys(map(truncate_search_phrase, search_phrases)))
+    )
+    embeddings = await run_in_clip_executor(_encode_texts, truncated_texts)
+    for truncated_text, emb in zip(truncated_texts, embeddings):
+        text_embedding_cache.set(truncated_text, emb)
+
+    logging.info(f"Warmed up the text embedding cache with {len(truncated_texts)} phrases")
+
+
+async def search_text_places(search_phrase, limit=20, query_vector=None):
+    """
+    Search for places based on a search phrase.
+
+    The query vector can be passed in when the search phrase was already encoded.
+    """
+    emb = query_vector
+    if emb is None:
+        emb = await encode_search_phrase(search_phrase)
+
+    # Search for text embeddings
+    with span("vector_search"):
+        results = await vector_store.search(
+            emb, limit=limit * 2, num_candidates=limit * 5, types=["text"]
+        )
+
     # Distinct results by place_id
     results = {doc["place_id"]: doc for doc in results}.values()
 
@@ -61,73 +112,57 @@ def search_text_places(search_phrase, limit=20):
     return results[:limit]
 
 
-def combined_search_places(search_phrase, limit=20):
+async def combined_search_places(search_phrase, limit=20, query_vector=None):
     """
     Search for places based on a search phrase, combining text and image embeddings.
+
+    The query vector can be passed in when the search phrase was already encoded.
     """
-    tokens = clip_tokenizer.encode(
-        search_phrase, truncation=True, max_length=77, add_special_tokens=True
-    )
-    truncated_text = clip_tokenizer.decode(tokens, skip_special_tokens=True)
+    emb = query_vector
+    if emb is None:
+        emb = await encode_search_phrase(search_phrase)
 
-    # Encode the search phrase into a vector
-    emb = clip_model.encode(truncated_text, convert_to_tensor=True)
+    if COMBINED_SEARCH_MODE == "split":
+        return await combined_search_split(emb, limit)
+    return await combined_search_single(emb, limit)
 
-    # Search separately for text and image embeddings
-    text_results = embedding_collection.aggregate(
-        [
-            {
-                "$vectorSearch": {
-                    "index": "default",
-                    "path": "embedding",
-                    "queryVector": emb.tolist(),
-                    "numCandidates": limit * 5,
-                    "limit": limit * 2.5,
-                    "filter": {"type": "text"},
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "content": 1,
-                    "type": 1,
-                    "place_id": 1,
-                    "score": {"$meta": "vectorSearchScore"},
-                }
-            },
-        ]
-    )
 
-    image_results = embedding_collection.aggregate(
-        [
-            {
-                "$vectorSearch": {
-                    "index": "default",
-                    "path": "embedding",
-                    "queryVector": emb.tolist(),
-                    "numCandidates": limit * 5,
-                    "limit": limit * 2.5,
-                    "filter": {"type": "image"},
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "content": 1,
-                    "type": 1,
-                    "place_id": 1,
-                    "score": {"$meta": "vectorSearchScore"},
-                }
-            },
-        ]
-    )
+async def combined_search_single(emb, limit=20):
+    """
+    Search text and image embeddings in a single vector search.
 
-    # Apply a multiplier to image scores to give them more weight
-    text_results = list(text_results)
-    image_results = list(image_results)
+    Image scores are weighted and the results are made distinct by place by the
+    vector store, so only the top `limit` embeddings are returned.
+    """
+    with span("vector_search"):
+        return await vector_store.search(
+            emb,
+            limit=limit * 5,
+            num_candidates=limit * 10,
+            types=["text", "image"],
+            type_weights={"image": IMAGE_SCORE_WEIGHT},
+            distinct_limit=limit,
+        )
+
+
+async def combined_search_split(emb, limit=20):
+    """
+    Search text and image embeddings in two vector searches and combine them locally.
+    """
+    # Search separately for text and image embeddings
+    with span("vector_search"):
+        text_results, image_results = await asyncio.gather(
+            vector_store.search(
+                emb, limit=int(limit * 2.5), num_candidates=limit * 5, types=["text"]
+            ),
+            vector_store.search(
+                emb, limit=int(limit * 2.5), num_candidates=limit * 5, types=["image"]
+            ),
+        )
 
+    # Apply a multiplier to image scores to give them more weight
     for result in image_results:
-        result["score"] *= 1.25
+        result["score"] *= IMAGE_SCORE_WEIGHT
 
     # Combine results
     combined_results = text_results + image_results
@@ -140,3 +175,18 @@ def combined_search_places(search_phrase, limit=20):
 
     # Limit the number of results
     return combined_results[:limit]
+
+
+def merge_search_results(*results, limit=20):
+    """
+    Merge several search results, keeping the best score for each place.
+    """
+    merged = {}
+    for result in results:
+        for doc in result:
+            current = merged.get(doc["place_id"])
+            if current is None or doc["score"] > current["score"]:
+                merged[doc["place_id"]] = doc
+
+    # Sort the merged results by score and limit the number of results
+    return sorted(merged.values(), key=lambda x: x["score"], reverse=True)[:limit]
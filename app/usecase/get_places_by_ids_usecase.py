@@ -1,49 +1,167 @@
 # Load the environment variables
+import copy
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
 
+from app.cache.ttl_cache import TTLCache
+from app.database.mongo_connection import mongo
+from app.metrics.metrics import CallbackMetric, span
+from app.usecase.add_place_thumbail_usecase import add_places_thumbnail
+from app.dto.search_dto import ResponseProfile
 from app.helper.object_id_converter import convert_object_id_to_str
+from app.watchers.collection_watcher import watch_collection
 
 load_dotenv()
 
-# MongoDB client setup
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("MONGO_DB_NAME")]
-places_collection = db[os.getenv("MONGO_PLACES_COLLECTION")]
+# MongoDB collection, from the shared client
+places_collection = mongo.collection(os.getenv("MONGO_PLACES_COLLECTION"))
 
+# Number of image URLs returned per place in the compact profile
+COMPACT_IMAGE_LIMIT = int(os.getenv("COMPACT_IMAGE_LIMIT", "5"))
 
-def get_places_by_ids(embeddings: list):
+# Fields returned per response profile, None returns the whole document
+PLACE_PROJECTIONS = {
+    ResponseProfile.compact: {
+        "title": 1,
+        "categories": 1,
+        "address": 1,
+        "review_count": 1,
+        "review_rating": 1,
+        "price_range": 1,
+        "latitude": 1,
+        "longtitude": 1,
+        "images": {"$slice": COMPACT_IMAGE_LIMIT},
+    },
+    ResponseProfile.full: None,
+}
+
+# Cache of the place documents by profile and id, invalidated by the change stream
+place_cache = TTLCache(
+    "place",
+    max_size=int(os.getenv("PLACE_CACHE_MAX_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("PLACE_CACHE_TTL_SECONDS", "3600")),
+)
+
+# Number of invalidations so far, a query that overlaps one is not cached
+place_cache_invalidations = 0
+
+CallbackMetric(
+    "localize_place_cache_invalidations_total",
+    "Place cache invalidations from the change stream.",
+    "counter",
+    lambda: [({}, place_cache_invalidations)],
+)
+
+
+async def invalidate_place(change: dict):
     """
-    Get places by their IDs from the database.
+    Remove a changed place from the cache.
     """
-    ids = [place["place_id"] for place in embeddings]
+    global place_cache_invalidations
+    place_cache_invalidations += 1
 
-    # Find the places based on the provided IDs
-    places = places_collection.aggregate(
-        [
-            {
-                "$match": {
-                    "_id": {"$in": ids},
-                },
-            },
-            {
-                "$addFields": {
-                    "index": {"$indexOfArray": [ids, "$_id"]},
-                },
-            },
-            {
-                "$sort": {
-                    "index": 1,
-                },
-            },
-        ]
+    # Events without a document, like a dropped collection, invalidate all places
+    if "documentKey" not in change:
+        place_cache.clear()
+        return
+    for profile in ResponseProfile:
+        place_cache.delete((profile, change["documentKey"]["_id"]))
+
+
+async def clear_place_cache():
+    global place_cache_invalidations
+    place_cache_invalidations += 1
+    place_cache.clear()
+
+
+async def watch_place_changes():
+    """
+    Invalidate the cached places from the change stream of the places collection.
+    """
+    await watch_collection(
+        places_collection,
+        invalidate_place,
+        pipeline=[{"$project": {"operationType": 1, "documentKey": 1}}],
+        on_history_lost=clear_place_cache,
     )
 
-    # Add score to the places
-    places = list(convert_object_id_to_str(places))
-    for i, place in enumerate(places):
-        place["score"] = embeddings[i]["score"]
 
-    # Convert the ObjectIds to strings
+async def find_places(ids: list, profile: ResponseProfile):
+    """
+    Get the place documents by id, querying only the ones missing from the cache.
+    """
+    places = {}
+    missing = []
+    for id in ids:
+        place = place_cache.get((profile, id))
+        if place is None:
+            missing.append(id)
+        else:
+            places[id] = place
+
+    if missing:
+        invalidations = place_cache_invalidations
+
+        # Find the missing places in one query
+        cursor = places_collection.find(
+            {"_id": {"$in": missing}}, PLACE_PROJECTIONS[profile]
+        )
+        with span("place_lookup"):
+            documents = await cursor.to_list()
+        for place in documents:
+            id = place["_id"]
+            places[id] = convert_object_id_to_str(place)
+            if invalidations == place_cache_invalidations:
+                place_cache.set((profile, id), places[id])
+
+    # Copy the places, so the response changes do not reach the cache
+    return {id: copy.deepcopy(place) for id, place in places.items()}
+
+
+async def get_places_by_ids(
+    embeddings: list, profile: ResponseProfile = ResponseProfile.full
+):
+    """
+    Get places by their IDs from the database, in the order of the embeddings.
+
+    Each place is scored with its best scored embedding.
+    """
+    scores = {}
+    for embedding in embeddings:
+        place_id = embedding["place_id"]
+        scores[place_id] = max(scores.get(place_id, embedding["score"]), embedding["score"])
+
+    # Find the places based on the provided IDs
+    places_by_id = await find_places(list(scores), profile)
+
+    # Reorder the places and add their score, skipping the missing ones
+    places = []
+    for place_id, score in scores.items():
+        place = places_by_id.get(place_id)
+        if place is not None:
+            place["score"] = score
+            places.append(place)
+
     return places
+
+
+async def get_places_in_batches(
+    embeddings: list, profile: ResponseProfile, batch_size: int | None = None
+):
+    """
+    Get the places of the embeddings with their thumbnails, `batch_size` places at a time.
+
+    The batches are in the order of the embeddings, all places are in one batch
+    without a batch size.
+    """
+    place_ids = list(dict.fromkeys(embedding["place_id"] for embedding in embeddings))
+    batch_size = batch_size or max(1, len(place_ids))
+    for i in range(0, len(place_ids), batch_size):
+        batch_ids = set(place_ids[i : i + batch_size])
+        batch = [embedding for embedding in embeddings if embedding["place_id"] in batch_ids]
+
+        # Add thumbnail URLs to the places if available from embeddings
+        places = await get_places_by_ids(batch, profile)
+        with span("thumbnail_merge"):
+            places = add_places_thumbnail(batch, places)
+        yield places
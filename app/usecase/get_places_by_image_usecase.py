@@ -1,57 +1,73 @@
-from io import BytesIO
 import os
-import requests
 
-from PIL import Image
 from dotenv import load_dotenv
-from pymongo import MongoClient
 
-from app.model.clip_model import clip_model
+from app.cache.ttl_cache import TTLCache
+from app.helper.image_fetcher import decode_image, image_fetcher
+from app.metrics.metrics import span
+from app.model.batch_encoder import BatchEncoder
+from app.model.clip_model import run_in_clip_executor
+from app.model.model_registry import get_clip_model
+from app.vectorstore.vector_store import vector_store
 
 # Load the environment variables
 load_dotenv()
 
-# MongoDB client setup
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("MONGO_DB_NAME")]
-embedding_collection = db[os.getenv("MONGO_PLACE_EMBEDDINGS_COLLECTION")]
+
+def encode_images(images: list):
+    """
+    Encode the decoded images into vectors.
+    """
+    return get_clip_model().encode(images, convert_to_numpy=True)
+
+
+# Encodes the images of concurrent requests in batches
+image_encoder = BatchEncoder(encode_images)
 
 
-def image_vector_search(image_url, limit=20):
+async def encode_image_bytes(content: bytes):
+    """
+    Decode an image and encode it together with the images of concurrent requests.
+
+    The image is decoded before it joins a batch, so a corrupt image only fails
+    its own request.
+    """
+    image = await run_in_clip_executor(decode_image, content)
+    return await image_encoder.encode(image)
+
+# Cache of the image embeddings by URL, so the next pages of a search skip the download
+image_embedding_cache = TTLCache(
+    "image_embedding",
+    max_size=int(os.getenv("IMAGE_EMBEDDING_CACHE_MAX_SIZE", "1000")),
+    ttl_seconds=float(os.getenv("IMAGE_EMBEDDING_CACHE_TTL_SECONDS", "3600")),
+)
+
+
+async def image_vector_search(image_url, limit=20):
     """
     Search for places based on an image URL.
     """
-    response = requests.get(image_url)
-    response.raise_for_status()  # Ensure the request was successful
-    image = Image.open(BytesIO(response.content))
-    emb = clip_model.encode(
-        image,
-        convert_to_tensor=True,
-        device="cpu",
-    )
-    cursor = embedding_collection.aggregate(
-        [
-            {
-                "$vectorSearch": {
-                    "index": "default",
-                    "path": "embedding",
-                    "queryVector": emb.tolist(),
-                    "numCandidates": 100,
-                    "limit": limit,
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "content": 1,
-                    "type": 1,
-                    "place_id": 1,
-                    "score": {
-                        "$meta": "vectorSearchScore",
-                    },
-                }
-            },
-        ]
-    )
-
-    return list(cursor)
+
+    async def load():
+        with span("image_fetch"):
+            content = await image_fetcher.afetch(image_url)
+        with span("image_encoding"):
+            return await encode_image_bytes(content)
+
+    emb = await image_embedding_cache.get_or_load(image_url, load)
+    with span("vector_search"):
+        return await vector_store.search(
+            emb, limit=limit, num_candidates=max(100, limit * 2)
+        )
+
+
+async def image_content_vector_search(image, limit=20):
+    """
+    Search for places based on a decoded image.
+    """
+    with span("image_encoding"):
+        emb = await image_encoder.encode(image)
+    with span("vector_search"):
+        return await vector_store.search(
+            emb, limit=limit, num_candidates=max(100, limit * 2)
+        )
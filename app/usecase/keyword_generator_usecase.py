@@ -1,12 +1,19 @@
+import logging
 import os
 
 from dotenv import load_dotenv
-from langchain_aws import ChatBedrock
-from langchain_groq import ChatGroq
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel, Field
 
+from app.cache.ttl_cache import MongoCacheStore, TTLCache
+from app.database.mongo_connection import mongo
+from app.metrics.metrics import Counter, span
+from app.helper.query_classifier import keyword_with_category
+from app.model.llm_provider_pool import LLMProvider, LLMProviderPool
+from app.model.model_registry import get_keyword_llms, get_or_load
+from app.usecase.query_router_usecase import route_query
+
 # Load the environment variables
 load_dotenv()
 
@@ -21,30 +28,38 @@ class KeywordGeneratorResponse(BaseModel):
         description="Whether the keyword is for an image search"
     )
 
-# Sometimes the bedrock is not available, so we use the groq API
-if (
-    os.getenv("AWS_SECRET_ACCESS_KEY") is not None
-    and os.getenv("AWS_ACCESS_KEY_ID") is not None
-):
-    llm = ChatBedrock(
-        region_name="ap-south-1",
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        model_id="meta.llama3-70b-instruct-v1:0",
-        temperature=0.5,
-        max_tokens=1000,
-        verbose=True,
-    )
-else:
-    llm = ChatGroq(
-        model="llama-3.2-90b-vision-preview",
-        temperature=1.5,
-        max_tokens=None,
-        timeout=None,
-        max_retries=2,
-        api_key=os.getenv("GROQ_API_KEY"),
+
+llm_failures = Counter(
+    "localize_llm_failures_total", "Keyword generations that failed on all LLM providers."
+)
+
+# Optionally persist the generated keywords, so the cache survives restarts
+keyword_cache_store = None
+if os.getenv("MONGO_KEYWORD_CACHE_COLLECTION"):
+    keyword_cache_store = MongoCacheStore(
+        mongo.collection(os.getenv("MONGO_KEYWORD_CACHE_COLLECTION")),
+        serialize=lambda response: response.model_dump(),
+        deserialize=KeywordGeneratorResponse.model_validate,
     )
 
+# Cache of the generated keywords by normalized search phrase and category
+keyword_cache = TTLCache(
+    "keyword",
+    max_size=int(os.getenv("KEYWORD_CACHE_MAX_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("KEYWORD_CACHE_TTL_SECONDS", "86400")),
+    store=keyword_cache_store,
+)
+
+
+def keyword_cache_key(search_phrase, category=None):
+    """
+    Build the keyword cache key from the normalized search phrase and category.
+    """
+    search_phrase = " ".join(search_phrase.lower().split())
+    category = getattr(category, "value", category) or ""
+    return f"{search_phrase}|{category}"
+
+
 # Define the system prompt
 system_prompt = """
 Given the following parameters, generate a JSON object with fields `keyword` and `is_image_search` optimized for vector search to find a specific type of place in a database:
@@ -72,30 +87,71 @@ prompt = PromptTemplate(
     input_variables=["q", "category"],
 )
 
-# Define the keyword generator chain
-keyword_generator_chain = (
-    {
-        "q": RunnablePassthrough(),
-        "category": RunnablePassthrough(),
-    }
-    | prompt
-    | llm.with_structured_output(KeywordGeneratorResponse)
-)
+
+def build_keyword_generator_chain(llm):
+    return (
+        {
+            "q": RunnablePassthrough(),
+            "category": RunnablePassthrough(),
+        }
+        | prompt
+        | llm.with_structured_output(KeywordGeneratorResponse)
+    )
+
+
+def get_keyword_generator_chain():
+    """
+    Get the keyword generator chain, building it and its LLMs on first use.
+
+    The chain is a pool with one chain per LLM provider, which fails over and
+    hedges between them.
+    """
+    return get_or_load(
+        "keyword_generator_chain",
+        lambda: LLMProviderPool(
+            [
+                LLMProvider(name, build_keyword_generator_chain(llm))
+                for name, llm in get_keyword_llms().items()
+            ]
+        ),
+    )
 
 
 # Generate a keyword string based on the search phrase and category
-def generate_keyword(search_phrase, category=None) -> KeywordGeneratorResponse:
+async def generate_keyword(search_phrase, category=None) -> KeywordGeneratorResponse:
     """
     Generate a keyword string based on the search phrase and category.
+
+    The LLM results are cached on the normalized search phrase and category, and
+    concurrent identical queries share a single LLM call. On a cache miss, confident
+    queries are answered by the query router without the LLM.
+    """
+    key = keyword_cache_key(search_phrase, category)
+    with span("keyword_generation"):
+        # A cached keyword is served without running the router
+        if keyword_cache.state(key) == "miss":
+            is_image_search = await route_query(search_phrase)
+            if is_image_search is not None:
+                return KeywordGeneratorResponse(
+                    keyword=keyword_with_category(search_phrase, category),
+                    is_image_search=is_image_search,
+                )
+
+        response = await keyword_cache.get_or_load(
+            key, lambda: invoke_keyword_generator(search_phrase, category)
+        )
+
+    # Copy the cached response, so callers cannot modify the cache entry
+    return response.model_copy()
+
+
+async def invoke_keyword_generator(search_phrase, category=None) -> KeywordGeneratorResponse:
+    """
+    Run the keyword generator chain, the provider pool retries on the other providers.
     """
-    retries = 3
-    for attempt in range(retries):
-        try:
-            # Run the keyword generator chain
-            return keyword_generator_chain.invoke({"q": search_phrase, "category": category})
-        except Exception as e:
-            if attempt < retries - 1:
-                print(f"Attempt {attempt + 1} failed: {e}. Retrying...")
-            else:
-                print(f"Attempt {attempt + 1} failed: {e}. No more retries left.")
-                raise
+    try:
+        return await get_keyword_generator_chain().ainvoke({"q": search_phrase, "category": category})
+    except Exception as e:
+        llm_failures.inc()
+        logging.warning(f"Keyword generation failed on all LLM providers: {e!r}")
+        raise
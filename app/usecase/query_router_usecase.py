@@ -0,0 +1,108 @@
+import os
+from difflib import SequenceMatcher
+
+from dotenv import load_dotenv
+
+from app.helper.query_classifier import classify_query
+from app.metrics.metrics import CallbackMetric, Counter
+from app.usecase.get_embedding_places_usecase import encode_search_phrase
+from app.vectorstore.vector_store import vector_store
+
+# Load the environment variables
+load_dotenv()
+
+# Answer the confident queries locally instead of asking the LLM
+QUERY_ROUTER_ENABLED = os.getenv("QUERY_ROUTER_ENABLED", "true").lower() == "true"
+
+# Confidence from which a local answer is used, below it the LLM decides
+QUERY_ROUTER_MIN_CONFIDENCE = float(os.getenv("QUERY_ROUTER_MIN_CONFIDENCE", "0.8"))
+
+# Compare the uncertain queries with the titles of their nearest places
+QUERY_ROUTER_TITLE_MATCH = os.getenv("QUERY_ROUTER_TITLE_MATCH", "true").lower() == "true"
+
+# Routes taken by the keyword generation
+query_routes = Counter(
+    "localize_query_routes_total",
+    "Keyword generations by route, rules or title_match skip the LLM.",
+    labelnames=("route",),
+)
+
+
+def llm_bypass_ratio():
+    """
+    Share of the keyword generations answered without the LLM.
+    """
+    local = query_routes.value(route="rules") + query_routes.value(route="title_match")
+    total = local + query_routes.value(route="llm")
+    return local / total if total else 0.0
+
+
+CallbackMetric(
+    "localize_llm_bypass_ratio",
+    "Share of the keyword generations answered without the LLM.",
+    "gauge",
+    lambda: [({}, llm_bypass_ratio())],
+)
+
+
+def is_name_prefix(query: str, title: str):
+    """
+    Whether the query starts the title on a word boundary and makes up at least half
+    of it, like the name of a chain without its branch.
+    """
+    return (
+        title.startswith(query)
+        and title[len(query):len(query) + 1] in ("", " ")
+        and len(query) * 2 >= len(title)
+    )
+
+
+async def match_place_title(search_phrase: str, candidates: int = 5):
+    """
+    Get the similarity between the query and the title of its nearest places.
+
+    The nearest text embeddings are found with CLIP, their titles are compared with
+    the query as text, so only a near exact name, or the start of a name like a chain
+    without its branch, matches.
+    """
+    emb = await encode_search_phrase(search_phrase)
+    results = await vector_store.search(
+        emb, limit=candidates, num_candidates=candidates * 10, types=["text"]
+    )
+
+    query = " ".join(search_phrase.lower().split())
+    best = 0.0
+    for result in results:
+        content = result.get("content") or ""
+        if not content.startswith("title: "):
+            continue
+        title = " ".join(content[len("title: "):].split(";")[0].lower().split())
+        similarity = SequenceMatcher(None, query, title).ratio()
+        if is_name_prefix(query, title):
+            similarity = max(similarity, 0.9)
+        best = max(best, similarity)
+    return best
+
+
+async def route_query(search_phrase: str):
+    """
+    Decide whether a query is an image search without the LLM, when confident enough.
+
+    Returns `is_image_search`, or None when the query has to go to the LLM.
+    """
+    if QUERY_ROUTER_ENABLED:
+        is_image_search, confidence = classify_query(search_phrase)
+        if is_image_search is not None and confidence >= QUERY_ROUTER_MIN_CONFIDENCE:
+            query_routes.inc(route="rules")
+            return is_image_search
+
+        # The name of a known place, written in any case
+        if (
+            QUERY_ROUTER_TITLE_MATCH
+            and await match_place_title(search_phrase) >= QUERY_ROUTER_MIN_CONFIDENCE
+        ):
+            query_routes.inc(route="title_match")
+            return False
+
+    query_routes.inc(route="llm")
+    return None
@@ -0,0 +1,65 @@
+from app.vectorstore.base_vector_store import VectorStore
+
+
+class AtlasVectorStore(VectorStore):
+    """
+    Vector store backed by the MongoDB Atlas `$vectorSearch` stage.
+    """
+
+    def __init__(self, collection, index: str = "default"):
+        self.collection = collection
+        self.index = index
+
+    async def search(
+        self,
+        query_vector,
+        limit: int,
+        num_candidates: int,
+        types: list | None = None,
+        type_weights: dict | None = None,
+        distinct_limit: int | None = None,
+    ) -> list:
+        vector_search = {
+            "index": self.index,
+            "path": "embedding",
+            "queryVector": query_vector.tolist(),
+            "numCandidates": num_candidates,
+            "limit": limit,
+        }
+        if types is not None:
+            vector_search["filter"] = (
+                {"type": types[0]} if len(types) == 1 else {"type": {"$in": types}}
+            )
+
+        # Apply a multiplier to the scores of the weighted types
+        score = {"$meta": "vectorSearchScore"}
+        for type, weight in (type_weights or {}).items():
+            score = {
+                "$multiply": [score, {"$cond": [{"$eq": ["$type", type]}, weight, 1]}]
+            }
+
+        pipeline = [
+            {"$vectorSearch": vector_search},
+            {
+                "$project": {
+                    "_id": 1,
+                    "content": 1,
+                    "type": 1,
+                    "place_id": 1,
+                    "score": score,
+                }
+            },
+        ]
+
+        if distinct_limit is not None:
+            # Distinct results by place_id, keeping the best scored embedding
+            pipeline += [
+                {"$sort": {"score": -1}},
+                {"$group": {"_id": "$place_id", "doc": {"$first": "$$ROOT"}}},
+                {"$replaceRoot": {"newRoot": "$doc"}},
+                {"$sort": {"score": -1}},
+                {"$limit": distinct_limit},
+            ]
+
+        cursor = await self.collection.aggregate(pipeline)
+        return await cursor.to_list()
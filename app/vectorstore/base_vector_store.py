@@ -0,0 +1,38 @@
+from abc import ABC, abstractmethod
+
+
+class VectorStore(ABC):
+    """
+    Nearest neighbour search over the place embeddings.
+
+    Results are embedding documents with `_id`, `content`, `type`, `place_id` and
+    `score`, where the score matches the Atlas cosine `vectorSearchScore`.
+    """
+
+    async def start(self):
+        """
+        Prepare the store when the application starts.
+        """
+
+    async def close(self):
+        """
+        Release the store when the application stops.
+        """
+
+    @abstractmethod
+    async def search(
+        self,
+        query_vector,
+        limit: int,
+        num_candidates: int,
+        types: list | None = None,
+        type_weights: dict | None = None,
+        distinct_limit: int | None = None,
+    ) -> list:
+        """
+        Search the `limit` nearest embeddings, optionally filtered by `types`.
+
+        Scores are multiplied by `type_weights` for their type. When `distinct_limit`
+        is set, the results are made distinct by place, keeping the best scored
+        embedding, sorted by score and cut to `distinct_limit`.
+        """
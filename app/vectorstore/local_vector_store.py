@@ -0,0 +1,368 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+from bson import json_util
+
+from app.vectorstore.base_vector_store import VectorStore
+from app.watchers.collection_watcher import current_operation_time, watch_collection
+
+# Number of embeddings read from the collection per batch while building
+BUILD_BATCH_SIZE = 1024
+
+
+def normalize(vectors):
+    """
+    Normalize vectors to unit length, so the dot product is the cosine similarity.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def train_ivf_centroids(vectors, nlist: int, iterations: int = 10, sample_size: int = 65536):
+    """
+    Train the inverted file centroids with spherical k-means on a sample of the vectors.
+    """
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+
+        # Keep the previous centroid for the empty clusters
+        centroids = np.where(counts[:, None] > 0, normalize(sums), centroids)
+
+    return centroids
+
+
+def assign_ivf_lists(vectors, centroids, chunk_size: int = 8192):
+    """
+    Assign every vector to its nearest centroid.
+    """
+    return np.concatenate(
+        [
+            np.argmax(vectors[i : i + chunk_size] @ centroids.T, axis=1)
+            for i in range(0, len(vectors), chunk_size)
+        ]
+    )
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store over a snapshot of the embeddings collection.
+
+    The snapshot is a memory-mapped float16 matrix with its rows grouped by an
+    inverted file (IVF) index, so a search only scores the lists closest to the
+    query. Changes after the snapshot are applied from the collection's change
+    stream: new embeddings go to a small in-memory delta searched exhaustively,
+    and removed ones are masked out.
+    """
+
+    def __init__(self, collection, path: str, nprobe: int = 8):
+        self.collection = collection
+        self.path = path
+        self.nprobe = nprobe
+        self._watch_task = None
+        self._set_snapshot(
+            vectors=np.zeros((0, 0), dtype=np.float16),
+            centroids=None,
+            offsets=np.zeros(1, dtype=np.int64),
+            type_codes=np.zeros(0, dtype=np.uint8),
+            metadata={"ids": [], "place_ids": [], "contents": [], "type_names": []},
+        )
+
+    async def start(self):
+        if not self.load_snapshot():
+            await self.build_snapshot()
+
+        self._watch_task = asyncio.create_task(
+            watch_collection(
+                self.collection,
+                self.apply_change,
+                full_document="updateLookup",
+                start_at_operation_time=self.operation_time,
+                on_history_lost=self.build_snapshot,
+            )
+        )
+
+    async def close(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+
+    async def build_snapshot(self):
+        """
+        Build the snapshot from the embeddings collection and load it.
+        """
+        start_time = time.time()
+
+        # Changes after this time are replayed from the change stream
+        operation_time = await current_operation_time(self.collection)
+
+        ids, place_ids, contents, types, batches, batch = [], [], [], [], [], []
+        cursor = self.collection.find(
+            {}, {"embedding": 1, "type": 1, "place_id": 1, "content": 1}
+        )
+        async for doc in cursor:
+            if not doc.get("embedding"):
+                continue
+            ids.append(str(doc["_id"]))
+            place_ids.append(doc["place_id"])
+            contents.append(doc.get("content"))
+            types.append(doc.get("type"))
+            batch.append(doc["embedding"])
+            if len(batch) == BUILD_BATCH_SIZE:
+                batches.append(np.asarray(batch, dtype=np.float32))
+                batch = []
+        if batch:
+            batches.append(np.asarray(batch, dtype=np.float32))
+
+        metadata = {
+            "ids": ids,
+            "place_ids": place_ids,
+            "contents": contents,
+            "types": types,
+            "operation_time": operation_time,
+        }
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.write_snapshot, batches, metadata
+        )
+        self.load_snapshot()
+        logging.info(
+            f"Built the local vector store with {len(ids)} embeddings "
+            f"in {time.time() - start_time:.2f} seconds"
+        )
+
+    def write_snapshot(self, batches: list, metadata: dict):
+        """
+        Train the IVF index and write the snapshot files, replacing the previous ones.
+        """
+        vectors = normalize(np.concatenate(batches)) if batches else np.zeros((0, 0))
+
+        # Group the rows by IVF list, so every list is a contiguous slice
+        nlist = max(1, min(4096, int(np.sqrt(len(vectors)))))
+        if len(vectors) >= 1000:
+            centroids = train_ivf_centroids(vectors, nlist)
+            assignments = assign_ivf_lists(vectors, centroids)
+        else:
+            centroids = None
+            assignments = np.zeros(len(vectors), dtype=np.int64)
+            nlist = 1
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+
+        type_names = sorted(set(metadata["types"]), key=str)
+        type_codes = np.array(
+            [type_names.index(type) for type in metadata["types"]], dtype=np.uint8
+        )
+
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        vectors[order].astype(np.float16).tofile(os.path.join(tmp_path, "embeddings.f16"))
+        np.savez(
+            os.path.join(tmp_path, "index.npz"),
+            centroids=centroids if centroids is not None else np.zeros((0, 0)),
+            offsets=offsets,
+            type_codes=type_codes[order],
+        )
+        with open(os.path.join(tmp_path, "metadata.json"), "w") as f:
+            f.write(
+                json_util.dumps(
+                    {
+                        "ids": [metadata["ids"][i] for i in order],
+                        "place_ids": [metadata["place_ids"][i] for i in order],
+                        "contents": [metadata["contents"][i] for i in order],
+                        "type_names": type_names,
+                        "dimensions": vectors.shape[1] if len(vectors) else 0,
+                        "operation_time": metadata["operation_time"],
+                    }
+                )
+            )
+
+        # Swap the snapshot directory, mapped files stay readable until released
+        old_path = f"{self.path}.old-{os.getpid()}"
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def load_snapshot(self):
+        """
+        Load the snapshot files, returning False if there is no snapshot.
+        """
+        try:
+            with open(os.path.join(self.path, "metadata.json")) as f:
+                metadata = json_util.loads(f.read())
+            index = np.load(os.path.join(self.path, "index.npz"))
+        except FileNotFoundError:
+            return False
+
+        rows, dimensions = len(metadata["ids"]), metadata["dimensions"]
+        vectors = (
+            np.memmap(
+                os.path.join(self.path, "embeddings.f16"),
+                dtype=np.float16,
+                mode="r",
+                shape=(rows, dimensions),
+            )
+            if rows
+            else np.zeros((0, dimensions), dtype=np.float16)
+        )
+        self._set_snapshot(
+            vectors=vectors,
+            centroids=index["centroids"] if index["centroids"].size else None,
+            offsets=index["offsets"],
+            type_codes=index["type_codes"],
+            metadata=metadata,
+        )
+        logging.info(f"Loaded the local vector store with {rows} embeddings")
+        return True
+
+    def _set_snapshot(self, vectors, centroids, offsets, type_codes, metadata):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.type_codes = type_codes
+        self.ids = metadata["ids"]
+        self.place_ids = metadata["place_ids"]
+        self.contents = metadata["contents"]
+        self.type_names = list(metadata["type_names"])
+        self.operation_time = metadata.get("operation_time")
+        self.row_by_id = {id: row for row, id in enumerate(self.ids)}
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+
+        # Embeddings added after the snapshot, by id
+        self.delta = {}
+        self._delta_matrix = None
+
+    async def apply_change(self, change: dict):
+        """
+        Apply a change of the embeddings collection to the store.
+        """
+        operation_type = change["operationType"]
+        if operation_type not in ("insert", "update", "replace", "delete"):
+            return
+
+        id = str(change["documentKey"]["_id"])
+        self.delta.pop(id, None)
+        if id in self.row_by_id:
+            self.deleted[self.row_by_id[id]] = True
+        self._delta_matrix = None
+
+        doc = change.get("fullDocument")
+        if operation_type != "delete" and doc and doc.get("embedding"):
+            self.delta[id] = {
+                "vector": normalize(np.asarray(doc["embedding"], dtype=np.float32)),
+                "place_id": doc["place_id"],
+                "content": doc.get("content"),
+                "type": doc.get("type"),
+            }
+
+    async def search(
+        self,
+        query_vector,
+        limit: int,
+        num_candidates: int,
+        types: list | None = None,
+        type_weights: dict | None = None,
+        distinct_limit: int | None = None,
+    ) -> list:
+        query_vector = normalize(np.asarray(query_vector, dtype=np.float32))
+        hits = self._search_snapshot(query_vector, limit, num_candidates, types)
+        hits += self._search_delta(query_vector, types)
+
+        # Keep the nearest embeddings, scored like the Atlas cosine similarity
+        hits = sorted(hits, key=lambda hit: hit["score"], reverse=True)[:limit]
+        for hit in hits:
+            hit["score"] = (1 + hit["score"]) / 2 * (type_weights or {}).get(hit["type"], 1)
+
+        if distinct_limit is not None:
+            # Distinct results by place_id, keeping the best scored embedding
+            distinct = {}
+            for hit in sorted(hits, key=lambda hit: hit["score"], reverse=True):
+                distinct.setdefault(hit["place_id"], hit)
+            hits = list(distinct.values())[:distinct_limit]
+
+        return hits
+
+    def _search_snapshot(self, query_vector, limit: int, num_candidates: int, types):
+        if not len(self.ids):
+            return []
+
+        type_codes = None
+        if types is not None:
+            type_codes = [self.type_names.index(t) for t in types if t in self.type_names]
+
+        # Probe the nearest lists until enough candidates were scored
+        lists = (
+            np.argsort(-(self.centroids @ query_vector))
+            if self.centroids is not None
+            else [0]
+        )
+        rows, scores = [], []
+        candidates = 0
+        for probe, ivf_list in enumerate(lists):
+            start, end = self.offsets[ivf_list], self.offsets[ivf_list + 1]
+            mask = ~self.deleted[start:end]
+            if type_codes is not None:
+                mask &= np.isin(self.type_codes[start:end], type_codes)
+            if mask.any():
+                list_rows = np.arange(start, end)[mask]
+                rows.append(list_rows)
+                scores.append(self.vectors[start:end][mask].astype(np.float32) @ query_vector)
+                candidates += len(list_rows)
+            if probe + 1 >= self.nprobe and candidates >= num_candidates:
+                break
+
+        if not rows:
+            return []
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        top = np.argsort(-scores)[:limit]
+        return [
+            {
+                "_id": self.ids[rows[i]],
+                "content": self.contents[rows[i]],
+                "type": self.type_names[self.type_codes[rows[i]]],
+                "place_id": self.place_ids[rows[i]],
+                "score": float(scores[i]),
+            }
+            for i in top
+        ]
+
+    def _search_delta(self, query_vector, types):
+        if not self.delta:
+            return []
+
+        if self._delta_matrix is None:
+            self._delta_ids = list(self.delta)
+            self._delta_matrix = np.stack([self.delta[id]["vector"] for id in self._delta_ids])
+        scores = self._delta_matrix @ query_vector
+
+        return [
+            {
+                "_id": id,
+                "content": self.delta[id]["content"],
+                "type": self.delta[id]["type"],
+                "place_id": self.delta[id]["place_id"],
+                "score": float(score),
+            }
+            for id, score in zip(self._delta_ids, scores)
+            if types is None or self.delta[id]["type"] in types
+        ]
+
+
+if __name__ == "__main__":
+    # Build the snapshot ahead of time, so the workers only have to load it
+    from app.vectorstore.vector_store import embedding_collection
+
+    logging.basicConfig(level=logging.INFO)
+    store = LocalVectorStore(
+        embedding_collection, path=os.getenv("LOCAL_VECTOR_STORE_PATH", "data/vector_store")
+    )
+    asyncio.run(store.build_snapshot())
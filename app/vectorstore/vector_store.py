@@ -0,0 +1,34 @@
+import os
+
+from dotenv import load_dotenv
+
+from app.database.mongo_connection import mongo
+from app.vectorstore.atlas_vector_store import AtlasVectorStore
+from app.vectorstore.local_vector_store import LocalVectorStore
+
+# Load the environment variables
+load_dotenv()
+
+# MongoDB collection, from the shared client with the vector search read preference
+embedding_collection = mongo.vector_search_collection(
+    os.getenv("MONGO_PLACE_EMBEDDINGS_COLLECTION")
+)
+
+
+def create_vector_store():
+    """
+    Create the vector store selected by the `VECTOR_STORE_BACKEND` variable.
+    """
+    backend = os.getenv("VECTOR_STORE_BACKEND", "atlas")
+    if backend == "atlas":
+        return AtlasVectorStore(embedding_collection)
+    if backend == "local":
+        return LocalVectorStore(
+            embedding_collection,
+            path=os.getenv("LOCAL_VECTOR_STORE_PATH", "data/vector_store"),
+            nprobe=int(os.getenv("LOCAL_VECTOR_STORE_NPROBE", "8")),
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+vector_store = create_vector_store()
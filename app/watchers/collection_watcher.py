@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from pymongo.errors import OperationFailure
+
+# Change stream errors after which the stream cannot be resumed
+CHANGE_STREAM_FATAL_ERRORS = (
+    280,  # ChangeStreamFatalError
+    286,  # ChangeStreamHistoryLost
+)
+
+
+async def current_operation_time(collection):
+    """
+    Get the operation time of the cluster, to start a change stream from it.
+    """
+    return (await collection.database.command("hello")).get("operationTime")
+
+
+async def watch_collection(
+    collection,
+    handle_change,
+    pipeline=None,
+    full_document=None,
+    start_at_operation_time=None,
+    on_history_lost=None,
+    retry_seconds: float = 5,
+):
+    """
+    Watch the change stream of a collection and pass every change to `handle_change`.
+
+    The stream is resumed from the last processed change after an error. When the
+    change history is lost, `on_history_lost` is awaited and the stream restarts
+    from the cluster time read before it, so no change made meanwhile is missed.
+    """
+    resume_token = None
+    while True:
+        try:
+            options = (
+                {"resume_after": resume_token}
+                if resume_token is not None
+                else {"start_at_operation_time": start_at_operation_time}
+            )
+            async with await collection.watch(
+                pipeline, full_document=full_document, **options
+            ) as change_stream:
+                async for change in change_stream:
+                    await handle_change(change)
+                    resume_token = change_stream.resume_token
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            logging.error(f"Change stream on {collection.name} failed: {e}")
+            if e.code in CHANGE_STREAM_FATAL_ERRORS:
+                resume_token = None
+                try:
+                    start_at_operation_time = await current_operation_time(collection)
+                except Exception as e:
+                    logging.error(f"Failed to read the cluster time: {e}")
+                    start_at_operation_time = None
+                if on_history_lost is not None:
+                    await on_history_lost()
+            await asyncio.sleep(retry_seconds)
+        except Exception as e:
+            logging.error(f"Change stream on {collection.name} failed: {e}")
+            await asyncio.sleep(retry_seconds)
@@ -1,51 +1,128 @@
+import logging
 import os
-import requests
 
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from PIL import Image
-from io import BytesIO
+from pymongo import ReplaceOne
 
-from sentence_transformers import SentenceTransformer
-from transformers import CLIPTokenizer
-
-clip_model = SentenceTransformer("clip-ViT-L-14")
-clip_tokenizer = CLIPTokenizer.from_pretrained("openai/clip-vit-large-patch14")
+from app.cache.embedding_store import create_embedding_store
+from app.database.mongo_connection import create_sync_client
+from app.helper.document_id import document_id
+from app.helper.image_fetcher import (
+    IMAGE_DECODE_ERRORS,
+    decode_image,
+    image_fetcher,
+    is_permanent_download_error,
+)
+from app.model.model_registry import (
+    CLIP_BACKEND,
+    CLIP_MODEL_NAME,
+    get_clip_model,
+    get_clip_tokenizer,
+)
 
 # Load the environment variables
 load_dotenv()
 
 # MongoDB client setup
-client = MongoClient(os.getenv("MONGO_URI"))
+client = create_sync_client()
 db = client[os.getenv("MONGO_DB_NAME")]
 embedding_collection = db[os.getenv("MONGO_PLACE_EMBEDDINGS_COLLECTION")]
 place_reviews_collection = db[os.getenv("MONGO_PLACES_REVIEWS_COLLECTION")]
+watcher_state_collection = db[os.getenv("MONGO_WATCHER_STATE_COLLECTION", "watcher_state")]
+
+# Embeddings by content hash, shared with the seed ingester
+embedding_store = create_embedding_store(db, CLIP_MODEL_NAME, CLIP_BACKEND)
+
+# Pool for the image downloads of a batch
+download_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("WATCHER_DOWNLOAD_WORKERS", "8"))
+)
+
+
+def encode_texts(texts):
+    clip_tokenizer = get_clip_tokenizer()
+    truncated_texts = []
+    for text in texts:
+        tokens = clip_tokenizer.encode(
+            text, truncation=True, max_length=77, add_special_tokens=True
+        )
+
+        # Decode the tokens, so the text matches the model's expected input length
+        truncated_texts.append(clip_tokenizer.decode(tokens, skip_special_tokens=True))
+
+    # Encode the truncated texts
+    return get_clip_model().encode(truncated_texts).tolist()
+
+
+def try_decode_image(content):
+    try:
+        return decode_image(content)
+    except IMAGE_DECODE_ERRORS as e:
+        logging.warning(f"Skipping undecodable image: {e}")
+        return None
+
+
+def encode_images(contents):
+    """
+    Encode the images, with None for the ones that cannot be decoded.
+    """
+    images = [try_decode_image(content) for content in contents]
+    decoded = [image for image in images if image is not None]
+
+    # Generate the embeddings
+    embeddings = iter(get_clip_model().encode(decoded).tolist() if decoded else [])
+    return [None if image is None else next(embeddings) for image in images]
+
+
+def download_image(image_url):
+    # Fetch the image bytes from the URL
+    return image_fetcher.fetch(image_url)
 
 
 def generate_text_embedding(text):
-    tokens = clip_tokenizer.encode(
-        text, truncation=True, max_length=77, add_special_tokens=True
-    )
-    tokens = tokens[
-        :77
-    ]  # Ensure the token length matches the model's expected input length
+    return embedding_store.encode([embedding_store.text_key(text)], [text], encode_texts)[0]
+
 
-    # Encode the truncated text
-    return clip_model.encode(tokens, convert_to_tensor=True).tolist()
+def generate_image_embeddings(image_urls, skip_failed_downloads: bool = False):
+    """
+    Generate the embeddings of the image URLs, downloading the unknown ones concurrently.
+
+    Images that are missing, too large or undecodable are skipped, other download
+    errors are raised, unless `skip_failed_downloads` skips them too.
+    """
+    embeddings = embedding_store.get_by_urls(image_urls)
 
+    def download(image_url):
+        try:
+            return image_url, download_image(image_url)
+        except Exception as e:
+            if not (skip_failed_downloads or is_permanent_download_error(e)):
+                raise
+            logging.warning(f"Skipping image {image_url}: {e}")
+            return image_url, None
 
-def generate_image_embedding(image_url):
-    # Fetch the image from the URL
-    response = requests.get(image_url)
-    response.raise_for_status()  # Ensure the request was successful
-    image = Image.open(BytesIO(response.content))
+    missing = [url for url in image_urls if url not in embeddings]
+    downloaded = [
+        (url, content)
+        for url, content in download_executor.map(download, missing)
+        if content is not None
+    ]
+    if downloaded:
+        urls, contents = zip(*downloaded)
+        new_embeddings = embedding_store.encode(
+            [embedding_store.image_key(content) for content in contents],
+            list(contents),
+            encode_images,
+            urls=list(urls),
+        )
+        embeddings.update(
+            (url, embedding)
+            for url, embedding in zip(urls, new_embeddings)
+            if embedding is not None
+        )
 
-    # Generate the embedding
-    return clip_model.encode(
-        image,
-        convert_to_tensor=True,
-        device="cuda",
-    ).tolist()
+    return embeddings
 
 
 # place_id
@@ -57,30 +134,76 @@ def insert_vector(data: dict):
     """
     Insert the vector into the MongoDB collection.
     """
-    try:
-        review_text = f"review: {data['review']}; rating: {data['rating']}"
-        text_embedding = generate_text_embedding(review_text)
-        embedding_collection.insert_one(
-            {
-                "place_id": data["place_id"],
-                "type": "review_text",
-                "content": review_text,
-                "embedding": text_embedding,
-            }
-        )
-    except Exception as e:
-        print(f"Error generating text embedding: {e}")
+    return insert_vectors([data])
 
-    try:
-        for image_url in data["images"]:
-            image_embedding = generate_image_embedding(image_url)
-            embedding_collection.insert_one(
-                {
-                    "place_id": data["place_id"],
-                    "type": "image",
-                    "content": image_url,
-                    "embedding": image_embedding,
-                }
-            )
-    except Exception as e:
-        print(f"Error generating image embedding: {e}")
+
+def review_text(review: dict):
+    return f"review: {review['review']}; rating: {review['rating']}"
+
+
+def insert_vectors(reviews: list, skip_failed_downloads: bool = False):
+    """
+    Insert the vectors of a batch of reviews into the MongoDB collection.
+
+    Texts and images are encoded in batches and the embeddings are upserted with
+    deterministic ids, so a replayed batch does not create duplicates. Malformed
+    reviews and missing or undecodable images are logged and skipped. Other errors,
+    like an encoder, download or write failure, are raised, so the batch is retried.
+    With `skip_failed_downloads`, every image that fails to download is skipped.
+    Returns the number of embeddings written.
+    """
+    # Skip the malformed reviews, they would fail every retry of the batch
+    valid_reviews = []
+    for review in reviews:
+        try:
+            image_urls = list(dict.fromkeys(review["images"] or []))
+            valid_reviews.append((review["place_id"], review_text(review), image_urls))
+        except (KeyError, TypeError) as e:
+            logging.error(f"Skipping malformed review {review.get('_id')}: {e!r}")
+
+    review_texts = [text for _, text, _ in valid_reviews]
+    text_embeddings = embedding_store.encode(
+        [embedding_store.text_key(text) for text in review_texts],
+        review_texts,
+        encode_texts,
+    )
+    docs = [
+        {
+            "place_id": place_id,
+            "type": "review_text",
+            "content": text,
+            "embedding": embedding,
+        }
+        for (place_id, text, _), embedding in zip(valid_reviews, text_embeddings)
+    ]
+
+    # Distinct image URLs of the batch
+    image_embeddings = generate_image_embeddings(
+        list(dict.fromkeys(url for _, _, urls in valid_reviews for url in urls)),
+        skip_failed_downloads=skip_failed_downloads,
+    )
+    for place_id, _, image_urls in valid_reviews:
+        for image_url in image_urls:
+            if image_url in image_embeddings:
+                docs.append(
+                    {
+                        "place_id": place_id,
+                        "type": "image",
+                        "content": image_url,
+                        "embedding": image_embeddings[image_url],
+                    }
+                )
+
+    if docs:
+        embedding_collection.bulk_write(
+            [
+                ReplaceOne(
+                    {"_id": document_id(doc["place_id"], doc["type"], doc["content"])},
+                    doc,
+                    upsert=True,
+                )
+                for doc in docs
+            ],
+            ordered=False,
+        )
+    return len(docs)
@@ -1,25 +1,188 @@
-from bson.json_util import dumps
-from event_logic import (
-    insert_vector,
+import logging
+import os
+import threading
+import time
+from queue import Empty, Queue
+
+from pymongo.errors import OperationFailure
+
+from app.watchers.collection_watcher import CHANGE_STREAM_FATAL_ERRORS
+from app.watchers.event_logic import (
+    insert_vectors,
     place_reviews_collection,
+    watcher_state_collection,
 )
 
+# Reviews are embedded in batches of up to this size...
+WATCHER_BATCH_SIZE = int(os.getenv("WATCHER_BATCH_SIZE", "32"))
 
-def watch_events():
+# ...or of the reviews received within this window
+WATCHER_BATCH_WINDOW_SECONDS = float(os.getenv("WATCHER_BATCH_WINDOW_SECONDS", "2"))
+
+# The change stream is not read further while this many reviews wait to be embedded
+WATCHER_QUEUE_SIZE = int(os.getenv("WATCHER_QUEUE_SIZE", "256"))
+
+# Attempts of a batch before the images that still fail to download are skipped
+WATCHER_DOWNLOAD_ATTEMPTS = int(os.getenv("WATCHER_DOWNLOAD_ATTEMPTS", "3"))
+
+# Seconds between the attempts of a failed batch
+WATCHER_RETRY_SECONDS = float(os.getenv("WATCHER_RETRY_SECONDS", "5"))
+
+STATE_ID = "place_reviews_watcher"
+
+
+class WatcherMetrics:
     """
-    Watch the change stream for the place reviews collection.
+    Throughput and lag of the embedded reviews.
     """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.reviews = 0
+        self.embeddings = 0
+
+    def record(self, batch: list, embeddings: int, batch_start_time: float):
+        self.reviews += len(batch)
+        self.embeddings += embeddings
+
+        # Lag between the insert of each review and the write of its embeddings
+        now = time.time()
+        lags = [now - change["clusterTime"].time for change in batch]
+        elapsed = now - self.start_time
+        logging.info(
+            f"Embedded {len(batch)} reviews ({embeddings} embeddings) "
+            f"in {now - batch_start_time:.2f} seconds, "
+            f"lag avg {sum(lags) / len(lags):.2f}s max {max(lags):.2f}s, "
+            f"throughput {self.reviews / elapsed:.2f} reviews/s "
+            f"{self.embeddings / elapsed:.2f} embeddings/s"
+        )
+
+
+def load_resume_token():
+    state = watcher_state_collection.find_one({"_id": STATE_ID})
+    return state["resume_token"] if state else None
+
+
+def save_resume_token(resume_token):
+    watcher_state_collection.replace_one(
+        {"_id": STATE_ID}, {"resume_token": resume_token}, upsert=True
+    )
+
+
+def current_operation_time(collection):
+    """
+    Get the operation time of the cluster, to start a change stream from it.
+    """
+    return collection.database.command("hello").get("operationTime")
+
+
+def read_changes(queue: Queue, resume_token):
+    """
+    Read the inserts of the place reviews change stream into the queue.
+
+    The queue is bounded, so reading blocks while the encoder is behind. When the
+    change history after the resume token is lost, the stream restarts from the
+    current cluster time and the reviews inserted meanwhile are not embedded.
+    """
+    start_at_operation_time = None
+    while True:
+        try:
+            options = (
+                {"resume_after": resume_token}
+                if resume_token is not None
+                else {"start_at_operation_time": start_at_operation_time}
+            )
+            with place_reviews_collection.watch(
+                [{"$match": {"operationType": "insert"}}],
+                max_await_time_ms=1000,
+                **options,
+            ) as change_stream:
+                for change in change_stream:
+                    queue.put(change)
+                    resume_token = change["_id"]
+        except OperationFailure as e:
+            logging.error(f"Change stream on the place reviews failed: {e}")
+            if e.code in CHANGE_STREAM_FATAL_ERRORS:
+                try:
+                    start_at_operation_time = current_operation_time(place_reviews_collection)
+                except Exception as e:
+                    logging.error(f"Failed to read the cluster time: {e}")
+                    start_at_operation_time = None
+                logging.critical(
+                    f"The change stream cannot resume after {resume_token}, the watcher "
+                    f"was down for longer than the oplog window. Restarting from "
+                    f"{start_at_operation_time}, the reviews inserted in between are "
+                    f"not embedded."
+                )
+                resume_token = None
+            time.sleep(WATCHER_RETRY_SECONDS)
+        except Exception as e:
+            logging.error(f"Change stream on the place reviews failed: {e}")
+            time.sleep(WATCHER_RETRY_SECONDS)
+
+
+def next_batch(queue: Queue):
+    """
+    Wait for the next batch of changes, by count or time window.
+    """
+    batch = [queue.get()]
+    deadline = time.time() + WATCHER_BATCH_WINDOW_SECONDS
+    while len(batch) < WATCHER_BATCH_SIZE:
+        try:
+            batch.append(queue.get(timeout=max(0, deadline - time.time())))
+        except Empty:
+            break
+    return batch
+
+
+def embed_batch(batch: list):
+    """
+    Embed a batch of changes, retrying until its embeddings are written.
+
+    After `WATCHER_DOWNLOAD_ATTEMPTS` failed attempts, the images that still fail to
+    download are skipped, so an unreachable image host does not stop the watcher.
+    Encoder and write failures are retried until they succeed.
+    """
+    reviews = [change["fullDocument"] for change in batch]
+    attempt = 0
     while True:
+        attempt += 1
+        skip_failed_downloads = attempt > WATCHER_DOWNLOAD_ATTEMPTS
+        if attempt == WATCHER_DOWNLOAD_ATTEMPTS + 1:
+            logging.error(
+                f"Skipping the images of the batch that still fail to download "
+                f"after {WATCHER_DOWNLOAD_ATTEMPTS} attempts"
+            )
         try:
-            change_stream = place_reviews_collection.watch()
-            for change in change_stream:
-                # Insert the vector into the collection
-                if change["operationType"] == "insert":
-                    insert_vector(change["fullDocument"])
-                print(dumps(change))
+            return insert_vectors(reviews, skip_failed_downloads=skip_failed_downloads)
         except Exception as e:
-            print(f"Error occurred: {e}")
+            logging.error(f"Failed to embed a batch of {len(batch)} reviews, retrying: {e}")
+            time.sleep(WATCHER_RETRY_SECONDS)
+
+
+def watch_events():
+    """
+    Watch the change stream for the place reviews collection.
+
+    Inserted reviews are embedded in micro-batches, and the resume token of the last
+    embedded review is saved, so a restart continues where the watcher stopped.
+    """
+    queue = Queue(maxsize=WATCHER_QUEUE_SIZE)
+    threading.Thread(
+        target=read_changes, args=(queue, load_resume_token()), daemon=True
+    ).start()
+
+    metrics = WatcherMetrics()
+    while True:
+        batch = next_batch(queue)
+        batch_start_time = time.time()
+
+        # The resume token only advances past a batch whose embeddings are written
+        embeddings = embed_batch(batch)
+        save_resume_token(batch[-1]["_id"])
+        metrics.record(batch, embeddings, batch_start_time)
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     watch_events()
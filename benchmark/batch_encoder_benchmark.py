@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from app.model.batch_encoder import BatchEncoder
+from benchmark.load_benchmark import percentile
+
+
+def synthetic_encoder(layers: int, dimensions: int, overhead_ms: float):
+    """
+    Encoder with a fixed cost per call and a stack of matrix multiplications per item.
+    """
+    rng = np.random.default_rng(0)
+    weights = [
+        rng.standard_normal((dimensions, dimensions)).astype(np.float32) / np.sqrt(dimensions)
+        for _ in range(layers)
+    ]
+
+    def encode_batch(items):
+        # Per call overhead of the model, like tokenization and framework dispatch
+        time.sleep(overhead_ms / 1000)
+        x = np.stack([rng.standard_normal(dimensions).astype(np.float32) for _ in items])
+        for weight in weights:
+            x = np.maximum(x @ weight, 0)
+        return list(x)
+
+    return encode_batch
+
+
+def clip_encoder():
+    """
+    Encoder with the CLIP text model, every query is a distinct phrase.
+    """
+    from app.usecase.get_embedding_places_usecase import _encode_texts
+
+    return _encode_texts
+
+
+async def run_load(encoder: BatchEncoder, total_requests: int, concurrency: int):
+    """
+    Encode `total_requests` items with `concurrency` callers in a closed loop.
+    """
+    latencies = []
+    counter = iter(range(total_requests))
+
+    async def caller():
+        for i in counter:
+            start_time = time.perf_counter()
+            await encoder.encode(f"search phrase number {i}")
+            latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "qps": total_requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_batch_size": encoder.stats()["mean_batch_size"],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the QPS and p99 latency of the batch encoder per batch window."
+    )
+    parser.add_argument("--encoder", choices=["synthetic", "clip"], default="synthetic")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--windows-ms", type=float, nargs="+", default=[0, 1, 2, 5, 10])
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--overhead-ms", type=float, default=2)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    encode_batch = (
+        clip_encoder()
+        if args.encoder == "clip"
+        else synthetic_encoder(layers=12, dimensions=768, overhead_ms=args.overhead_ms)
+    )
+
+    # Without batching, every request is encoded on its own
+    configurations = [("unbatched", 1, 0)] + [
+        (f"{window} ms", args.max_batch_size, window) for window in args.windows_ms
+    ]
+
+    results = []
+    for concurrency in args.concurrency:
+        for label, max_batch_size, window in configurations:
+            encoder = BatchEncoder(
+                encode_batch, max_batch_size=max_batch_size, max_wait_seconds=window / 1000
+            )
+            result = await run_load(encoder, args.requests, concurrency)
+            result.update({"concurrency": concurrency, "window": label})
+            results.append(result)
+            print(
+                f"concurrency {concurrency:>3} window {label:>9}: "
+                f"{result['qps']:8.1f} qps, p50 {result['p50_ms']:7.1f} ms, "
+                f"p99 {result['p99_ms']:7.1f} ms, mean batch {result['mean_batch_size']:.1f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+from app.model.model_registry import load_clip_model
+
+# Search phrases like the ones sent to the text search
+SAMPLE_TEXTS = [
+    "cozy coffee shop with outdoor seating",
+    "rooftop bar with a view of the city",
+    "quiet park to read a book",
+    "family friendly restaurant with a playground",
+    "street food market open at night",
+    "museum of modern art",
+    "beach with white sand and clear water",
+    "co-working space with fast wifi",
+    "vegetarian restaurant",
+    "bookstore with a cafe inside",
+    "karaoke for a group of friends",
+    "gym with a swimming pool",
+    "temple with traditional architecture",
+    "hiking trail with a waterfall",
+    "late night ramen",
+    "review: great service and the pizza was amazing; rating: 5",
+]
+
+
+def load_images(path: str | None, count: int = 8):
+    """
+    Load the images of a directory, or generate random ones if there is none.
+    """
+    if path:
+        names = sorted(os.listdir(path))
+        return [Image.open(os.path.join(path, name)).convert("RGB") for name in names]
+
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 256, (224, 224, 3), dtype=np.uint8))
+        for _ in range(count)
+    ]
+
+
+def cosine_similarities(reference, candidate):
+    """
+    Cosine similarity of each pair of rows.
+    """
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the CLIP embeddings of a backend against the full precision model."
+    )
+    parser.add_argument("--backend", default="quantized")
+    parser.add_argument("--images", help="Directory of images, random images if not set")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    args = parser.parse_args()
+
+    reference_model = load_clip_model(backend="torch", device="cpu")
+    candidate_model = load_clip_model(backend=args.backend, device="cpu")
+    images = load_images(args.images)
+
+    failed = False
+    for name, items in (("text", SAMPLE_TEXTS), ("image", images)):
+        reference = reference_model.encode(items, convert_to_numpy=True)
+        candidate = candidate_model.encode(items, convert_to_numpy=True)
+        similarities = cosine_similarities(reference, candidate)
+
+        # The nearest neighbours should not change between the backends
+        same_neighbours = np.mean(
+            np.argsort(-(reference @ reference.T), axis=1)[:, 1]
+            == np.argsort(-(candidate @ candidate.T), axis=1)[:, 1]
+        )
+        print(
+            f"{name}: {len(items)} items, cosine mean {similarities.mean():.4f} "
+            f"min {similarities.min():.4f}, same nearest neighbour {same_neighbours:.0%}"
+        )
+        failed |= bool(similarities.min() < args.min_cosine)
+
+    if failed:
+        print(f"Cosine similarity below {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
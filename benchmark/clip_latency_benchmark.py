@@ -0,0 +1,75 @@
+import argparse
+import resource
+import statistics
+import time
+
+import numpy as np
+
+from app.model.model_registry import load_clip_model
+from benchmark.clip_accuracy_check import SAMPLE_TEXTS, load_images
+
+
+def measure(encode, runs: int):
+    """
+    Run the encoding `runs` times after a warm up run, returning the latencies in ms.
+    """
+    encode()
+    latencies = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        encode()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return latencies
+
+
+def report(backend: str, name: str, latencies: list):
+    p95 = np.percentile(latencies, 95)
+    print(
+        f"{backend} {name}: median {statistics.median(latencies):.1f} ms "
+        f"p95 {p95:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the CLIP encoding latency on CPU.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "quantized"])
+    parser.add_argument("--images", help="Directory of images, random images if not set")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, help="Number of torch threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+
+        torch.set_num_threads(args.threads)
+
+    images = load_images(args.images, count=args.batch_size)
+    texts = (SAMPLE_TEXTS * args.batch_size)[: args.batch_size]
+
+    for backend in args.backends:
+        start_time = time.perf_counter()
+        model = load_clip_model(backend=backend, device="cpu")
+        print(f"{backend} load: {time.perf_counter() - start_time:.2f} seconds")
+
+        report(backend, "single text", measure(lambda: model.encode(texts[0]), args.runs))
+        report(backend, "single image", measure(lambda: model.encode(images[0]), args.runs))
+        report(
+            backend,
+            f"batch of {len(texts)} texts",
+            measure(lambda: model.encode(texts, batch_size=len(texts)), args.runs),
+        )
+        report(
+            backend,
+            f"batch of {len(images)} images",
+            measure(lambda: model.encode(images, batch_size=len(images)), args.runs),
+        )
+        print(
+            f"{backend} peak RSS: "
+            f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB"
+        )
+        del model
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import os
+import time
+
+import bson
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient, monitoring
+from pymongo.operations import SearchIndexModel
+
+from app.usecase import get_embedding_places_usecase
+from app.vectorstore.atlas_vector_store import AtlasVectorStore
+
+# Load the environment variables
+load_dotenv()
+
+EMBEDDING_DIMENSIONS = 768
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Count the round trips and reply bytes of the commands sent to MongoDB.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.round_trips = 0
+        self.bytes_received = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name in ("aggregate", "getMore"):
+            self.round_trips += 1
+            self.bytes_received += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+
+def random_unit_vectors(rng, count: int):
+    vectors = rng.standard_normal((count, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+async def seed_collection(collection, places: int, images_per_place: int):
+    """
+    Seed the collection with synthetic text and image embeddings and index it.
+    """
+    rng = np.random.default_rng(42)
+    await collection.drop()
+
+    docs = []
+    for place_index in range(places):
+        place_id = f"place-{place_index}"
+        vectors = random_unit_vectors(rng, 1 + images_per_place)
+        docs.append(
+            {
+                "place_id": place_id,
+                "type": "text",
+                "content": f"title: Place {place_index}",
+                "embedding": vectors[0].tolist(),
+            }
+        )
+        for image_index, vector in enumerate(vectors[1:]):
+            docs.append(
+                {
+                    "place_id": place_id,
+                    "type": "image",
+                    "content": f"https://example.com/{place_id}/{image_index}.jpg",
+                    "embedding": vector.tolist(),
+                }
+            )
+    await collection.insert_many(docs)
+
+    await collection.create_search_index(
+        SearchIndexModel(
+            definition={
+                "fields": [
+                    {
+                        "type": "vector",
+                        "path": "embedding",
+                        "numDimensions": EMBEDDING_DIMENSIONS,
+                        "similarity": "cosine",
+                    },
+                    {"type": "filter", "path": "type"},
+                ]
+            },
+            name="default",
+            type="vectorSearch",
+        )
+    )
+
+    # Wait until the index can be queried
+    while True:
+        indexes = await (await collection.list_search_indexes("default")).to_list()
+        if indexes and indexes[0].get("queryable"):
+            break
+        await asyncio.sleep(1)
+
+
+async def run_benchmark(args):
+    counter = CommandCounter()
+    client = AsyncMongoClient(args.mongo_uri, event_listeners=[counter])
+    collection = client[args.db][args.collection]
+
+    if not args.skip_seed:
+        print(f"Seeding {args.places} places into {args.db}.{args.collection}...")
+        await seed_collection(collection, args.places, args.images_per_place)
+
+    # Point the usecase at the instrumented collection
+    get_embedding_places_usecase.vector_store = AtlasVectorStore(collection)
+    query_vectors = random_unit_vectors(np.random.default_rng(7), args.queries)
+
+    for mode in ("split", "single"):
+        get_embedding_places_usecase.COMBINED_SEARCH_MODE = mode
+        counter.reset()
+        start_time = time.perf_counter()
+        for query_vector in query_vectors:
+            await get_embedding_places_usecase.combined_search_places(
+                None, limit=args.limit, query_vector=query_vector
+            )
+        elapsed = time.perf_counter() - start_time
+
+        print(
+            f"mode={mode} round_trips/query={counter.round_trips / args.queries:.2f} "
+            f"bytes/query={counter.bytes_received / args.queries:.0f} "
+            f"latency/query={elapsed / args.queries * 1000:.2f}ms"
+        )
+
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the split and single combined search against a local "
+        "MongoDB Atlas deployment (e.g. the mongodb/mongodb-atlas-local image)."
+    )
+    parser.add_argument(
+        "--mongo-uri",
+        default=os.getenv("BENCHMARK_MONGO_URI", "mongodb://localhost:27017/?directConnection=true"),
+    )
+    parser.add_argument("--db", default="benchmark")
+    parser.add_argument("--collection", default="place_embeddings")
+    parser.add_argument("--places", type=int, default=2000)
+    parser.add_argument("--images-per-place", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true")
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image
+
+from app.helper.image_fetcher import ImageFetcher, decode_image
+
+
+def generate_jpeg(width: int, height: int, seed: int):
+    """
+    Generate a photo-like JPEG, smooth gradients with some noise.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    channels = [
+        (np.sin(x * rng.uniform(2, 12) + y * rng.uniform(2, 12)) + 1) * 110
+        + rng.normal(0, 12, (height, width))
+        for _ in range(3)
+    ]
+    pixels = np.clip(np.stack(channels, axis=-1), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def serve_images(images: dict):
+    """
+    Serve the images over HTTP on a local port, with an ETag per image.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            content = images[self.path]
+            etag = f'"{hash(content)}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(content)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(name: str, urls: list, fetch_and_decode):
+    """
+    Fetch and decode every URL, reporting the latency and the decoded image size.
+    """
+    latencies = []
+    for url in urls:
+        start_time = time.perf_counter()
+        image = fetch_and_decode(url)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    pixels_mb = image.width * image.height * len(image.getbands()) / 1024 / 1024
+    print(
+        f"{name}: median {statistics.median(latencies):.1f} ms "
+        f"max {max(latencies):.1f} ms, decoded {image.size} ({pixels_mb:.1f} MB)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the full download and decode with the image fetcher on large JPEGs."
+    )
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+
+    images = {
+        f"/{i}.jpg": generate_jpeg(args.width, args.height, seed=i)
+        for i in range(args.images)
+    }
+    mean_mb = statistics.mean(map(len, images.values())) / 1024 / 1024
+    print(f"{args.images} JPEGs of {args.width}x{args.height}, {mean_mb:.1f} MB on average")
+
+    server = serve_images(images)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base_url}{path}" for path in images]
+
+    # The previous path, an untimed download and a full resolution decode
+    session = requests.Session()
+
+    def full_decode(url):
+        response = session.get(url)
+        response.raise_for_status()
+        return Image.open(BytesIO(response.content)).convert("RGB")
+
+    measure("requests + full decode", urls, full_decode)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        fetcher = ImageFetcher(
+            max_bytes=50 * 1024 * 1024,
+            connect_timeout=5,
+            read_timeout=15,
+            cache_dir=cache_dir,
+            cache_max_bytes=1024 * 1024 * 1024,
+            cache_ttl_seconds=3600,
+        )
+        measure("fetcher + draft decode", urls, lambda url: decode_image(fetcher.fetch(url)))
+        measure("disk cache + draft decode", urls, lambda url: decode_image(fetcher.fetch(url)))
+
+        # Expired entries are revalidated with their ETag instead of downloaded again
+        fetcher.cache_ttl_seconds = 0
+        measure("revalidated + draft decode", urls, lambda url: decode_image(fetcher.fetch(url)))
+        print(f"Fetcher: {fetcher.stats()}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import random
+import time
+
+from app.model.llm_provider_pool import (
+    LLM_HEDGE_DELAY_SECONDS,
+    LLM_HEDGE_PERCENTILE,
+    CircuitBreaker,
+    LLMProvider,
+    LLMProviderPool,
+    llm_hedges,
+)
+from benchmark.load_benchmark import percentile
+
+
+class FakeProviderChain:
+    """
+    Stand-in for the chain of one LLM provider, with injected slowness and failures.
+
+    A share of the calls is slow, a share fails, and during the outage window every
+    call hangs or fails, like a provider that is down or throttling.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float,
+        slow_rate: float = 0.0,
+        slow_latency_ms: float = 0.0,
+        failure_rate: float = 0.0,
+        outage: tuple | None = None,
+        outage_mode: str = "hang",
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.slow_rate = slow_rate
+        self.slow_latency_ms = slow_latency_ms
+        self.failure_rate = failure_rate
+        self.outage = outage
+        self.outage_mode = outage_mode
+        self.random = random.Random(seed)
+        self.started_at = time.monotonic()
+        self.calls = 0
+
+    async def ainvoke(self, inputs: dict):
+        self.calls += 1
+        elapsed = time.monotonic() - self.started_at
+        if self.outage and self.outage[0] <= elapsed < self.outage[1]:
+            if self.outage_mode == "hang":
+                await asyncio.Event().wait()
+            await asyncio.sleep(self.latency_ms / 1000 / 10)
+            raise RuntimeError("Service unavailable")
+
+        # Jitter the latency, with a share of the calls in the slow tail
+        latency_ms = self.latency_ms * self.random.uniform(0.8, 1.2)
+        if self.random.random() < self.slow_rate:
+            latency_ms = self.slow_latency_ms
+        await asyncio.sleep(latency_ms / 1000)
+
+        if self.random.random() < self.failure_rate:
+            raise RuntimeError("Internal server error")
+        return {"keyword": inputs["q"], "is_image_search": True}
+
+
+def build_pools(args):
+    """
+    Build the strategies to compare, with fresh providers so their state is not shared.
+    """
+    def chains():
+        primary = FakeProviderChain(
+            args.latency_ms,
+            slow_rate=args.slow_rate,
+            slow_latency_ms=args.slow_latency_ms,
+            failure_rate=args.failure_rate,
+            outage=(args.outage_start, args.outage_start + args.outage_seconds)
+            if args.outage_seconds
+            else None,
+            outage_mode=args.outage_mode,
+            seed=args.seed,
+        )
+        secondary = FakeProviderChain(
+            args.secondary_latency_ms,
+            slow_rate=args.slow_rate,
+            slow_latency_ms=args.slow_latency_ms,
+            seed=args.seed + 1,
+        )
+        return primary, secondary
+
+    # The previous behaviour, serial retries on a single provider without a circuit
+    primary, _ = chains()
+    serial = LLMProviderPool(
+        [
+            LLMProvider(
+                "serial_primary",
+                primary,
+                timeout_seconds=args.serial_timeout,
+                breaker=CircuitBreaker(float("inf"), 0),
+            )
+        ],
+        max_attempts=args.max_attempts,
+        hedge_enabled=False,
+    )
+
+    pools = {"serial": (serial, [primary])}
+    for name, hedge_enabled in (("failover", False), ("hedged", True)):
+        primary, secondary = chains()
+        pool = LLMProviderPool(
+            [
+                LLMProvider(
+                    f"{name}_primary",
+                    primary,
+                    timeout_seconds=args.timeout,
+                    breaker=CircuitBreaker(args.failure_threshold, args.reset_seconds),
+                ),
+                LLMProvider(
+                    f"{name}_secondary",
+                    secondary,
+                    timeout_seconds=args.timeout,
+                    breaker=CircuitBreaker(args.failure_threshold, args.reset_seconds),
+                ),
+            ],
+            max_attempts=args.max_attempts,
+            hedge_enabled=hedge_enabled,
+            hedge_percentile=args.hedge_percentile,
+            hedge_delay_seconds=args.hedge_delay,
+        )
+        pools[name] = (pool, [primary, secondary])
+    return pools
+
+
+async def run_strategy(pool, chains: list, total_requests: int, concurrency: int):
+    """
+    Send the keyword generations through the pool and collect their latency.
+    """
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total_requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            start_time = time.perf_counter()
+            try:
+                await pool.ainvoke({"q": f"query {i}", "category": None})
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+    # Start the outage window with the requests
+    for chain in chains:
+        chain.started_at = time.monotonic()
+    hedges_before = llm_hedges.value()
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "elapsed_seconds": elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies),
+        "errors": errors,
+        "calls": [chain.calls for chain in chains],
+        "hedges": int(llm_hedges.value() - hedges_before),
+        "circuit_trips": sum(provider.breaker.trips for provider in pool.providers),
+    }
+
+
+async def run_benchmark(args):
+    for name, (pool, chains) in build_pools(args).items():
+        result = await run_strategy(pool, chains, args.requests, args.concurrency)
+        calls = "/".join(str(calls) for calls in result["calls"])
+        print(
+            f"{name:>8}: p50={result['p50_ms']:.0f} ms p95={result['p95_ms']:.0f} ms "
+            f"p99={result['p99_ms']:.0f} ms max={result['max_ms']:.0f} ms "
+            f"errors={result['errors']} calls={calls} hedges={result['hedges']} "
+            f"circuit_trips={result['circuit_trips']} ({result['elapsed_seconds']:.1f} s)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare serial retries on one LLM provider with the provider pool, "
+        "failing over and hedging between fake providers with injected slowness."
+    )
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--secondary-latency-ms", type=float, default=250)
+    parser.add_argument(
+        "--slow-rate", type=float, default=0.05, help="Share of the calls in the slow tail"
+    )
+    parser.add_argument("--slow-latency-ms", type=float, default=3000)
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.02, help="Share of the primary calls that fail"
+    )
+    parser.add_argument(
+        "--outage-start", type=float, default=1.0, help="Seconds before the primary goes down"
+    )
+    parser.add_argument("--outage-seconds", type=float, default=2.0)
+    parser.add_argument("--outage-mode", choices=("hang", "error"), default="hang")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Deadline of one pool call")
+    parser.add_argument(
+        "--serial-timeout",
+        type=float,
+        default=10.0,
+        help="Deadline of one serial call, the provider clients used to wait up to a minute",
+    )
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--hedge-percentile", type=float, default=LLM_HEDGE_PERCENTILE)
+    parser.add_argument("--hedge-delay", type=float, default=LLM_HEDGE_DELAY_SECONDS)
+    parser.add_argument("--failure-threshold", type=int, default=5)
+    parser.add_argument("--reset-seconds", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
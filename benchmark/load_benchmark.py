@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+# Default query mix used when no query file is given
+DEFAULT_QUERIES = [
+    {"q": "coffee shop jakarta"},
+    {"q": "quiet cafe to work", "category": "work_friendly"},
+    {"q": "old dutch building restaurant", "category": "classic_vibes"},
+    {"q": "cozy place for a date", "category": "cozy_atmosphere"},
+    {"q": "Kopi Kenangan Senopati"},
+]
+
+
+def percentile(values: list, p: float):
+    """
+    Return the p-th percentile of the values using the nearest-rank method.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_load(url: str, queries: list, total_requests: int, concurrency: int):
+    """
+    Send `total_requests` searches to the endpoint with at most `concurrency` in flight.
+    """
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=120) as client:
+
+        async def send(i: int):
+            nonlocal errors
+            async with semaphore:
+                start_time = time.perf_counter()
+                try:
+                    response = await client.get(url, params=queries[i % len(queries)])
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start_time)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(total_requests)))
+        elapsed = time.perf_counter() - start_time
+
+    return {
+        "url": url,
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "latency_mean": statistics.fmean(latencies) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Concurrent load benchmark for the /v1/places search endpoint."
+    )
+    parser.add_argument("--url", default="http://localhost:8080/v1/places")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 8, 32],
+        help="One run is made per concurrency level",
+    )
+    parser.add_argument(
+        "--queries",
+        help="JSONL file with one query parameter object per line",
+    )
+    parser.add_argument("--label", default="current", help="Label stored with the results")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+
+    results = []
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_load(args.url, queries, args.requests, concurrency))
+        result["label"] = args.label
+        results.append(result)
+        print(
+            f"[{args.label}] concurrency={concurrency} "
+            f"throughput={result['throughput_rps']:.2f} req/s "
+            f"p50={result['latency_p50']:.3f}s p95={result['latency_p95']:.3f}s "
+            f"p99={result['latency_p99']:.3f}s errors={result['errors']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import os
+import time
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+
+from app.database.mongo_connection import MongoConnectionManager, PoolMetrics
+
+# Load the environment variables
+load_dotenv()
+
+# Collections read by a search, each had its own client before
+COLLECTIONS = ("place_embeddings", "places", "keyword_cache")
+
+
+async def first_burst(collections: list, concurrency: int):
+    """
+    Send the first burst of concurrent reads, like the first requests after a start.
+    """
+    start_time = time.perf_counter()
+    await asyncio.gather(
+        *(
+            collections[i % len(collections)].find_one({})
+            for i in range(concurrency * len(collections))
+        )
+    )
+    return (time.perf_counter() - start_time) * 1000
+
+
+async def separate_clients(args):
+    # One client with the default settings per module, connected on first use
+    metrics = [PoolMetrics() for _ in COLLECTIONS]
+    clients = [AsyncMongoClient(args.mongo_uri, event_listeners=[m]) for m in metrics]
+    collections = [client[args.db][name] for client, name in zip(clients, COLLECTIONS)]
+
+    burst_ms = await first_burst(collections, args.concurrency)
+    sockets = sum(m.open for m in metrics)
+    for client in clients:
+        await client.close()
+    return burst_ms, sockets, 0.0
+
+
+async def shared_client(args):
+    # The shared client, connected and warmed up by the lifespan before the requests
+    manager = MongoConnectionManager(args.mongo_uri, args.db)
+    start_time = time.perf_counter()
+    await manager.connect()
+    connect_ms = (time.perf_counter() - start_time) * 1000
+
+    collections = [manager.collection(name) for name in COLLECTIONS]
+    burst_ms = await first_burst(collections, args.concurrency)
+    sockets = manager.pool_metrics.open
+    await manager.close()
+    return burst_ms, sockets, connect_ms
+
+
+async def run_benchmark(args):
+    for name, run in (("separate clients", separate_clients), ("shared client", shared_client)):
+        burst_ms, sockets, connect_ms = await run(args)
+        print(
+            f"{name}: first burst {burst_ms:.1f} ms, open connections {sockets}, "
+            f"warm-up before the requests {connect_ms:.1f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the first request latency and the connections of one "
+        "client per module with the shared connection manager."
+    )
+    parser.add_argument(
+        "--mongo-uri",
+        default=os.getenv("BENCHMARK_MONGO_URI", "mongodb://localhost:27017/?directConnection=true"),
+    )
+    parser.add_argument("--db", default="benchmark")
+    parser.add_argument("--concurrency", type=int, default=8)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+import numpy as np
+
+from benchmark.image_fetch_benchmark import generate_jpeg, serve_images
+from benchmark.load_benchmark import DEFAULT_QUERIES, percentile
+
+EMBEDDING_DIMENSIONS = 768
+
+
+def stub_vector(data: bytes):
+    """
+    Deterministic unit vector for some bytes, so the same input gets the same embedding.
+    """
+    seed = int.from_bytes(hashlib.sha1(data).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS)
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+class ClipStub:
+    """
+    Stand-in for the CLIP model, with a fixed cost per batch and per item.
+    """
+
+    def __init__(self, batch_ms: float, item_ms: float):
+        self.batch_ms = batch_ms
+        self.item_ms = item_ms
+
+    def encode(self, inputs, convert_to_numpy=True):
+        time.sleep((self.batch_ms + self.item_ms * len(inputs)) / 1000)
+        return np.stack(
+            [
+                stub_vector(item.encode() if isinstance(item, str) else item.tobytes())
+                for item in inputs
+            ]
+        )
+
+
+class TokenizerStub:
+    """
+    Stand-in for the CLIP tokenizer, one token per word.
+    """
+
+    def encode(self, text, truncation=True, max_length=77, add_special_tokens=True):
+        return text.split()[:max_length]
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return " ".join(tokens)
+
+
+class FakeKeywordChain:
+    """
+    Stand-in for the keyword generator chain, answering after a fixed latency.
+
+    Queries with capitalized words are taken as place names, like the prompt asks.
+    """
+
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+
+    async def ainvoke(self, inputs: dict):
+        from app.usecase.keyword_generator_usecase import KeywordGeneratorResponse
+
+        await asyncio.sleep(self.latency_ms / 1000)
+        q, category = inputs["q"], inputs["category"]
+        is_place_name = any(word[:1].isupper() for word in q.split())
+        keyword = f"{q} {category.value}" if category else q
+        return KeywordGeneratorResponse(keyword=keyword, is_image_search=not is_place_name)
+
+
+class InMemoryCursor:
+    def __init__(self, docs: list, latency_ms: float):
+        self.docs = docs
+        self.latency_ms = latency_ms
+
+    async def to_list(self):
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self.docs
+
+
+class InMemoryCollection:
+    """
+    Stand-in for the places collection, supporting the `$in` finds of the place lookup.
+    """
+
+    def __init__(self, docs: list, latency_ms: float):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.latency_ms = latency_ms
+
+    def find(self, filter: dict, projection: dict | None = None):
+        docs = [
+            self.project(self.docs[id], projection)
+            for id in filter["_id"]["$in"]
+            if id in self.docs
+        ]
+        return InMemoryCursor(docs, self.latency_ms)
+
+    def project(self, doc: dict, projection: dict | None):
+        if projection is None:
+            return copy.deepcopy(doc)
+        projected = {"_id": doc["_id"]}
+        for field, value in projection.items():
+            if field not in doc:
+                continue
+            if isinstance(value, dict) and "$slice" in value:
+                projected[field] = list(doc[field][: value["$slice"]])
+            elif value:
+                projected[field] = copy.deepcopy(doc[field])
+        return projected
+
+
+def synthetic_places(places: int, images_per_place: int):
+    """
+    Generate the place documents and their text and image embeddings.
+    """
+    docs, ids, place_ids, contents, types, vectors = [], [], [], [], [], []
+    for place_index in range(places):
+        place_id = f"place-{place_index}"
+        images = [
+            f"https://example.com/{place_id}/{image_index}.jpg"
+            for image_index in range(images_per_place)
+        ]
+        docs.append(
+            {
+                "_id": place_id,
+                "title": f"Place {place_index}",
+                "categories": ["Cafe"],
+                "address": f"Street {place_index}, Jakarta",
+                "review_count": place_index % 500,
+                "review_rating": 3 + place_index % 20 / 10,
+                "price_range": "Rp 25-50rb",
+                "latitude": -6.2 + place_index * 1e-5,
+                "longtitude": 106.8 + place_index * 1e-5,
+                "description": "A synthetic place. " * 20,
+                "images": images,
+            }
+        )
+        for type, content in [("text", f"title: Place {place_index}")] + [
+            ("image", image) for image in images
+        ]:
+            ids.append(f"{place_id}-{len(ids)}")
+            place_ids.append(place_id)
+            contents.append(content)
+            types.append(type)
+            vectors.append(stub_vector(content.encode()))
+
+    metadata = {
+        "ids": ids,
+        "place_ids": place_ids,
+        "contents": contents,
+        "types": types,
+        "operation_time": None,
+    }
+    return docs, np.stack(vectors), metadata
+
+
+def load_app(args, store_path: str):
+    """
+    Import the app with the local vector store and register the stand-ins.
+
+    The modules read their settings at import, so the variables are set first.
+    """
+    os.environ["VECTOR_STORE_BACKEND"] = "local"
+    os.environ["LOCAL_VECTOR_STORE_PATH"] = store_path
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.response_cache else "false"
+    os.environ["MONGO_KEYWORD_CACHE_COLLECTION"] = ""
+    os.environ.setdefault("MONGO_DB_NAME", "benchmark")
+    for name in ("PLACES", "PLACE_EMBEDDINGS", "PLACES_REVIEWS"):
+        os.environ.setdefault(f"MONGO_{name}_COLLECTION", name.lower())
+
+    from app.main import app
+    from app.model.model_registry import models
+    from app.usecase import get_places_by_ids_usecase
+    from app.vectorstore.vector_store import vector_store
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Seed the vector store snapshot and the places
+    docs, vectors, metadata = synthetic_places(args.places, args.images_per_place)
+    vector_store.write_snapshot([vectors], metadata)
+    vector_store.load_snapshot()
+    get_places_by_ids_usecase.places_collection = InMemoryCollection(docs, args.mongo_latency_ms)
+
+    # The model registry returns the stand-ins instead of loading the models
+    models["keyword_generator_chain"] = FakeKeywordChain(args.llm_latency_ms)
+    if args.clip == "stub":
+        models["clip_model"] = ClipStub(args.clip_batch_ms, args.clip_item_ms)
+        models["clip_tokenizer"] = TokenizerStub()
+    return app
+
+
+def clear_caches():
+    from app.cache.ttl_cache import cache_registry
+
+    for cache in cache_registry.values():
+        cache.clear()
+
+
+async def run_load(client, queries: list, total_requests: int, concurrency: int, cold: bool):
+    """
+    Send `total_requests` searches with `concurrency` callers in a closed loop.
+    """
+    latencies = []
+    stage_timings = {}
+    errors = 0
+    counter = iter(range(total_requests))
+
+    async def caller():
+        nonlocal errors
+        for i in counter:
+            if cold:
+                clear_caches()
+            start_time = time.perf_counter()
+            response = await client.get(
+                "/v1/places", params={**queries[i % len(queries)], "timings": "true"}
+            )
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start_time)
+            for stage, ms in response.json()["meta"].get("timings", {}).items():
+                stage_timings.setdefault(stage, []).append(ms)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": summarize([latency * 1000 for latency in latencies]),
+        "stages_ms": {stage: summarize(values) for stage, values in stage_timings.items()},
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def summarize(values: list):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": statistics.fmean(values) if values else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_run(label: str, run: dict, baseline: dict | None):
+    latency = run["latency_ms"]
+    print(
+        f"[{label}] concurrency={run['concurrency']} "
+        f"throughput={run['throughput_rps']:.1f} req/s "
+        f"p50={latency['p50']:.1f}ms p95={latency['p95']:.1f}ms p99={latency['p99']:.1f}ms "
+        f"errors={run['errors']} max_rss={run['max_rss_mb']:.0f}MB"
+        + (f" heap_peak={run['heap_peak_mb']:.1f}MB" if "heap_peak_mb" in run else "")
+    )
+    for stage, stats in run["stages_ms"].items():
+        line = f"    {stage:<20} p50={stats['p50']:.2f}ms p95={stats['p95']:.2f}ms p99={stats['p99']:.2f}ms"
+        base = (baseline or {}).get("stages_ms", {}).get(stage)
+        if base and base["p50"]:
+            line += f" (p50 x{stats['p50'] / base['p50']:.2f} of baseline)"
+        print(line)
+    if baseline and baseline["latency_ms"]["p50"]:
+        print(
+            f"    total p50 x{latency['p50'] / baseline['latency_ms']['p50']:.2f}, "
+            f"throughput x{run['throughput_rps'] / baseline['throughput_rps']:.2f} of baseline"
+        )
+
+
+async def run_benchmark(args):
+    with tempfile.TemporaryDirectory() as tmp_path:
+        app = load_app(args, os.path.join(tmp_path, "vector_store"))
+
+        # Image URL searches download from a local server
+        image_server = serve_images(
+            {f"/images/{i}.jpg": generate_jpeg(800, 600, i) for i in range(args.images)}
+        )
+        queries = DEFAULT_QUERIES + [
+            {"image_url": f"http://127.0.0.1:{image_server.server_address[1]}/images/{i}.jpg"}
+            for i in range(args.images)
+        ]
+        if args.queries:
+            with open(args.queries) as f:
+                queries = [json.loads(line) for line in f if line.strip()]
+
+        baseline = {}
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = {run["concurrency"]: run for run in json.load(f)["runs"]}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=120
+        ) as client:
+            # Load the lazy parts of the pipeline before measuring
+            await run_load(client, queries, len(queries), 1, cold=False)
+
+            runs = []
+            for concurrency in args.concurrency:
+                if args.trace_memory:
+                    tracemalloc.start()
+                run = await run_load(client, queries, args.requests, concurrency, args.cold)
+                if args.trace_memory:
+                    run["heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                    tracemalloc.stop()
+                runs.append(run)
+                print_run(args.label, run, baseline.get(concurrency))
+
+        image_server.shutdown()
+
+    from app.usecase.query_router_usecase import llm_bypass_ratio
+
+    print(f"LLM bypass ratio: {llm_bypass_ratio():.1%}")
+    return {
+        "label": args.label,
+        "commit": git_commit(),
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "baseline", "label")
+        },
+        "runs": runs,
+        "llm_bypass_ratio": llm_bypass_ratio(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the whole /v1/places flow in process, with a fake LLM, "
+        "a CLIP stub, the local vector store and in-memory places. Needs no GPU, "
+        "no network and no MongoDB."
+    )
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--queries",
+        help="JSONL file with one query parameter object per line, like load_benchmark",
+    )
+    parser.add_argument("--places", type=int, default=5000)
+    parser.add_argument("--images-per-place", type=int, default=4)
+    parser.add_argument("--images", type=int, default=3, help="Image URL queries in the mix")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--mongo-latency-ms", type=float, default=2)
+    parser.add_argument(
+        "--clip",
+        choices=["stub", "model"],
+        default="stub",
+        help="CLIP stub, or the real model from MODEL_CACHE_DIR",
+    )
+    parser.add_argument("--clip-batch-ms", type=float, default=10)
+    parser.add_argument("--clip-item-ms", type=float, default=2)
+    parser.add_argument(
+        "--cold", action="store_true", help="Clear all caches before every request"
+    )
+    parser.add_argument("--response-cache", action="store_true")
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="Also report the Python heap peak"
+    )
+    parser.add_argument("--label", default="current", help="Label stored with the results")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results of a previous run to compare with")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import json
+import time
+
+from app.helper.query_classifier import classify_query
+
+# Queries with the answer of the LLM, used when no query file is given
+DEFAULT_QUERIES = [
+    {"q": "coffee shop jakarta", "is_image_search": True},
+    {"q": "quiet cafe to work", "category": "work_friendly", "is_image_search": True},
+    {"q": "old dutch building restaurant", "category": "classic_vibes", "is_image_search": True},
+    {"q": "cozy place for a date", "category": "cozy_atmosphere", "is_image_search": True},
+    {"q": "cheap rooftop bar with a view", "is_image_search": True},
+    {"q": "tempat nongkrong murah", "is_image_search": True},
+    {"q": "Kopi Kenangan Senopati", "is_image_search": False},
+    {"q": "Tanamera Coffee Thamrin", "is_image_search": False},
+    {"q": "Jl. Senopati No. 12, Jakarta Selatan", "is_image_search": False},
+    {"q": "Jalan Kemang Raya 8", "is_image_search": False},
+    {"q": "starbucks reserve dewata", "is_image_search": False},
+    {"q": "cafe near Blok M", "is_image_search": True},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the share of queries the query router rules answer without "
+        "the LLM, and how often they agree with the LLM."
+    )
+    parser.add_argument(
+        "--queries",
+        help="JSONL file with one query per line, with `q`, an optional `category` and "
+        "optionally the `is_image_search` answered by the LLM",
+    )
+    parser.add_argument(
+        "--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9]
+    )
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+
+    start_time = time.perf_counter()
+    answers = [classify_query(query["q"]) for query in queries]
+    elapsed = time.perf_counter() - start_time
+    print(f"{len(queries)} queries, {elapsed / len(queries) * 1e6:.1f} us per query")
+
+    for threshold in args.thresholds:
+        bypassed = [
+            (query, is_image_search)
+            for query, (is_image_search, confidence) in zip(queries, answers)
+            if is_image_search is not None and confidence >= threshold
+        ]
+        labelled = [
+            (query, is_image_search)
+            for query, is_image_search in bypassed
+            if "is_image_search" in query
+        ]
+        agreement = (
+            sum(query["is_image_search"] == is_image_search for query, is_image_search in labelled)
+            / len(labelled)
+            if labelled
+            else 0.0
+        )
+        print(
+            f"threshold={threshold:.2f} bypass={len(bypassed) / len(queries):.1%} "
+            f"agreement={agreement:.1%} ({len(labelled)} labelled)"
+        )
+
+    # The queries left to the LLM, at the highest threshold
+    for query, (is_image_search, confidence) in zip(queries, answers):
+        if is_image_search is None or confidence < max(args.thresholds):
+            print(f"    to the LLM: {query['q']!r} (confidence {confidence:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Measures one cold start in a fresh interpreter and prints the result as JSON
+MEASURE_SCRIPT = """
+import json
+import resource
+import time
+
+start_time = time.perf_counter()
+import app.main
+import_seconds = time.perf_counter() - start_time
+import_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+result = {"import_seconds": import_seconds, "import_rss_mb": import_rss_mb}
+if WARM_UP:
+    from app.model.model_registry import warm_up_models
+
+    start_time = time.perf_counter()
+    warm_up_models(llm=False)
+    result["warm_up_seconds"] = time.perf_counter() - start_time
+    result["warm_up_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+print(json.dumps(result))
+"""
+
+
+def measure(warm_up: bool):
+    """
+    Run one cold start in a subprocess and return its measurements.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", f"WARM_UP = {warm_up}\n{MEASURE_SCRIPT}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the cold import time and peak resident memory of the app."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--warm-up",
+        action="store_true",
+        help="Also load the CLIP model and tokenizer after the import",
+    )
+    args = parser.parse_args()
+
+    results = [measure(args.warm_up) for _ in range(args.runs)]
+    for key in results[0]:
+        values = [result[key] for result in results]
+        print(
+            f"{key}: median {statistics.median(values):.2f} "
+            f"min {min(values):.2f} max {max(values):.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,181 +1,464 @@
+import argparse
 import json
-import requests
 import time
 import os
 
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from PIL import Image
-from io import BytesIO
-from transformers import CLIPTokenizer
-from pymongo import MongoClient
+from pymongo import ReplaceOne
+
+from app.cache.embedding_store import create_embedding_store
+from app.database.mongo_connection import create_sync_client
+from app.helper.document_id import document_id
+from app.helper.image_fetcher import (
+    IMAGE_DECODE_ERRORS,
+    decode_image,
+    image_fetcher,
+    is_permanent_download_error,
+)
+from app.model.model_registry import (
+    CLIP_BACKEND,
+    CLIP_MODEL_NAME,
+    get_clip_model,
+    get_clip_tokenizer,
+)
 
 # Load the environment variables
 load_dotenv()
 
-# Load the CLIP model and tokenizer
-model = SentenceTransformer("clip-ViT-L-14")
-tokenizer = CLIPTokenizer.from_pretrained("openai/clip-vit-large-patch14")
-
 # MongoDB client setup
-client = MongoClient(os.getenv("MONGO_URI"))
+client = create_sync_client()
 db = client[os.getenv("MONGO_DB_NAME")]
 places_collection = db[os.getenv("MONGO_PLACES_COLLECTION")]
 place_reviews_collection = db[os.getenv("MONGO_PLACES_REVIEWS_COLLECTION")]
 embedding_collection = db[os.getenv("MONGO_PLACE_EMBEDDINGS_COLLECTION")]
 
+# Embeddings by content hash, shared with the watcher
+embedding_store = create_embedding_store(db, CLIP_MODEL_NAME, CLIP_BACKEND)
+
+
+class StageStats:
+    """
+    Item counts and elapsed time of each pipeline stage.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.seconds = {}
+
+    def add(self, stage: str, items: int, start_time: float):
+        self.items[stage] = self.items.get(stage, 0) + items
+        self.seconds[stage] = self.seconds.get(stage, 0) + time.time() - start_time
+
+    def report(self, total_seconds: float):
+        for stage, items in self.items.items():
+            seconds = self.seconds[stage]
+            rate = items / seconds if seconds else 0
+            print(f"{stage}: {items} in {seconds:.2f} seconds ({rate:.2f}/s)")
+
+        # Overall throughput, the stages overlap with the image downloads
+        images = self.items.get("image embeddings", 0)
+        embeddings = self.items.get("embeddings written", 0)
+        print(
+            f"Overall: {images / total_seconds:.2f} images/s, "
+            f"{embeddings / total_seconds:.2f} embeddings/s"
+        )
+
+
+def read_places(input_path):
+    """
+    Stream the places from a JSONL file, or from a JSON array with ijson if installed.
+    """
+    with open(input_path, "rb") as f:
+        if input_path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        try:
+            import ijson
+        except ImportError:
+            print("ijson is not installed, loading the whole JSON file")
+            yield from json.load(f)
+            return
+        yield from ijson.items(f, "item", use_float=True)
+
+
+class Checkpoint:
+    """
+    Append-only file of the place ids whose embeddings are fully written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        self.file = open(path, "a")
+
+    def __contains__(self, place_id):
+        return str(place_id) in self.done
+
+    def add(self, place_ids):
+        for place_id in place_ids:
+            self.done.add(str(place_id))
+            self.file.write(f"{place_id}\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
 
-def generate_text_embedding(text):
+
+def truncate_text(text):
+    tokenizer = get_clip_tokenizer()
     tokens = tokenizer.encode(
         text, truncation=True, max_length=77, add_special_tokens=True
     )
-    tokens = tokens[:77]  # Ensure the token length matches the model's expected input length
 
-    # Encode the truncated text
-    return model.encode(tokens, convert_to_tensor=True).tolist()
+    # Decode the tokens, so the text matches the model's expected input length
+    return tokenizer.decode(tokens, skip_special_tokens=True)
 
 
-def generate_image_embedding(image_url):
-    # Fetch the image from the URL
-    response = requests.get(image_url)
-    response.raise_for_status()  # Ensure the request was successful
-    image = Image.open(BytesIO(response.content))
+def generate_text_embeddings(texts, batch_size):
+    if not texts:
+        return []
 
-    # Generate the embedding
-    return model.encode(
-        image,
-        convert_to_tensor=True,
-        device="cuda",
+    # Encode the truncated texts in batches
+    return get_clip_model().encode(
+        [truncate_text(text) for text in texts],
+        batch_size=batch_size,
     ).tolist()
 
 
-# Function to process data and insert into MongoDB
-def process_and_insert_data(input_data):
-    start_time = time.time()  # Start the timer
-    index = 0
+def generate_image_embeddings(images, batch_size):
+    if not images:
+        return []
 
-    for place in input_data:
-        index += 1
-        each_place_start_time = time.time()
-
-        # Add image embeddings for `thumbnail` (if not null), `images`, and `user_reviews`
-        image_urls = [img["image"] for img in place["images"]]
-
-        if place["thumbnail"] is not None:
-            image_urls.insert(0, place["thumbnail"])
-
-        if place["user_reviews"] is not None:
-            for review in place["user_reviews"]:
-                image_urls.extend(review.get("Images", []))
-
-        # Create the main dictionary structure
-        place_doc = {
-            "_id": place["cid"],
-            "title": place["title"],
-            "categories": place["categories"],
-            "address": place["address"],
-            "review_count": place["review_count"],
-            "review_rating": place["review_rating"],
-            "description": place["description"],
-            "open_hours": place["open_hours"],
-            "popular_times": place["popular_times"],
-            "web_site": place["web_site"],
-            "phone": place["phone"],
-            "plus_code": place["plus_code"],
-            "reviews_per_rating": place["reviews_per_rating"],
-            "latitude": place["latitude"],
-            "longtitude": place["longtitude"],
-            "reviews_link": place["reviews_link"],
-            "price_range": place["price_range"],
-            "menu": place["menu"],
-            "reservations": place["reservations"],
-            "order_online": place["order_online"],
-            "about": place["about"],
-            "images": image_urls,
-        }
+    # Encode the images in batches
+    return get_clip_model().encode(images, batch_size=batch_size).tolist()
 
-        # Insert the place document into the places collection and get the inserted ID, if error duplicate key, then continue to next place
-        try:
-            place_id = places_collection.insert_one(place_doc).inserted_id
-        except Exception as e:
-            print(f"Error inserting place i: {index}: {e}")
-            continue
 
-        # Insert user reviews into the place_reviews collection
-        if place["user_reviews"] is not None:
-            place_reviews_collection.insert_many(
-                [
-                    {
-                        "place_id": place_id,
-                        "rating": review["Rating"],
-                        "review": review["Description"],
-                        "images": review.get("Images", []),
-                        "user": None,
-                    }
-                    for review in place["user_reviews"]
-                ]
+def try_decode_image(content):
+    # A corrupt image is skipped, it would fail every rerun at the same batch
+    try:
+        return decode_image(content)
+    except IMAGE_DECODE_ERRORS as e:
+        print(f"Error decoding image: {e}")
+        return None
+
+
+def encode_images(executor, contents, batch_size):
+    """
+    Decode the images concurrently and encode them, with None for the undecodable ones.
+    """
+    images = list(executor.map(try_decode_image, contents))
+    embeddings = iter(
+        generate_image_embeddings([image for image in images if image is not None], batch_size)
+    )
+    return [None if image is None else next(embeddings) for image in images]
+
+
+def download_image(image_url):
+    # Fetch the image bytes from the URL
+    return image_fetcher.fetch(image_url)
+
+
+def download_images(executor, image_urls):
+    """
+    Start downloading the images concurrently, returning a future per URL.
+    """
+    return {url: executor.submit(download_image, url) for url in set(image_urls)}
+
+
+def get_image_urls(place):
+    # Add image embeddings for `thumbnail` (if not null), `images`, and `user_reviews`
+    image_urls = [img["image"] for img in place["images"]]
+
+    if place["thumbnail"] is not None:
+        image_urls.insert(0, place["thumbnail"])
+
+    if place["user_reviews"] is not None:
+        for review in place["user_reviews"]:
+            image_urls.extend(review.get("Images", []))
+
+    # Distinct image URLs, as the thumbnail is usually in the images too
+    return list(dict.fromkeys(image_urls))
+
+
+def build_place_doc(place, image_urls):
+    # Create the main dictionary structure
+    return {
+        "_id": place["cid"],
+        "title": place["title"],
+        "categories": place["categories"],
+        "address": place["address"],
+        "review_count": place["review_count"],
+        "review_rating": place["review_rating"],
+        "description": place["description"],
+        "open_hours": place["open_hours"],
+        "popular_times": place["popular_times"],
+        "web_site": place["web_site"],
+        "phone": place["phone"],
+        "plus_code": place["plus_code"],
+        "reviews_per_rating": place["reviews_per_rating"],
+        "latitude": place["latitude"],
+        "longtitude": place["longtitude"],
+        "reviews_link": place["reviews_link"],
+        "price_range": place["price_range"],
+        "menu": place["menu"],
+        "reservations": place["reservations"],
+        "order_online": place["order_online"],
+        "about": place["about"],
+        "images": image_urls,
+    }
+
+
+def insert_places(places, stats):
+    """
+    Upsert the places and their reviews.
+    """
+    start_time = time.time()
+
+    # Replace the place documents, so a rerun does not fail on duplicate keys
+    places_collection.bulk_write(
+        [
+            ReplaceOne(
+                {"_id": place["cid"]},
+                build_place_doc(place, get_image_urls(place)),
+                upsert=True,
             )
+            for place in places
+        ],
+        ordered=False,
+    )
+
+    # Upsert user reviews into the place_reviews collection
+    reviews = [
+        {
+            "_id": document_id(place["cid"], "review", review_index),
+            "place_id": place["cid"],
+            "rating": review["Rating"],
+            "review": review["Description"],
+            "images": review.get("Images", []),
+            "user": None,
+        }
+        for place in places
+        for review_index, review in enumerate(place["user_reviews"] or [])
+    ]
+    if reviews:
+        place_reviews_collection.bulk_write(
+            [ReplaceOne({"_id": review["_id"]}, review, upsert=True) for review in reviews],
+            ordered=False,
+        )
+
+    stats.add("places written", len(places), start_time)
 
-        try:
-            # Generate text embedding
-            text = f"title: {place['title']}; description: {place['description']}; address: {place['address']}"
-            text_embedding = generate_text_embedding(text)
 
-            # Insert text embedding as a separate document in the embeddings collection
-            embedding_collection.insert_one(
+def process_batch(
+    places,
+    known_images,
+    image_futures,
+    executor,
+    text_batch_size,
+    image_batch_size,
+    stats,
+):
+    """
+    Generate and insert the text and image embeddings of a batch of places.
+
+    Returns the ids of the places with an image that failed to download for a
+    reason that may not last, like a timeout or a server error.
+    """
+    embedding_docs = []
+    failed_places = set()
+
+    # Generate text embeddings for the places and the user reviews
+    start_time = time.time()
+    text_docs = []
+    for place in places:
+        text_docs.append(
+            {
+                "place_id": place["cid"],
+                "type": "text",
+                "content": f"title: {place['title']}; description: {place['description']}; address: {place['address']}",
+            }
+        )
+        for review in place["user_reviews"] or []:
+            text_docs.append(
                 {
-                    "place_id": place_id,
-                    "type": "text",
-                    "content": text,
-                    "embedding": text_embedding,
+                    "place_id": place["cid"],
+                    "type": "review_text",
+                    "content": f"review: {review['Description']}; rating: {review['Rating']}",
                 }
             )
-        except Exception as e:
-            print(f"Error generating text embedding for place {place['title']}: {e}")
+    texts = [doc["content"] for doc in text_docs]
+    text_embeddings = embedding_store.encode(
+        [embedding_store.text_key(text) for text in texts],
+        texts,
+        lambda missing: generate_text_embeddings(missing, text_batch_size),
+    )
+    for doc, embedding in zip(text_docs, text_embeddings):
+        doc["embedding"] = embedding
+    embedding_docs.extend(text_docs)
+    stats.add("text embeddings", len(text_docs), start_time)
 
-        # Generate embeddings for each image URL
-        for url in image_urls:
+    # Wait for the image downloads of the batch, the known URLs were not downloaded
+    start_time = time.time()
+    image_docs, contents, content_urls = [], [], []
+    for place in places:
+        for url in get_image_urls(place):
+            doc = {"place_id": place["cid"], "type": "image", "content": url}
+            if url in known_images:
+                doc["embedding"] = known_images[url]
+                embedding_docs.append(doc)
+                continue
             try:
-                image_embedding = generate_image_embedding(url)
-                embedding_collection.insert_one(
-                    {
-                        "place_id": place_id,
-                        "type": "image",
-                        "content": url,
-                        "embedding": image_embedding,
-                    }
-                )
+                contents.append(image_futures[url].result())
+                content_urls.append(url)
+                image_docs.append(doc)
             except Exception as e:
-                print(f"Error generating embedding for image {url}: {e}")
-                continue
+                print(f"Error downloading image {url}: {e}")
+                if not is_permanent_download_error(e):
+                    failed_places.add(place["cid"])
+    stats.add("image download wait", len(contents), start_time)
+
+    # Generate embeddings for the images whose content is not stored yet
+    start_time = time.time()
+    image_embeddings = embedding_store.encode(
+        [embedding_store.image_key(content) for content in contents],
+        contents,
+        lambda missing: encode_images(executor, missing, image_batch_size),
+        urls=content_urls,
+    )
+    encoded_docs = []
+    for doc, embedding in zip(image_docs, image_embeddings):
+        if embedding is None:
+            print(f"Skipping undecodable image {doc['content']}")
+            continue
+        doc["embedding"] = embedding
+        encoded_docs.append(doc)
+    embedding_docs.extend(encoded_docs)
+    stats.add("image embeddings", len(encoded_docs), start_time)
 
-        # Insert text embedding for each user review with rating > 3
-        if place["user_reviews"] is not None:
-            for review in place["user_reviews"]:
-                review_text = f"review: {review['Description']}; rating: {review['Rating']}"
-                try:
-                    review_embedding = generate_text_embedding(review_text)
-                    embedding_collection.insert_one(
-                        {
-                            "place_id": place_id,
-                            "type": "review_text",
-                            "content": review_text,
-                            "embedding": review_embedding,
-                        }
-                    )
-                except Exception as e:
-                    print(f"Error generating text embedding for review: {review_text}: {e}")
-                    continue
+    # Upsert all embeddings of the batch at once, with ids derived from their content
+    start_time = time.time()
+    if embedding_docs:
+        embedding_collection.bulk_write(
+            [
+                ReplaceOne(
+                    {"_id": document_id(doc["place_id"], doc["type"], doc["content"])},
+                    doc,
+                    upsert=True,
+                )
+                for doc in embedding_docs
+            ],
+            ordered=False,
+        )
+    stats.add("embeddings written", len(embedding_docs), start_time)
+    return failed_places
+
+
+# Function to process data and insert into MongoDB
+def process_and_insert_data(
+    input_data,
+    checkpoint,
+    place_batch_size=16,
+    text_batch_size=64,
+    image_batch_size=32,
+    download_workers=16,
+):
+    start_time = time.time()  # Start the timer
+    stats = StageStats()
+    index = 0
+    failed_places = 0
+
+    # Skip the places completed by a previous run
+    pending = (place for place in input_data if place["cid"] not in checkpoint)
+    batches = iter(lambda: list(islice(pending, place_batch_size)), [])
+
+    def start_batch(places):
+        # Write the places and start downloading their images, unless already known
+        insert_places(places, stats)
+        image_urls = [url for place in places for url in get_image_urls(place)]
+        known_images = embedding_store.get_by_urls(image_urls)
+        return places, known_images, download_images(
+            executor, [url for url in image_urls if url not in known_images]
+        )
 
+    with ThreadPoolExecutor(max_workers=download_workers) as executor:
+        # Download the images of the next batch while the current one is encoded
+        next_batch = next(batches, None)
+        next_batch = start_batch(next_batch) if next_batch else None
+
+        while next_batch is not None:
+            places, known_images, image_futures = next_batch
+            next_batch = next(batches, None)
+            next_batch = start_batch(next_batch) if next_batch else None
+
+            each_batch_start_time = time.time()
+            batch_failed_places = process_batch(
+                places,
+                known_images,
+                image_futures,
+                executor,
+                text_batch_size,
+                image_batch_size,
+                stats,
+            )
+
+            # Leave the places with a failed download out, so a rerun retries them
+            checkpoint.add(
+                place["cid"] for place in places if place["cid"] not in batch_failed_places
+            )
+            failed_places += len(batch_failed_places)
+            index += len(places)
+
+            print(
+                f"Processed {index} places, batch of {len(places)} places "
+                f"in {time.time() - each_batch_start_time:.2f} seconds"
+            )
+
+    total_seconds = time.time() - start_time
+    print(f"Processed {index} places in {total_seconds:.2f} seconds")
+    if failed_places:
         print(
-            f"Processed {index} places in each place in {time.time() - each_place_start_time:.2f} seconds"
+            f"{failed_places} places had images that failed to download and are not "
+            f"checkpointed, rerun to retry them"
         )
+    stats.report(total_seconds)
+    print(f"Embedding store: {embedding_store.stats()}")
+    print(f"Image fetcher: {image_fetcher.stats()}")
 
-    print(f"Processed {index} places in {time.time() - start_time:.2f} seconds")
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the places and their embeddings.")
+    parser.add_argument("--input", default="localize_ai_app/data/public_space.json")
+    parser.add_argument("--place-batch-size", type=int, default=16)
+    parser.add_argument("--text-batch-size", type=int, default=64)
+    parser.add_argument("--image-batch-size", type=int, default=32)
+    parser.add_argument("--download-workers", type=int, default=16)
+    parser.add_argument(
+        "--checkpoint",
+        help="File of the completed place ids, defaults to the input path with .checkpoint",
+    )
+    args = parser.parse_args()
 
-# Input data getting data from public_space.json file
-input_data = json.load(open("localize_ai_app/data/public_space.json"))
+    # Stream the input data from the public_space file
+    input_data = read_places(args.input)
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.checkpoint")
+    print(f"Resuming after {len(checkpoint.done)} completed places")
 
-# Process the input data
-process_and_insert_data(input_data)
+    # Process the input data
+    process_and_insert_data(
+        input_data,
+        checkpoint,
+        place_batch_size=args.place_batch_size,
+        text_batch_size=args.text_batch_size,
+        image_batch_size=args.image_batch_size,
+        download_workers=args.download_workers,
+    )
+    checkpoint.close()
@@ -0,0 +1,8 @@
+import os
+
+# The app reads its MongoDB settings at import, the tests never connect
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_DB_NAME", "localize_test")
+os.environ.setdefault("MONGO_PLACES_COLLECTION", "places")
+os.environ.setdefault("MONGO_PLACES_REVIEWS_COLLECTION", "places_reviews")
+os.environ.setdefault("MONGO_PLACE_EMBEDDINGS_COLLECTION", "place_embeddings")
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from app.model.batch_encoder import BatchEncoder
+
+
+def encode_batch(items):
+    if "bad" in items:
+        raise ValueError("cannot encode bad")
+    return [f"embedding of {item}" for item in items]
+
+
+def test_concurrent_items_are_encoded_in_one_batch():
+    batches = []
+
+    def encode(items):
+        batches.append(list(items))
+        return encode_batch(items)
+
+    encoder = BatchEncoder(encode, max_batch_size=8, max_wait_seconds=0.01)
+
+    async def run():
+        return await asyncio.gather(*(encoder.encode(i) for i in ["a", "b", "c"]))
+
+    assert asyncio.run(run()) == ["embedding of a", "embedding of b", "embedding of c"]
+    assert batches == [["a", "b", "c"]]
+    assert encoder.stats()["mean_batch_size"] == 3
+
+
+def test_full_batch_is_encoded_without_waiting():
+    encoder = BatchEncoder(encode_batch, max_batch_size=2, max_wait_seconds=10)
+
+    async def run():
+        return await asyncio.wait_for(
+            asyncio.gather(encoder.encode("a"), encoder.encode("b")), timeout=1
+        )
+
+    assert asyncio.run(run()) == ["embedding of a", "embedding of b"]
+
+
+def test_a_failing_item_only_fails_its_own_caller():
+    encoder = BatchEncoder(encode_batch, max_batch_size=8, max_wait_seconds=0.01)
+
+    async def run():
+        return await asyncio.gather(
+            encoder.encode("a"),
+            encoder.encode("bad"),
+            encoder.encode("c"),
+            return_exceptions=True,
+        )
+
+    good_a, bad, good_c = asyncio.run(run())
+    assert good_a == "embedding of a"
+    assert good_c == "embedding of c"
+    assert isinstance(bad, ValueError)
+    assert encoder.fallbacks == 1
+
+
+def test_single_item_error_is_raised():
+    encoder = BatchEncoder(encode_batch, max_batch_size=8, max_wait_seconds=0)
+
+    with pytest.raises(ValueError):
+        asyncio.run(encoder.encode("bad"))
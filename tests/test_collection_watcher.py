@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from app.watchers.collection_watcher import watch_collection
+
+
+class FakeChangeStream:
+    def __init__(self, changes):
+        self.changes = changes
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.changes:
+            raise asyncio.CancelledError()
+        change = self.changes.pop(0)
+        if isinstance(change, Exception):
+            raise change
+        self.resume_token = change["_id"]
+        return change
+
+
+class FakeDatabase:
+    def __init__(self, times):
+        self.times = times
+
+    async def command(self, name):
+        return {"operationTime": self.times.pop(0)}
+
+
+class FakeCollection:
+    name = "test"
+
+    def __init__(self, streams, times):
+        self.streams = streams
+        self.database = FakeDatabase(times)
+        self.watch_options = []
+
+    async def watch(self, pipeline=None, full_document=None, **options):
+        self.watch_options.append(options)
+        return FakeChangeStream(self.streams.pop(0))
+
+
+def test_stream_restarts_from_the_time_before_the_rebuild():
+    collection = FakeCollection(
+        streams=[[{"_id": 1}, OperationFailure("lost", code=286)], [{"_id": 2}]],
+        times=["before rebuild"],
+    )
+    handled = []
+    rebuilds = []
+
+    async def handle_change(change):
+        handled.append(change["_id"])
+
+    async def on_history_lost():
+        rebuilds.append(collection.database.times[:])
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(
+            watch_collection(
+                collection,
+                handle_change,
+                start_at_operation_time="start",
+                on_history_lost=on_history_lost,
+                retry_seconds=0,
+            )
+        )
+
+    assert handled == [1, 2]
+    # The cluster time was read before the rebuild
+    assert rebuilds == [[]]
+    assert collection.watch_options == [
+        {"start_at_operation_time": "start"},
+        {"start_at_operation_time": "before rebuild"},
+    ]
+
+
+def test_stream_resumes_after_the_last_change():
+    collection = FakeCollection(
+        streams=[[{"_id": 1}, OperationFailure("interrupted", code=11601)], []],
+        times=[],
+    )
+
+    async def handle_change(change):
+        pass
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(watch_collection(collection, handle_change, retry_seconds=0))
+
+    assert collection.watch_options[1] == {"resume_after": 1}
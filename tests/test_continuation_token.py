@@ -0,0 +1,61 @@
+import pytest
+
+from app.helper.continuation_token import (
+    MAX_SEARCH_RESULTS,
+    InvalidContinuationToken,
+    decode_continuation_token,
+    encode_continuation_token,
+    next_continuation_token,
+    select_page,
+)
+
+
+def test_token_round_trip():
+    state = {"keyword": "quiet cafe", "seen": ["a", "b"]}
+    token = encode_continuation_token(state)
+
+    assert "=" not in token
+    assert decode_continuation_token(token) == state
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "not a token",
+        encode_continuation_token({"seen": []}),
+        encode_continuation_token({"keyword": "cafe", "seen": "a"}),
+        encode_continuation_token(["keyword"]),
+    ],
+)
+def test_invalid_tokens_are_rejected(token):
+    with pytest.raises(InvalidContinuationToken):
+        decode_continuation_token(token)
+
+
+def test_select_page_skips_the_seen_places():
+    embeddings = [
+        {"place_id": "a", "score": 0.9},
+        {"place_id": "b", "score": 0.8},
+        {"place_id": "b", "score": 0.7},
+        {"place_id": "c", "score": 0.6},
+        {"place_id": "d", "score": 0.5},
+    ]
+    page, page_ids = select_page(embeddings, seen=["a"], limit=2)
+
+    assert page_ids == ["b", "c"]
+    assert [e["place_id"] for e in page] == ["b", "b", "c"]
+
+
+def test_next_token_ends_on_a_short_page():
+    state = {"keyword": "cafe"}
+
+    assert next_continuation_token(state, ["a"], ["b"], limit=2) is None
+
+    token = next_continuation_token(state, ["a"], ["b", "c"], limit=2)
+    assert decode_continuation_token(token)["seen"] == ["a", "b", "c"]
+
+
+def test_next_token_ends_at_the_maximum_results():
+    seen = [str(i) for i in range(MAX_SEARCH_RESULTS - 2)]
+
+    assert next_continuation_token({"keyword": "cafe"}, seen, ["x", "y"], limit=2) is None
@@ -0,0 +1,53 @@
+from app.cache.embedding_store import EmbeddingStore
+
+
+def test_identical_contents_are_encoded_once():
+    store = EmbeddingStore(None, "clip", "torch")
+    encoded = []
+
+    def encode_batch(items):
+        encoded.extend(items)
+        return [[float(len(item))] for item in items]
+
+    keys = [store.text_key(text) for text in ["Quiet  cafe", "quiet cafe", "rooftop"]]
+    embeddings = store.encode(keys, ["Quiet  cafe", "quiet cafe", "rooftop"], encode_batch)
+
+    assert encoded == ["Quiet  cafe", "rooftop"]
+    assert embeddings == [[11.0], [11.0], [7.0]]
+
+    store.encode(keys[:1], ["quiet cafe"], encode_batch)
+    assert len(encoded) == 2
+    assert store.hits == 2
+
+
+def test_items_that_cannot_be_encoded_are_not_stored():
+    store = EmbeddingStore(None, "clip", "torch")
+    keys = [store.image_key(b"good"), store.image_key(b"bad")]
+
+    embeddings = store.encode(
+        keys, [b"good", b"bad"], lambda items: [None if item == b"bad" else [1.0] for item in items]
+    )
+
+    assert embeddings == [[1.0], None]
+    assert keys[1] not in store.memory
+
+
+def test_backends_do_not_share_embeddings():
+    full = EmbeddingStore(None, "clip", "torch")
+    quantized = EmbeddingStore(None, "clip", "quantized")
+
+    assert full.text_key("cafe") != quantized.text_key("cafe")
+    assert full.image_key(b"image") != quantized.image_key(b"image")
+
+
+def test_memory_keeps_the_most_recently_used_embeddings():
+    store = EmbeddingStore(None, "clip", "torch", memory_size=2)
+    keys = [store.text_key(text) for text in ["a", "b", "c"]]
+    encode_batch = lambda items: [[1.0] for _ in items]
+
+    store.encode(keys[:2], ["a", "b"], encode_batch)
+    store.encode(keys[:1], ["a"], encode_batch)
+    store.encode(keys[2:], ["c"], encode_batch)
+
+    assert list(store.memory) == [keys[0], keys[2]]
+    assert store.get_many(keys) == {keys[0]: [1.0], keys[2]: [1.0]}
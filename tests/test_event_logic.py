@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from io import BytesIO
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.watchers import event_logic
+
+
+def jpeg_bytes():
+    buffer = BytesIO()
+    Image.new("RGB", (32, 32), "blue").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class FakeModel:
+    def encode(self, items):
+        return FakeArray([[1.0, 0.0] for _ in items])
+
+
+class FakeArray(list):
+    def tolist(self):
+        return list(self)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.operations = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+
+def not_found(url):
+    request = httpx.Request("GET", url)
+    response = httpx.Response(404, request=request)
+    return httpx.HTTPStatusError("404", request=request, response=response)
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    collection = FakeCollection()
+    good = jpeg_bytes()
+    images = {
+        "http://img/good.jpg": good,
+        "http://img/truncated.jpg": good[:200],
+    }
+
+    def download_image(url):
+        if url == "http://img/timeout.jpg":
+            raise httpx.ConnectTimeout("timed out")
+        if url not in images:
+            raise not_found(url)
+        return images[url]
+
+    monkeypatch.setattr(event_logic, "embedding_collection", collection)
+    monkeypatch.setattr(event_logic, "download_image", download_image)
+    monkeypatch.setattr(event_logic, "get_clip_model", lambda: FakeModel())
+    monkeypatch.setattr(event_logic, "encode_texts", lambda texts: [[0.0, 1.0] for _ in texts])
+    monkeypatch.setattr(event_logic.embedding_store, "memory", OrderedDict())
+    return collection
+
+
+def review(place_id, images=(), **fields):
+    return {"place_id": place_id, "rating": 5, "review": "nice", "images": list(images), **fields}
+
+
+def test_bad_reviews_and_images_only_skip_themselves(watcher):
+    reviews = [
+        review("a", images=["http://img/good.jpg", "http://img/truncated.jpg"]),
+        {"_id": "malformed", "place_id": "b", "images": []},
+        review("c", images=["http://img/missing.jpg"]),
+    ]
+
+    assert event_logic.insert_vectors(reviews) == 3
+    written = [
+        (op._doc["place_id"], op._doc["type"], op._doc["content"]) for op in watcher.operations
+    ]
+    assert written == [
+        ("a", "review_text", "review: nice; rating: 5"),
+        ("c", "review_text", "review: nice; rating: 5"),
+        ("a", "image", "http://img/good.jpg"),
+    ]
+
+
+def test_transient_download_errors_fail_the_batch(watcher):
+    with pytest.raises(httpx.ConnectTimeout):
+        event_logic.insert_vectors([review("a", images=["http://img/timeout.jpg"])])
+
+    assert watcher.operations == []
+
+
+def test_failed_downloads_can_be_skipped(watcher):
+    reviews = [review("a", images=["http://img/timeout.jpg", "http://img/good.jpg"])]
+
+    assert event_logic.insert_vectors(reviews, skip_failed_downloads=True) == 2
+    assert [op._doc["content"] for op in watcher.operations] == [
+        "review: nice; rating: 5",
+        "http://img/good.jpg",
+    ]
@@ -0,0 +1,89 @@
+import httpx
+import pytest
+from pymongo.errors import OperationFailure
+
+from app.watchers import event_watch
+
+
+def test_unreachable_images_are_skipped_after_the_attempts(monkeypatch):
+    calls = []
+
+    def insert_vectors(reviews, skip_failed_downloads=False):
+        calls.append(skip_failed_downloads)
+        if not skip_failed_downloads:
+            raise httpx.ConnectError("dead host")
+        return len(reviews)
+
+    monkeypatch.setattr(event_watch, "insert_vectors", insert_vectors)
+    monkeypatch.setattr(event_watch, "WATCHER_DOWNLOAD_ATTEMPTS", 2)
+    monkeypatch.setattr(event_watch.time, "sleep", lambda seconds: None)
+
+    assert event_watch.embed_batch([{"fullDocument": {}}]) == 1
+    assert calls == [False, False, True]
+
+
+class StopReading(BaseException):
+    pass
+
+
+class FakeChangeStream:
+    def __init__(self, changes):
+        self.changes = changes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        for change in self.changes:
+            if isinstance(change, BaseException):
+                raise change
+            yield change
+
+
+class FakeDatabase:
+    def command(self, name):
+        return {"operationTime": "now"}
+
+
+class FakeCollection:
+    database = FakeDatabase()
+
+    def __init__(self, streams):
+        self.streams = streams
+        self.watch_options = []
+
+    def watch(self, pipeline, max_await_time_ms=None, **options):
+        self.watch_options.append(options)
+        return FakeChangeStream(self.streams.pop(0))
+
+
+class FakeQueue:
+    def __init__(self):
+        self.changes = []
+
+    def put(self, change):
+        self.changes.append(change)
+
+
+def test_lost_history_restarts_the_stream_from_now(monkeypatch):
+    collection = FakeCollection(
+        [
+            [OperationFailure("lost", code=286)],
+            [{"_id": "after"}, StopReading()],
+        ]
+    )
+    monkeypatch.setattr(event_watch, "place_reviews_collection", collection)
+    monkeypatch.setattr(event_watch.time, "sleep", lambda seconds: None)
+    queue = FakeQueue()
+
+    with pytest.raises(StopReading):
+        event_watch.read_changes(queue, "expired token")
+
+    assert collection.watch_options == [
+        {"resume_after": "expired token"},
+        {"start_at_operation_time": "now"},
+    ]
+    assert queue.changes == [{"_id": "after"}]
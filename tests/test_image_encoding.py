@@ -0,0 +1,41 @@
+import asyncio
+from io import BytesIO
+
+from PIL import Image
+
+from app.helper.image_fetcher import IMAGE_DECODE_ERRORS
+from app.usecase import get_places_by_image_usecase as usecase
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, images, convert_to_numpy=True):
+        self.batches.append(len(images))
+        return [image.size for image in images]
+
+
+def jpeg_bytes():
+    buffer = BytesIO()
+    Image.new("RGB", (300, 300), "green").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_corrupt_image_does_not_fail_its_batch(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(usecase, "get_clip_model", lambda: model)
+    good = jpeg_bytes()
+
+    async def run():
+        return await asyncio.gather(
+            usecase.encode_image_bytes(good),
+            usecase.encode_image_bytes(good[:2000]),
+            usecase.encode_image_bytes(good),
+            return_exceptions=True,
+        )
+
+    first, corrupt, second = asyncio.run(run())
+    assert first == second == (300, 300)
+    assert isinstance(corrupt, IMAGE_DECODE_ERRORS)
+    assert model.batches == [2]
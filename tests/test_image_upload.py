@@ -0,0 +1,95 @@
+import asyncio
+from io import BytesIO
+
+import httpx
+from fastapi import FastAPI
+from PIL import Image
+
+from app.chain import search_image_chain
+from app.dto.search_dto import ImageSearchParam
+from app.router import places_router
+from app.usecase import get_places_by_image_usecase as usecase
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, images, convert_to_numpy=True):
+        self.batches.append(len(images))
+        return [[0.0] for _ in images]
+
+
+def jpeg_bytes():
+    buffer = BytesIO()
+    Image.new("RGB", (300, 300), "green").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def create_app():
+    app = FastAPI()
+    app.include_router(places_router.router, prefix="/v1/places")
+    return app
+
+
+def post_images(images: list):
+    async def run():
+        transport = httpx.ASGITransport(app=create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(
+                *(
+                    client.post("/v1/places/search/image", files={"image": ("photo.jpg", image)})
+                    for image in images
+                )
+            )
+
+    return asyncio.run(run())
+
+
+def test_truncated_upload_does_not_fail_its_batch(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(usecase, "get_clip_model", lambda: model)
+
+    async def search(embedding, limit, num_candidates):
+        return []
+
+    monkeypatch.setattr(usecase.vector_store, "search", search)
+    good = jpeg_bytes()
+
+    responses = post_images([good, good[:2000], good])
+    assert [response.status_code for response in responses] == [200, 400, 200]
+    # The truncated upload never reached the model
+    assert sum(model.batches) == 2
+
+
+def test_unreadable_upload_is_rejected():
+    (response,) = post_images([b"not an image"])
+    assert response.status_code == 400
+
+
+def test_upload_search_returns_limit_places(monkeypatch):
+    limits = []
+
+    async def image_content_vector_search(image, limit):
+        limits.append(limit)
+        # Place "a" has three matching images
+        return [
+            {"place_id": "a", "score": 0.9},
+            {"place_id": "a", "score": 0.8},
+            {"place_id": "a", "score": 0.7},
+            {"place_id": "b", "score": 0.6},
+            {"place_id": "c", "score": 0.5},
+        ]
+
+    async def get_places_in_batches(embeddings, profile, batch_size=None):
+        yield list(dict.fromkeys(embedding["place_id"] for embedding in embeddings))
+
+    monkeypatch.setattr(
+        search_image_chain, "image_content_vector_search", image_content_vector_search
+    )
+    monkeypatch.setattr(search_image_chain, "get_places_in_batches", get_places_in_batches)
+    dto = ImageSearchParam(limit=2, profile="compact")
+
+    result = asyncio.run(search_image_chain.SearchImageChain().search_content(dto, image=None))
+    assert limits == [4]
+    assert result["places"] == ["a", "b"]
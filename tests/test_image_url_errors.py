@@ -0,0 +1,40 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.controller.places_controller import response_cache
+from app.helper.image_fetcher import ImageTooLargeError, image_fetcher
+from app.router import places_router
+
+
+def status_error(status_code):
+    request = httpx.Request("GET", "http://img/photo.jpg")
+    return httpx.HTTPStatusError(
+        str(status_code), request=request, response=httpx.Response(status_code, request=request)
+    )
+
+
+@pytest.mark.parametrize(
+    "error, status_code",
+    [
+        (ImageTooLargeError("Image is larger than 10 bytes"), 413),
+        (status_error(404), 400),
+        (status_error(503), 502),
+        (httpx.UnsupportedProtocol("ftp"), 400),
+        (httpx.ConnectTimeout("timed out"), 504),
+        (httpx.ConnectError("refused"), 502),
+    ],
+)
+def test_image_url_errors_are_mapped_to_http_errors(monkeypatch, error, status_code):
+    async def afetch(url):
+        raise error
+
+    monkeypatch.setattr(image_fetcher, "afetch", afetch)
+    response_cache.clear()
+    app = FastAPI()
+    app.include_router(places_router.router, prefix="/v1/places")
+
+    response = TestClient(app).get("/v1/places", params={"image_url": "http://img/photo.jpg"})
+    assert response.status_code == status_code
+    response_cache.clear()
@@ -0,0 +1,48 @@
+import asyncio
+from collections import OrderedDict
+
+from app.usecase import keyword_generator_usecase as usecase
+from app.usecase.keyword_generator_usecase import KeywordGeneratorResponse
+
+
+def test_cached_keyword_skips_the_router(monkeypatch):
+    routed = []
+
+    async def route_query(search_phrase):
+        routed.append(search_phrase)
+        return None
+
+    async def invoke_keyword_generator(search_phrase, category=None):
+        return KeywordGeneratorResponse(keyword="quiet cafe", is_image_search=True)
+
+    monkeypatch.setattr(usecase, "route_query", route_query)
+    monkeypatch.setattr(usecase, "invoke_keyword_generator", invoke_keyword_generator)
+    monkeypatch.setattr(usecase.keyword_cache, "_entries", OrderedDict())
+    monkeypatch.setattr(usecase.keyword_cache, "store", None)
+
+    async def run():
+        first = await usecase.generate_keyword("A quiet  cafe")
+        second = await usecase.generate_keyword("a quiet cafe")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    # Only the miss was routed, the second query was served from the cache
+    assert routed == ["A quiet  cafe"]
+
+
+def test_router_answers_a_cache_miss(monkeypatch):
+    async def route_query(search_phrase):
+        return False
+
+    async def invoke_keyword_generator(search_phrase, category=None):
+        raise AssertionError("The LLM must not be called")
+
+    monkeypatch.setattr(usecase, "route_query", route_query)
+    monkeypatch.setattr(usecase, "invoke_keyword_generator", invoke_keyword_generator)
+    monkeypatch.setattr(usecase.keyword_cache, "_entries", OrderedDict())
+
+    response = asyncio.run(usecase.generate_keyword("Blue Bottle Coffee"))
+    assert response == KeywordGeneratorResponse(
+        keyword="Blue Bottle Coffee", is_image_search=False
+    )
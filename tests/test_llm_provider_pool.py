@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pytest
+
+from app.model.llm_provider_pool import (
+    CircuitBreaker,
+    LLMProvider,
+    LLMProviderPool,
+    NoProviderAvailableError,
+)
+
+
+class FakeChain:
+    def __init__(self, answer, latency: float = 0.0, error: Exception | None = None):
+        self.answer = answer
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.answer
+
+
+def provider(name, chain, timeout_seconds=1.0, failure_threshold=5, reset_seconds=30):
+    return LLMProvider(
+        name,
+        chain,
+        timeout_seconds=timeout_seconds,
+        breaker=CircuitBreaker(failure_threshold, reset_seconds),
+    )
+
+
+def test_breaker_opens_after_consecutive_failures_and_resets():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.01)
+    breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.trips == 1
+
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only the trial call goes through
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_call_opens_the_circuit_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+
+
+def test_pool_fails_over_to_the_next_provider():
+    primary = FakeChain("primary", error=RuntimeError("down"))
+    secondary = FakeChain("secondary")
+    pool = LLMProviderPool(
+        [provider("test_failover_a", primary), provider("test_failover_b", secondary)],
+        hedge_enabled=False,
+    )
+
+    assert asyncio.run(pool.ainvoke({})) == "secondary"
+    assert (primary.calls, secondary.calls) == (1, 1)
+
+
+def test_pool_times_out_a_hung_provider():
+    primary = FakeChain("primary", latency=10)
+    secondary = FakeChain("secondary")
+    pool = LLMProviderPool(
+        [
+            provider("test_timeout_a", primary, timeout_seconds=0.05),
+            provider("test_timeout_b", secondary),
+        ],
+        hedge_enabled=False,
+    )
+
+    assert asyncio.run(pool.ainvoke({})) == "secondary"
+
+
+def test_pool_raises_the_last_error_after_max_attempts():
+    chain = FakeChain("answer", error=RuntimeError("down"))
+    pool = LLMProviderPool([provider("test_attempts", chain)], max_attempts=3)
+
+    with pytest.raises(RuntimeError, match="down"):
+        asyncio.run(pool.ainvoke({}))
+    assert chain.calls == 3
+
+
+def test_slow_call_is_hedged_and_the_loser_cancelled():
+    primary = FakeChain("primary", latency=1)
+    secondary = FakeChain("secondary")
+    pool = LLMProviderPool(
+        [provider("test_hedge_a", primary), provider("test_hedge_b", secondary)],
+        hedge_delay_seconds=0.02,
+        hedge_min_delay_seconds=0.01,
+    )
+
+    start_time = time.perf_counter()
+    assert asyncio.run(pool.ainvoke({})) == "secondary"
+    assert time.perf_counter() - start_time < 0.5
+    assert primary.cancelled == 1
+    # A cancelled call does not count against the circuit
+    assert pool.providers[0].breaker.failures == 0
+
+
+def test_hedge_delay_follows_the_latency_percentile():
+    hedged = provider("test_hedge_delay", FakeChain("answer"))
+    assert hedged.hedge_delay(95, default_seconds=1.5, min_seconds=0.2) == 1.5
+
+    hedged.latencies.extend([0.1] * 95 + [0.9] * 5)
+    assert hedged.hedge_delay(95, default_seconds=1.5, min_seconds=0.2) == 0.9
+    assert hedged.hedge_delay(50, default_seconds=1.5, min_seconds=0.2) == 0.2
+
+
+def test_open_circuits_skip_the_provider():
+    primary = FakeChain("primary", error=RuntimeError("down"))
+    secondary = FakeChain("secondary")
+    pool = LLMProviderPool(
+        [
+            provider("test_circuit_a", primary, failure_threshold=1),
+            provider("test_circuit_b", secondary),
+        ],
+        hedge_enabled=False,
+    )
+
+    asyncio.run(pool.ainvoke({}))
+    asyncio.run(pool.ainvoke({}))
+    assert primary.calls == 1
+    assert secondary.calls == 2
+
+
+def test_no_provider_available():
+    chain = FakeChain("answer", error=RuntimeError("down"))
+    pool = LLMProviderPool([provider("test_unavailable", chain, failure_threshold=1)])
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(pool.ainvoke({}))
+    with pytest.raises(NoProviderAvailableError):
+        asyncio.run(pool.ainvoke({}))
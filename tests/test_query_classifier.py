@@ -0,0 +1,46 @@
+import pytest
+
+from app.helper.query_classifier import classify_query, keyword_with_category
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["Jl. Senopati No. 12, Jakarta Selatan", "Jalan Kemang Raya 8"],
+)
+def test_addresses_are_place_names(query):
+    assert classify_query(query) == (False, 0.95)
+
+
+def test_title_cased_names_are_place_names():
+    is_image_search, confidence = classify_query("Kopi Kenangan Senopati")
+
+    assert is_image_search is False
+    assert confidence >= 0.8
+
+
+def test_descriptive_queries_are_image_searches():
+    is_image_search, confidence = classify_query("quiet cafe to work")
+
+    assert is_image_search is True
+    assert confidence >= 0.8
+
+
+def test_name_with_a_location_word_is_not_confident():
+    _, confidence = classify_query("cafe near Blok M")
+
+    assert confidence < 0.8
+
+
+def test_keyword_with_category():
+    assert keyword_with_category("quiet cafe", None) == "quiet cafe"
+    assert keyword_with_category("quiet cafe", "work_friendly") == "quiet cafe work friendly"
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["starbucks coffee", "kopi kenangan", "tanamera coffee", "fore coffee"],
+)
+def test_lowercase_names_are_not_confident(query):
+    _, confidence = classify_query(query)
+
+    assert confidence < 0.8
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from app.usecase import query_router_usecase as router
+
+
+def match(monkeypatch, query, titles):
+    async def encode_search_phrase(search_phrase):
+        return [0.0]
+
+    async def search(emb, limit, num_candidates, types):
+        return [{"content": f"title: {title}; address: Jakarta"} for title in titles]
+
+    monkeypatch.setattr(router, "encode_search_phrase", encode_search_phrase)
+    monkeypatch.setattr(router.vector_store, "search", search)
+    return asyncio.run(router.match_place_title(query))
+
+
+@pytest.mark.parametrize(
+    "query, title",
+    [("Starbucks", "Starbucks Senopati"), ("kopi kenangan", "Kopi Kenangan Senopati")],
+)
+def test_chain_names_match_their_branches(monkeypatch, query, title):
+    assert match(monkeypatch, query, [title]) >= 0.8
+
+
+@pytest.mark.parametrize(
+    "query, title",
+    [
+        ("sunset", "Sunset Bar & Kitchen Seminyak"),
+        ("senopati", "Kopi Kenangan Senopati"),
+        ("kopi", "Kopiko Coffee Shop"),
+    ],
+)
+def test_words_inside_titles_do_not_match(monkeypatch, query, title):
+    assert match(monkeypatch, query, [title]) < 0.8
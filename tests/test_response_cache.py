@@ -0,0 +1,78 @@
+import itertools
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.controller.places_controller import response_cache, response_etag
+from app.router import places_router
+from app.router.places_router import etag_matches
+
+
+@pytest.mark.parametrize(
+    "if_none_match, matches",
+    [
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"xyz", W/"abc"', True),
+        ("*", True),
+        ('"abcd"', False),
+        ('"xabc"', False),
+        ('"ab"', False),
+        ("", False),
+    ],
+)
+def test_etag_matches(if_none_match, matches):
+    assert etag_matches(if_none_match, '"abc"') is matches
+
+
+def test_etag_ignores_the_timing_fields():
+    response = {"data": [{"_id": "a"}], "meta": {"total_results": 1, "execution_time": 0.1}}
+    refreshed = {
+        "data": [{"_id": "a"}],
+        "meta": {"execution_time": 0.3, "total_results": 1, "timings": {"vector_search": 2}},
+    }
+    changed = {"data": [{"_id": "b"}], "meta": {"total_results": 1, "execution_time": 0.1}}
+
+    assert response_etag(response) == response_etag(refreshed)
+    assert response_etag(response) != response_etag(changed)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    execution_times = itertools.count()
+
+    async def get_places(params):
+        return {
+            "data": [{"_id": "a", "title": params.q}],
+            "meta": {"execution_time": next(execution_times), "total_results": 1},
+        }
+
+    monkeypatch.setattr(places_router.places_controller, "get_places", get_places)
+    response_cache.clear()
+    app = FastAPI()
+    app.include_router(places_router.router, prefix="/v1/places")
+    yield TestClient(app)
+    response_cache.clear()
+
+
+def test_refreshed_response_is_revalidated(client):
+    first = client.get("/v1/places", params={"q": "cafe"})
+    etag = first.headers["etag"]
+
+    # A refresh recomputes the response, with another execution time
+    response_cache.clear()
+    revalidated = client.get(
+        "/v1/places", params={"q": "cafe"}, headers={"If-None-Match": etag}
+    )
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert revalidated.headers["x-cache"] == "miss"
+
+
+def test_other_etag_gets_the_response(client):
+    response = client.get("/v1/places", params={"q": "cafe"}, headers={"If-None-Match": '"x"'})
+
+    assert response.status_code == 200
+    assert response.json()["data"] == [{"_id": "a", "title": "cafe"}]
@@ -0,0 +1,31 @@
+import asyncio
+
+from app.chain import search_text_chain
+from app.chain.search_text_chain import SearchTextChain
+from app.dto.search_dto import SearchParam
+from app.usecase.keyword_generator_usecase import KeywordGeneratorResponse
+
+
+def test_keyword_is_sent_before_the_vector_search(monkeypatch):
+    events = []
+
+    async def generate_keyword(q, category):
+        return KeywordGeneratorResponse(keyword="quiet cafe", is_image_search=False)
+
+    async def search_text_places(keyword, limit, query_vector=None):
+        events.append("vector_search")
+        return []
+
+    monkeypatch.setattr(search_text_chain, "SPECULATIVE_SEARCH_ENABLED", False)
+    monkeypatch.setattr(search_text_chain, "generate_keyword", generate_keyword)
+    monkeypatch.setattr(search_text_chain, "search_text_places", search_text_places)
+    dto = SearchParam(q="a quiet cafe", category=None, limit=5, profile="compact")
+
+    async def run():
+        async for stage, data in SearchTextChain().search_stages(dto):
+            events.append(stage)
+            if stage == "keyword":
+                assert data == {"keyword": "quiet cafe", "is_image_search": False}
+
+    asyncio.run(run())
+    assert events[:3] == ["keyword", "vector_search", "results"]
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import httpx
+from PIL import Image
+
+from seed.ingest import ingest_public_space as ingest
+
+
+def jpeg_bytes():
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_undecodable_images_are_skipped(monkeypatch):
+    monkeypatch.setattr(
+        ingest,
+        "generate_image_embeddings",
+        lambda images, batch_size: [[float(image.size[0])] for image in images],
+    )
+    good = jpeg_bytes()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        embeddings = ingest.encode_images(
+            executor, [good, good[:200], b"not an image", good], batch_size=32
+        )
+
+    assert embeddings == [[64.0], None, None, [64.0]]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.operations = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+
+def place(cid, image_url):
+    return {
+        "cid": cid,
+        "title": cid,
+        "description": "",
+        "address": "",
+        "thumbnail": None,
+        "images": [{"image": image_url}],
+        "user_reviews": [],
+    }
+
+
+def test_only_transient_download_errors_keep_a_place_unfinished(monkeypatch):
+    collection = FakeCollection()
+    monkeypatch.setattr(ingest, "embedding_collection", collection)
+    monkeypatch.setattr(ingest.embedding_store, "memory", OrderedDict())
+    monkeypatch.setattr(
+        ingest, "generate_text_embeddings", lambda texts, batch_size: [[0.0] for _ in texts]
+    )
+    monkeypatch.setattr(
+        ingest, "generate_image_embeddings", lambda images, batch_size: [[1.0] for _ in images]
+    )
+    request = httpx.Request("GET", "http://img/missing.jpg")
+    errors = {
+        "http://img/timeout.jpg": httpx.ConnectTimeout("timed out"),
+        "http://img/missing.jpg": httpx.HTTPStatusError(
+            "404", request=request, response=httpx.Response(404, request=request)
+        ),
+    }
+
+    def download_image(url):
+        if url in errors:
+            raise errors[url]
+        return jpeg_bytes()
+
+    monkeypatch.setattr(ingest, "download_image", download_image)
+    places = [
+        place("good", "http://img/good.jpg"),
+        place("timeout", "http://img/timeout.jpg"),
+        place("missing", "http://img/missing.jpg"),
+    ]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = ingest.download_images(executor, [p["images"][0]["image"] for p in places])
+        failed_places = ingest.process_batch(
+            places, {}, futures, executor, 64, 32, ingest.StageStats()
+        )
+
+    assert failed_places == {"timeout"}
+    images = [op._doc["content"] for op in collection.operations if op._doc["type"] == "image"]
+    assert images == ["http://img/good.jpg"]
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.usecase import get_embedding_places_usecase as usecase
+
+
+class FakeTokenizer:
+    def __init__(self):
+        self.threads = []
+
+    def encode(self, text, **kwargs):
+        self.threads.append(threading.get_ident())
+        return text.split()[:3]
+
+    def decode(self, tokens, **kwargs):
+        return " ".join(tokens)
+
+
+def test_search_phrase_is_tokenized_off_the_event_loop(monkeypatch):
+    tokenizer = FakeTokenizer()
+    monkeypatch.setattr(usecase, "get_clip_tokenizer", lambda: tokenizer)
+    monkeypatch.setattr(usecase.text_embedding_cache, "_entries", OrderedDict())
+
+    async def encode(text):
+        assert text == "quiet cafe to"
+        return np.ones(4, dtype=np.float16)
+
+    monkeypatch.setattr(usecase.text_encoder, "encode", encode)
+
+    async def run():
+        return threading.get_ident(), await usecase.encode_search_phrase(
+            "quiet cafe to work"
+        )
+
+    loop_thread, emb = asyncio.run(run())
+    assert emb.dtype == np.float32
+    assert tokenizer.threads and loop_thread not in tokenizer.threads
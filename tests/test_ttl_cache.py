@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+from app.cache.ttl_cache import MongoCacheStore, TTLCache
+
+
+def test_get_or_load_coalesces_concurrent_loads():
+    cache = TTLCache("test_coalesce", max_size=10, ttl_seconds=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_load("key", loader) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert calls == 1
+    assert cache.coalesced == 4
+    assert cache.get("key") == "value"
+
+
+def test_failed_load_is_not_cached():
+    cache = TTLCache("test_failure", max_size=10, ttl_seconds=60)
+
+    async def failing():
+        raise RuntimeError("down")
+
+    async def loader():
+        return "value"
+
+    async def run():
+        try:
+            await cache.get_or_load("key", failing)
+        except RuntimeError:
+            pass
+        return await cache.get_or_load("key", loader)
+
+    assert asyncio.run(run()) == "value"
+
+
+def test_lru_eviction():
+    cache = TTLCache("test_lru", max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_expired_entry_is_a_miss():
+    cache = TTLCache("test_expiry", max_size=10, ttl_seconds=0.01)
+    cache.set("key", "value")
+    time.sleep(0.02)
+
+    assert cache.state("key") == "expired"
+    assert cache.get("key") is None
+
+
+def test_stale_entry_is_served_while_reloaded():
+    cache = TTLCache("test_stale", max_size=10, ttl_seconds=60, stale_seconds=60)
+    cache.set("key", "old")
+    cache.expire_all()
+
+    async def loader():
+        return "new"
+
+    async def run():
+        stale = await cache.get_or_load("key", loader)
+        # Let the background reload finish
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return stale, cache.get("key")
+
+    assert asyncio.run(run()) == ("old", "new")
+    assert cache.stale_hits == 1
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+        self.indexes = []
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+
+    async def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        if doc is None or doc["expires_at"] <= query["expires_at"]["$gt"]:
+            return None
+        return doc
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = {"_id": query["_id"], **doc}
+
+
+def test_store_is_read_before_the_loader():
+    store = MongoCacheStore(FakeCollection())
+    first = TTLCache("test_store_first", max_size=10, ttl_seconds=60, store=store)
+    second = TTLCache("test_store_second", max_size=10, ttl_seconds=60, store=store)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return "value"
+
+    async def run():
+        await first.get_or_load("key", loader)
+        return await second.get_or_load("key", loader)
+
+    assert asyncio.run(run()) == "value"
+    assert calls == 1
+    assert second.store_hits == 1
+
+
+def test_store_creates_its_ttl_index_once():
+    collection = FakeCollection()
+    store = MongoCacheStore(collection)
+
+    async def run():
+        await store.save("key", "value", 60)
+        await store.load("key")
+
+    asyncio.run(run())
+    assert collection.indexes == [("expires_at", {"expireAfterSeconds": 0})]